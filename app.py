@@ -1,7 +1,9 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
+from flask_migrate import Migrate
 from utils import ApiHandler, BetterJSONEncoder
+import config
 
 
 app = Flask(__name__)
@@ -11,21 +13,57 @@ app.json_encoder = BetterJSONEncoder
 
 api = ApiHandler(app)
 db = SQLAlchemy(app)
+migrate = Migrate(app, db, render_as_batch=True)
 jwt = JWTManager(app)
 
 
-@app.before_first_request
-def create_tables():
-    db.create_all()
-
-
 @jwt.token_in_blocklist_loader
 def check_if_token_in_blacklist(jwt_header, jwt_data):
     jti = jwt_data['jti']
-    return models.RevokedToken.is_jti_blacklisted(jti)
+    return token_blocklist.revoked_token_cache.is_revoked(jti)
+
+
+import resources, models, token_blocklist, file_cleanup, search_index
+
+
+@app.before_first_request
+def start_file_deletion_worker():
+    if config.FILE_DELETION_WORKER:
+        file_cleanup.file_deletion_worker.start()
+
+
+@app.cli.command('drain-file-deletions')
+def drain_file_deletions():
+    deleted, failed = file_cleanup.drain_file_deletions()
+    print(f'File deletions: {deleted} deleted, {failed} failed.')
+
+
+@app.cli.command('prune-revoked-tokens')
+def prune_revoked_tokens():
+    token_lifetimes = (app.config['JWT_ACCESS_TOKEN_EXPIRES'], app.config['JWT_REFRESH_TOKEN_EXPIRES'])
+    max_token_age = max(token_lifetimes) if all(token_lifetimes) else None
+
+    before = models.RevokedToken.get_count()
+    removed = models.RevokedToken.prune_expired(max_token_age)
+    print(f'Revoked tokens: {before} before, {removed} removed, {before - removed} after.')
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    search_index.search_index.rebuild(db.session.connection())
+    db.session.commit()
+    print('Search index rebuilt.')
 
 
-import resources, models
+@app.cli.command('check-query-plans')
+def check_query_plans():
+    import query_plans
+    failures = query_plans.check_hot_queries()
+    for name, full_scans in failures.items():
+        print(f'{name}: {"; ".join(full_scans)}')
+    if failures:
+        raise SystemExit(1)
+    print(f'All {len(query_plans.HOT_QUERIES)} hot queries use an index.')
 
 
 api.add_resource(resources.HelloWorld,          '/hello') # GET
@@ -50,6 +88,7 @@ api.add_resource(resources.UserRecipeLikes,     '/users/<int:user_id>/recipes/li
 
 api.add_resource(resources.Recipes,             '/recipes') # GET PUT
 api.add_resource(resources.RecipeTagSuggestions,'/recipes/tagsuggestions') # GET PUT
+api.add_resource(resources.RecipeIngredientSuggestions,'/recipes/ingredientsuggestions') # GET
 api.add_resource(resources.RecipeData,          '/recipes/<int:recipe_id>') # GET PATCH DELETE
 api.add_resource(resources.RecipeSteps,         '/recipes/<int:recipe_id>/steps') # GET PATCH DELETE
 api.add_resource(resources.RecipeStepData,      '/recipes/<int:recipe_id>/steps/<int:step_num>') # GET PATCH DELETE
@@ -62,6 +101,7 @@ api.add_resource(resources.RecipeReviews,       '/recipes/<int:recipe_id>/review
 
 api.add_resource(resources.Search,              '/search') # GET
 api.add_resource(resources.Discover,            '/discover') # GET
+api.add_resource(resources.Timeline,            '/timeline') # GET
 
 
 if __name__ == "__main__":
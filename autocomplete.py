@@ -0,0 +1,99 @@
+import heapq
+import threading
+import typing
+from bisect import bisect_left
+from collections import Counter
+from sqlalchemy import event
+from app import db
+from models import RecipeIngredient
+from tag_stats import popular_tags
+from utils import DEFAULT_TAG_NAMES
+from worker_snapshot import WorkerSnapshot
+import config
+
+
+SUGGESTION_LIMIT = 10
+# Suggestions for prefixes up to this length are ranked ahead of time, since they match the most names
+RANKED_PREFIX_LENGTH = 2
+
+
+class PrefixIndex:
+    def __init__(self, usages: typing.Dict[str, int]) -> None:
+        self.names = sorted(usages)
+        self.usages = usages
+        self.ranked: typing.Dict[str, typing.List[str]] = {}
+        for name in sorted(usages, key=lambda name: (-usages[name], name)):
+            for length in range(1, min(len(name), RANKED_PREFIX_LENGTH) + 1):
+                ranked = self.ranked.setdefault(name[:length], [])
+                if len(ranked) < SUGGESTION_LIMIT:
+                    ranked.append(name)
+
+    def find(self, prefix: str, limit: int = SUGGESTION_LIMIT) -> typing.List[str]:
+        # Most used names first, then alphabetical
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        if len(prefix) <= RANKED_PREFIX_LENGTH and limit <= SUGGESTION_LIMIT:
+            return self.ranked.get(prefix, [])[:limit]
+
+        start = bisect_left(self.names, prefix)
+        end = bisect_left(self.names, prefix + '\U0010ffff', start)
+        return heapq.nsmallest(limit, self.names[start:end], key=lambda name: (-self.usages[name], name))
+
+
+def load_tag_usages() -> typing.Dict[str, int]:
+    usages = dict.fromkeys(DEFAULT_TAG_NAMES, 0)
+    usages.update(popular_tags.get())
+    return usages
+
+
+def load_ingredient_usages() -> typing.Dict[str, int]:
+    usages = Counter()
+    for name, usage_count in RecipeIngredient.get_name_counts():
+        usages[name.strip().lower()] += usage_count
+    usages.pop('', None)
+    return usages
+
+
+class TagSuggestions:
+    # Rebuilt whenever the popular tags snapshot is
+    def __init__(self) -> None:
+        self.tags = None
+        self.index: PrefixIndex = None
+        self.lock = threading.Lock()
+
+    def find(self, prefix: str) -> typing.List[str]:
+        tags = popular_tags.get()
+        if tags is not self.tags:
+            with self.lock:
+                if tags is not self.tags:
+                    self.index = PrefixIndex(load_tag_usages())
+                    self.tags = tags
+        return self.index.find(prefix)
+
+
+class IngredientSuggestions(WorkerSnapshot):
+    def __init__(self, refresh_seconds: float) -> None:
+        super().__init__(lambda: PrefixIndex(load_ingredient_usages()), refresh_seconds, 'ingredients_changed')
+
+    def find(self, prefix: str) -> typing.List[str]:
+        return self.get().find(prefix)
+
+
+tag_suggestions = TagSuggestions()
+# Other workers pick up new ingredients within INGREDIENT_SUGGESTIONS_REFRESH_SECONDS
+ingredient_suggestions = IngredientSuggestions(config.INGREDIENT_SUGGESTIONS_REFRESH_SECONDS)
+
+
+@event.listens_for(db.session, 'after_flush')
+def track_flushed_ingredients(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, RecipeIngredient):
+            session.info['ingredients_changed'] = True
+            return
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def track_bulk_ingredient_deletes(orm_execute_state):
+    if orm_execute_state.is_delete and orm_execute_state.bind_mapper and orm_execute_state.bind_mapper.class_ is RecipeIngredient:
+        orm_execute_state.session.info['ingredients_changed'] = True
@@ -13,4 +13,17 @@ JWT_SECRET_KEY: str = environ.get('JWT_SECRET_KEY')
 AWS_ACCESS_KEY_ID: str = environ.get('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY: str = environ.get('AWS_SECRET_ACCESS_KEY')
 AWS_BUCKET_NAME: str = environ.get('AWS_BUCKET_NAME')
+AWS_ENDPOINT_URL: str = environ.get('AWS_ENDPOINT_URL')
 PRODUCTION_MODE: bool = environ.get('PRODUCTION_MODE', False) == 'True'
+FILE_DELETION_WORKER: bool = environ.get('FILE_DELETION_WORKER', 'True') == 'True'
+FILE_DELETION_INTERVAL_SECONDS: float = float(environ.get('FILE_DELETION_INTERVAL_SECONDS', 10))
+REVOKED_TOKEN_REFRESH_SECONDS: float = float(environ.get('REVOKED_TOKEN_REFRESH_SECONDS', 30))
+FACET_INDEX_REFRESH_SECONDS: float = float(environ.get('FACET_INDEX_REFRESH_SECONDS', 60))
+USERNAME_INDEX_REFRESH_SECONDS: float = float(environ.get('USERNAME_INDEX_REFRESH_SECONDS', 60))
+DISCOVER_REFRESH_SECONDS: float = float(environ.get('DISCOVER_REFRESH_SECONDS', 60))
+TAG_STATS_REFRESH_SECONDS: float = float(environ.get('TAG_STATS_REFRESH_SECONDS', 60))
+INGREDIENT_SUGGESTIONS_REFRESH_SECONDS: float = float(environ.get('INGREDIENT_SUGGESTIONS_REFRESH_SECONDS', 60))
+TIMELINE_FANOUT_FOLLOWER_LIMIT: int = int(environ.get('TIMELINE_FANOUT_FOLLOWER_LIMIT', 10000))
+IMAGE_CACHE_MAX_AGE_SECONDS: int = int(environ.get('IMAGE_CACHE_MAX_AGE_SECONDS', 31536000))
+IMAGE_URL_MODE: str = environ.get('IMAGE_URL_MODE', 'proxy')
+IMAGE_URL_EXPIRES_SECONDS: int = int(environ.get('IMAGE_URL_EXPIRES_SECONDS', 900))
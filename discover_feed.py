@@ -0,0 +1,116 @@
+import json
+import random
+import typing
+from itertools import chain
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import DiscoverFeed, DiscoverSection, Recipe, RecipeTag, User, UserFollow
+from tag_stats import popular_tags
+from worker_snapshot import WorkerSnapshot
+import config
+
+
+TAG_COUNT = 20
+LATEST_SIZE = 5
+SECTION_SIZE = 10
+# Most tag and most follow sections shown at once, picked at random on every read
+SECTION_COUNT = 8
+DISCOVER_TABLES = {'recipes', 'recipe_tags'}
+
+
+def make_section(header: str, size: str, recipe_ids: typing.List[int]) -> dict:
+    return {'header': header, 'size': size, 'recipe_ids': recipe_ids}
+
+
+def load_shared_sections() -> typing.Tuple[dict, typing.List[dict]]:
+    # Sections shared by every user: the latest recipes and the popular tags
+    names = popular_tags.get_top(TAG_COUNT)
+    recipe_ids = RecipeTag.get_latest_public_ids_for_names(names, SECTION_SIZE)
+    tag_sections = [make_section(name.capitalize(), 'normal', recipe_ids[name]) for name in names]
+    return make_section('Latest', 'large', Recipe.get_latest_public_ids(LATEST_SIZE)), tag_sections
+
+
+# Other workers pick up new shared sections within DISCOVER_REFRESH_SECONDS
+discover_index = WorkerSnapshot(load_shared_sections, config.DISCOVER_REFRESH_SECONDS, 'discover_changed')
+
+
+def build_follow_sections(user_id: int) -> typing.List[dict]:
+    usernames = dict(UserFollow.get_followed_usernames(user_id))
+    if not usernames:
+        return []
+
+    recipe_ids = {}
+    for follow_id, recipe_id in Recipe.get_public_ids_for_user_ids(list(usernames)):
+        ids = recipe_ids.setdefault(follow_id, [])
+        if len(ids) < SECTION_SIZE:
+            ids.append(recipe_id)
+    return [make_section('Made by ' + usernames[follow_id], 'normal', ids) for follow_id, ids in recipe_ids.items()]
+
+
+def get_follow_sections(user_id: int) -> typing.List[dict]:
+    feed = DiscoverFeed.get_for_user_id(user_id)
+    if feed is not None and not feed.is_stale:
+        return json.loads(feed.sections)
+
+    sections = build_follow_sections(user_id)
+    try:
+        DiscoverFeed.save(user_id, json.dumps(sections))
+    except IntegrityError:
+        # Another request stored the same feed first
+        db.session.rollback()
+    return sections
+
+
+def get_discover(user_id: int, recipe_source) -> typing.List[DiscoverSection]:
+    latest, tag_sections = discover_index.get()
+    follow_sections = get_follow_sections(user_id)
+
+    sections = random.sample(tag_sections, min(len(tag_sections), SECTION_COUNT)) + \
+        random.sample(follow_sections, min(len(follow_sections), SECTION_COUNT))
+    random.shuffle(sections)
+    sections.insert(0, latest)
+
+    # Every recipe on the page is read at once; recipes made private since the sections were built are left out
+    recipe_ids = {recipe_id for section in sections for recipe_id in section['recipe_ids']}
+    recipes = {recipe.recipe_id: recipe for recipe in recipe_source.get_for_ids(recipe_ids, public_only=True)} if recipe_ids else {}
+
+    discovers = []
+    for section in sections:
+        section_recipes = [recipes[recipe_id] for recipe_id in section['recipe_ids'] if recipe_id in recipes]
+        if section_recipes or section is latest:
+            discovers.append(DiscoverSection(header=section['header'], size=section['size'], recipes=section_recipes))
+    return discovers
+
+
+def has_changed(instance, session, names: typing.Tuple[str, ...]) -> bool:
+    if instance not in session.dirty:
+        return True
+    state = inspect(instance)
+    return any(state.attrs[name].history.has_changes() for name in names)
+
+
+# Follow sections go stale in the same transaction as the writes they depend on
+@event.listens_for(db.session, 'after_flush')
+def mark_stale_feeds(session, flush_context):
+    user_ids, follow_ids = set(), set()
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, UserFollow):
+            user_ids.add(instance.user_id)
+        elif isinstance(instance, Recipe) and has_changed(instance, session, ('is_public',)):
+            follow_ids.add(instance.user_id)
+        elif isinstance(instance, User) and instance in session.dirty and has_changed(instance, session, ('username',)):
+            follow_ids.add(instance.user_id)
+        if getattr(instance, '__tablename__', None) in DISCOVER_TABLES:
+            session.info['discover_changed'] = True
+
+    if user_ids:
+        DiscoverFeed.mark_stale(session.connection(), user_ids)
+    if follow_ids:
+        DiscoverFeed.mark_stale_for_followers_of(session.connection(), follow_ids)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def track_bulk_recipe_deletes(orm_execute_state):
+    if orm_execute_state.is_delete and orm_execute_state.bind_mapper and orm_execute_state.bind_mapper.local_table.name in DISCOVER_TABLES:
+        orm_execute_state.session.info['discover_changed'] = True
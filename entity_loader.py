@@ -0,0 +1,37 @@
+import typing
+from flask import request
+from sqlalchemy.orm import lazyload
+from app import db
+
+
+ENVIRON_KEY = 'sharecipe.entity_loader'
+
+
+class EntityLoader:
+    # Rows looked up by primary key during one request, misses included,
+    # so stacked decorators never query for the same entity twice
+    def __init__(self) -> None:
+        self.entities: typing.Dict[tuple, typing.Any] = {}
+        self.existing: typing.Set[tuple] = set()
+
+    def get(self, model, ident):
+        key = (model, ident)
+        if key not in self.entities:
+            # Relationships load when first used, so existence checks stay one SELECT
+            self.entities[key] = db.session.get(model, ident, options=[lazyload('*')])
+        return self.entities[key]
+
+    def exists(self, model, ident) -> bool:
+        return (model, ident) in self.existing or self.get(model, ident) is not None
+
+    def mark_existing(self, model, ident):
+        # For rows proven to exist by a foreign key of another loaded row
+        self.existing.add((model, ident))
+
+
+def get_entity_loader() -> EntityLoader:
+    # Kept in the WSGI environ rather than g, since an app context can outlive a request
+    loader = request.environ.get(ENVIRON_KEY)
+    if loader is None:
+        loader = request.environ[ENVIRON_KEY] = EntityLoader()
+    return loader
@@ -0,0 +1,173 @@
+import typing
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from sqlalchemy import event
+from app import db
+from models import Recipe, RecipeIngredient, RecipeTag
+from pagination import InvalidCursor, PageRequest, decode_cursor, encode_cursor
+from worker_snapshot import WorkerSnapshot
+import config
+
+
+# Upper bounds (in seconds) of the total_time_needed facet counts
+TIME_BUCKETS = [900, 1800, 2700, 3600, 5400, 7200, 10800, 14400]
+# Number of tags and ingredients counted for every search, besides the selected ones
+FACET_COUNT_SIZE = 20
+FACET_TABLES = {'recipes', 'recipe_tags', 'recipe_ingredients'}
+
+
+@dataclass
+class FacetFilter:
+    tags: typing.List[str] = field(default_factory=list)
+    ingredients: typing.List[str] = field(default_factory=list)
+    exclude_ingredients: typing.List[str] = field(default_factory=list)
+    min_difficulty: int = None
+    max_difficulty: int = None
+    max_total_time_needed: int = None
+
+    def is_empty(self) -> bool:
+        return not (self.tags or self.ingredients or self.exclude_ingredients) and \
+            self.min_difficulty is None and self.max_difficulty is None and self.max_total_time_needed is None
+
+
+def to_bitmap(ids) -> int:
+    # Bit n is set when recipe n is in the set
+    if isinstance(ids, int):
+        return ids
+    if not len(ids):
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for id in ids:
+        bits[id >> 3] |= 1 << (id & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def count_bits(bitmap: int) -> int:
+    # int.bit_count needs Python 3.10
+    return bin(bitmap).count('1')
+
+
+def compact(ids: list, max_id: int):
+    # Dense sets are kept as bitmaps, sparse ones as sorted id arrays, whichever is smaller
+    if len(ids) * 32 >= max_id:
+        return to_bitmap(ids)
+    return array('L', sorted(ids))
+
+
+class FacetSnapshot:
+    def __init__(self, recipes: list, tags: list, ingredients: list) -> None:
+        self.max_id = max((recipe_id for recipe_id, _, _ in recipes), default=0)
+        self.public = to_bitmap([recipe_id for recipe_id, _, _ in recipes])
+        self.bitmaps: typing.Dict[tuple, int] = {}
+        self.tags, self.tag_sizes = self._group(tags)
+        self.ingredients, self.ingredient_sizes = self._group(ingredients)
+
+        difficulties = {}
+        for recipe_id, difficulty, _ in recipes:
+            if difficulty is not None:
+                difficulties.setdefault(difficulty, []).append(recipe_id)
+        self.difficulties = {difficulty: compact(ids, self.max_id) for difficulty, ids in difficulties.items()}
+
+        timed = sorted((total_time_needed, recipe_id) for recipe_id, _, total_time_needed in recipes if total_time_needed is not None)
+        self.times = [total_time_needed for total_time_needed, _ in timed]
+        self.time_ids = array('L', (recipe_id for _, recipe_id in timed))
+        self.time_buckets = {bound: self._within_time(bound) for bound in TIME_BUCKETS}
+
+    def _group(self, pairs: list):
+        groups = {}
+        for recipe_id, name in pairs:
+            groups.setdefault(name.strip(), set()).add(recipe_id)
+        facets = {name: compact(list(ids), self.max_id) for name, ids in groups.items()}
+        sizes = {name: len(ids) for name, ids in groups.items()}
+        return facets, sizes
+
+    def _bitmap(self, facets: dict, name) -> int:
+        # Posting lists are kept compact, and turned into a bitmap once per snapshot when first used
+        key = (id(facets), name)
+        bitmap = self.bitmaps.get(key)
+        if bitmap is None:
+            bitmap = self.bitmaps[key] = to_bitmap(facets.get(name, 0))
+        return bitmap
+
+    def _within_time(self, max_total_time_needed: int) -> int:
+        return to_bitmap(self.time_ids[:bisect_right(self.times, max_total_time_needed)])
+
+    def find(self, facet_filter: FacetFilter, recipe_ids: typing.Iterable[int] = None) -> int:
+        result = self.public
+        if recipe_ids is not None:
+            result &= to_bitmap(list(recipe_ids))
+        for name in facet_filter.tags:
+            result &= self._bitmap(self.tags, name)
+        for name in facet_filter.ingredients:
+            result &= self._bitmap(self.ingredients, name)
+        for name in facet_filter.exclude_ingredients:
+            result &= ~self._bitmap(self.ingredients, name)
+
+        if facet_filter.min_difficulty is not None or facet_filter.max_difficulty is not None:
+            low = facet_filter.min_difficulty if facet_filter.min_difficulty is not None else float('-inf')
+            high = facet_filter.max_difficulty if facet_filter.max_difficulty is not None else float('inf')
+            difficulties = 0
+            for difficulty in self.difficulties:
+                if low <= difficulty <= high:
+                    difficulties |= self._bitmap(self.difficulties, difficulty)
+            result &= difficulties
+
+        if facet_filter.max_total_time_needed is not None:
+            result &= self._within_time(facet_filter.max_total_time_needed)
+        return result
+
+    def count(self, result: int, facet_filter: FacetFilter) -> dict:
+        def count_names(facets: dict, sizes: dict, selected: list):
+            names = sorted(sizes, key=sizes.get, reverse=True)[:FACET_COUNT_SIZE]
+            names += [name for name in selected if name in facets and name not in names]
+            counts = {name: count_bits(result & self._bitmap(facets, name)) for name in names}
+            return {name: number for name, number in counts.items() if number or name in selected}
+
+        return {
+            'tags': count_names(self.tags, self.tag_sizes, facet_filter.tags),
+            'ingredients': count_names(self.ingredients, self.ingredient_sizes, facet_filter.ingredients + facet_filter.exclude_ingredients),
+            'difficulty': {difficulty: count_bits(result & self._bitmap(self.difficulties, difficulty)) for difficulty in sorted(self.difficulties)},
+            'total_time_needed': {bound: count_bits(result & bitmap) for bound, bitmap in self.time_buckets.items()},
+        }
+
+
+def page_recipe_ids(result: int, page: PageRequest) -> typing.Tuple[typing.List[int], str]:
+    # Newest (highest id) first; the cursor is the last id returned
+    if page.cursor:
+        try:
+            before, = decode_cursor(page.cursor)
+            result &= (1 << int(before)) - 1
+        except (TypeError, ValueError):
+            raise InvalidCursor(page.cursor)
+
+    recipe_ids = []
+    while result and len(recipe_ids) < page.limit:
+        recipe_id = result.bit_length() - 1
+        recipe_ids.append(recipe_id)
+        result ^= 1 << recipe_id
+    next_cursor = encode_cursor([recipe_ids[-1]]) if result else None
+    return recipe_ids, next_cursor
+
+
+def load_snapshot() -> FacetSnapshot:
+    return FacetSnapshot(Recipe.get_public_facet_values(), RecipeTag.get_public_names(), RecipeIngredient.get_public_names())
+
+
+facet_index = WorkerSnapshot(load_snapshot, config.FACET_INDEX_REFRESH_SECONDS, 'facets_changed')
+
+
+# Writes made by this worker show up on its next search; other workers pick
+# them up within FACET_INDEX_REFRESH_SECONDS
+@event.listens_for(db.session, 'after_flush')
+def track_flushed_recipes(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if getattr(instance, '__tablename__', None) in FACET_TABLES:
+            session.info['facets_changed'] = True
+            return
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def track_bulk_recipe_deletes(orm_execute_state):
+    if orm_execute_state.is_delete and orm_execute_state.bind_mapper and orm_execute_state.bind_mapper.local_table.name in FACET_TABLES:
+        orm_execute_state.session.info['facets_changed'] = True
@@ -0,0 +1,57 @@
+import threading
+import time
+from app import app, db
+from file_manager import file_manager
+from models import FileDeletion
+import config
+
+
+# Largest batch accepted by S3 DeleteObjects
+MAX_BATCH_SIZE = 1000
+
+
+def drain_file_deletions(batch_size: int = MAX_BATCH_SIZE):
+    deleted = 0
+    failed = 0
+    while True:
+        file_deletions = FileDeletion.get_due(batch_size)
+        if not file_deletions:
+            break
+
+        try:
+            errors = file_manager.delete_many([file_deletion.file_id for file_deletion in file_deletions])
+        except Exception as e:
+            errors = {file_deletion.file_id: str(e) for file_deletion in file_deletions}
+
+        FileDeletion.remove_for_ids([file_deletion.file_id for file_deletion in file_deletions if file_deletion.file_id not in errors])
+        for file_deletion in file_deletions:
+            if file_deletion.file_id in errors:
+                file_deletion.retry_later(errors[file_deletion.file_id])
+        db.session.commit()
+
+        deleted += len(file_deletions) - len(errors)
+        failed += len(errors)
+        if len(file_deletions) < batch_size:
+            break
+
+    return deleted, failed
+
+
+class FileDeletionWorker(threading.Thread):
+    def __init__(self, interval_seconds: float) -> None:
+        super().__init__(name='file-deletion-worker', daemon=True)
+        self.interval_seconds = interval_seconds
+
+    def run(self):
+        while True:
+            with app.app_context():
+                try:
+                    drain_file_deletions()
+                except Exception as e:
+                    app.logger.exception('Draining file deletions failed: %s', e)
+                finally:
+                    db.session.remove()
+            time.sleep(self.interval_seconds)
+
+
+file_deletion_worker = FileDeletionWorker(config.FILE_DELETION_INTERVAL_SECONDS)
@@ -1,12 +1,31 @@
 import os
 from os import path
 import re
+import time
+import typing
 import uuid
+from datetime import datetime, timezone
 import boto3
 import config
 
 
 SAVE_LOCATION = './downloads'
+# Presigned URLs are handed out again until this close to expiring
+PRESIGNED_URL_MIN_REMAINING_SECONDS = 60
+PRESIGNED_URL_CACHE_SIZE = 10000
+# 100ns intervals between the uuid epoch (1582-10-15) and the Unix epoch
+UUID_EPOCH_OFFSET = 0x01b21dd213814000
+
+
+def get_time_created(file_id: str) -> datetime:
+    # File ids are uuid1 values, which carry the time the file was saved
+    try:
+        file_uuid = uuid.UUID(file_id)
+    except ValueError:
+        return None
+    if file_uuid.version != 1:
+        return None
+    return datetime.fromtimestamp((file_uuid.time - UUID_EPOCH_OFFSET) / 1e7, timezone.utc)
 
 
 class S3FileManager:
@@ -16,7 +35,9 @@ class S3FileManager:
 
         session = boto3.Session(aws_access_key_id=config.AWS_ACCESS_KEY_ID,
                         aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY)
-        self.s3_resource = session.resource('s3')
+        self.s3_resource = session.resource('s3', endpoint_url=config.AWS_ENDPOINT_URL)
+        # file_id -> (url, expiry as time.time())
+        self.download_urls: typing.Dict[str, typing.Tuple[str, float]] = {}
 
     def get_local_path(self, file_id):
         return path.join(SAVE_LOCATION,  str(file_id))
@@ -38,14 +59,49 @@ class S3FileManager:
         self.s3_resource.Bucket(config.AWS_BUCKET_NAME).download_file(file_id, output)
         return output
 
+    def get_download_url(self, file_id) -> typing.Tuple[str, int]:
+        # Signing is cached per file id, so a popular image keeps one URL until it nears
+        # expiry, and any cache in front of the bucket sees the same URL
+        now = time.time()
+        cached = self.download_urls.get(file_id)
+        if cached and cached[1] - now > PRESIGNED_URL_MIN_REMAINING_SECONDS:
+            return cached[0], int(cached[1] - now)
+
+        expires_in = config.IMAGE_URL_EXPIRES_SECONDS
+        url = self.s3_resource.meta.client.generate_presigned_url('get_object', ExpiresIn=expires_in, Params={
+            'Bucket': config.AWS_BUCKET_NAME,
+            'Key': file_id,
+            'ResponseContentDisposition': f'attachment; filename={file_id}'
+        })
+        if len(self.download_urls) >= PRESIGNED_URL_CACHE_SIZE:
+            self.download_urls = {key: value for key, value in self.download_urls.items() if value[1] - now > PRESIGNED_URL_MIN_REMAINING_SECONDS}
+            if len(self.download_urls) >= PRESIGNED_URL_CACHE_SIZE:
+                self.download_urls = {}
+        self.download_urls[file_id] = (url, now + expires_in)
+        return url, expires_in
+
 
     def delete(self, file_id):
         cached = self.get_local_path(file_id)
         if path.isfile(cached):
             os.remove(cached)
+        self.download_urls.pop(file_id, None)
 
         self.s3_resource.Object(config.AWS_BUCKET_NAME, file_id).delete()
 
+    def delete_many(self, file_ids):
+        for file_id in file_ids:
+            cached = self.get_local_path(file_id)
+            if path.isfile(cached):
+                os.remove(cached)
+            self.download_urls.pop(file_id, None)
+
+        response = self.s3_resource.Bucket(config.AWS_BUCKET_NAME).delete_objects(Delete={
+            'Objects': [{'Key': file_id} for file_id in file_ids],
+            'Quiet': True
+        })
+        return {error['Key']: error.get('Message', error.get('Code')) for error in response.get('Errors', [])}
+
 
 class LocalFileManager:
     def __init__(self) -> None:
@@ -67,10 +123,19 @@ class LocalFileManager:
         output = self.get_local_path(file_id)
         return output
 
+    def get_download_url(self, file_id) -> typing.Tuple[str, int]:
+        # Local files can only be sent by the app itself
+        return None, None
+
     def delete(self, file_id):
         cached = self.get_local_path(file_id)
         if path.isfile(cached):
             os.remove(cached)
 
+    def delete_many(self, file_ids):
+        for file_id in file_ids:
+            self.delete(file_id)
+        return {}
+
 
 file_manager = S3FileManager() if config.PRODUCTION_MODE else LocalFileManager()
@@ -0,0 +1,57 @@
+from os import path
+from flask import jsonify, make_response, redirect, request, send_file
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from file_manager import PRESIGNED_URL_MIN_REMAINING_SECONDS, file_manager, get_time_created
+import config
+
+
+def set_cache_headers(response, file_id: str, immutable: bool):
+    # A file id is never reused for other bytes, so it is a strong ETag
+    response.set_etag(file_id)
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = config.IMAGE_CACHE_MAX_AGE_SECONDS
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def send_image_url(url: str, expires_in: int, immutable: bool):
+    # The client fetches the bytes from storage. It may reuse this answer while the URL
+    # is valid, unless the endpoint can start pointing at another file
+    if config.IMAGE_URL_MODE == 'json':
+        response = make_response(jsonify(url=url, expires_in=expires_in), 200)
+    else:
+        response = redirect(url)
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.max_age = max(expires_in - PRESIGNED_URL_MIN_REMAINING_SECONDS, 0)
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def send_image(file_id: str, immutable: bool = True):
+    # Only URLs naming the file id are immutable; the others are revalidated,
+    # since the image they point at can be replaced
+    if request.if_none_match.contains_weak(file_id):
+        # Answered before the file is fetched from storage
+        return set_cache_headers(make_response('', 304), file_id, immutable)
+
+    if config.IMAGE_URL_MODE in ('redirect', 'json'):
+        url, expires_in = file_manager.get_download_url(file_id)
+        if url:
+            return send_image_url(url, expires_in, immutable)
+
+    # Conditional, so If-Modified-Since and Range requests are answered too. Files are
+    # saved relative to the working directory, while send_file resolves against the app root
+    try:
+        response = send_file(path.abspath(file_manager.download(file_id)), as_attachment=True, download_name=file_id,
+            conditional=True, etag=file_id, last_modified=get_time_created(file_id))
+    except RequestedRangeNotSatisfiable as e:
+        # Raised by send_file, and the API error handler would turn it into a 500
+        return e.get_response()
+    response.accept_ranges = 'bytes'
+    return set_cache_headers(response, file_id, immutable)
@@ -1,7 +1,10 @@
-import typing
+import hashlib
 from flask import jsonify, make_response, request
 from flask_jwt_extended.utils import get_jwt_identity
-from models import Recipe, RecipeImage, RecipeLike, RecipeStep, User, UserFollow
+from models import FollowListUser, Recipe, RecipeImage, RecipeLike, RecipeStep, RecipeSummary, User, UserFollow, unit_of_work
+from pagination import DEFAULT_LIMIT, MAX_LIMIT, InvalidCursor, PageRequest
+from facet_index import FacetFilter
+from entity_loader import get_entity_loader
 
 
 def get_query_string(key: str, default=None):
@@ -13,6 +16,89 @@ def get_query_string(key: str, default=None):
     return decorator
 
 
+def get_page(func):
+    def wrapper(*args, **kwargs):
+        try:
+            limit = int(request.args.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return make_response(jsonify(message='limit must be a positive number.'), 400)
+
+        page = PageRequest(cursor=request.args.get('cursor'), limit=min(limit, MAX_LIMIT))
+        try:
+            return func(*args, page=page, **kwargs)
+        except InvalidCursor:
+            return make_response(jsonify(message='Invalid cursor.'), 400)
+    return wrapper
+
+
+def get_facet_filter(func):
+    def wrapper(*args, **kwargs):
+        def get_names(key: str):
+            return [name.strip().lower() for name in request.args.get(key, '').split(',') if name.strip()]
+
+        def get_number(key: str):
+            value = request.args.get(key)
+            return int(value) if value is not None else None
+
+        try:
+            facet_filter = FacetFilter(
+                tags=get_names('tags'),
+                ingredients=get_names('ingredients'),
+                exclude_ingredients=get_names('exclude_ingredients'),
+                min_difficulty=get_number('min_difficulty'),
+                max_difficulty=get_number('max_difficulty'),
+                max_total_time_needed=get_number('max_total_time_needed')
+            )
+        except ValueError:
+            return make_response(jsonify(message='Invalid search filter.'), 400)
+        return func(*args, facet_filter=facet_filter, **kwargs)
+    return wrapper
+
+
+def make_etag(version) -> str:
+    return hashlib.sha1(repr(version).encode()).hexdigest()
+
+
+def make_etag_response(body, version):
+    etag = make_etag(version)
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(jsonify(body), 200)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def check_etag(get_version, key: str):
+    # Answers 304 from a version lookup, before the entity is loaded or serialized
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            version = get_version(kwargs[key])
+            if version is None:
+                return func(*args, **kwargs)
+
+            etag = make_etag(version)
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = func(*args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def single_transaction(func):
+    def wrapper(*args, **kwargs):
+        with unit_of_work():
+            return func(*args, **kwargs)
+    return wrapper
+
+
 def get_account_user_id(func):
     def wrapper(*args, **kwargs):
         account_id: int = get_jwt_identity()
@@ -23,7 +109,7 @@ def get_account_user_id(func):
 def get_account_user(func):
     def wrapper(*args, **kwargs):
         account_id: int = get_jwt_identity()
-        user: User = User.get_by_id(account_id)
+        user: User = get_entity_loader().get(User, account_id)
         if not user:
             return make_response(jsonify(message='No such user.'), 404)
         return func(*args, user=user, **kwargs)
@@ -42,7 +128,9 @@ def validate_account_user(func):
 def validate_account_recipe(func):
     def wrapper(*args, **kwargs):
         account_user_id: int = get_jwt_identity()
-        if not Recipe.check_exist(kwargs['recipe_id'], account_user_id):
+        # Loads the whole row, so get_recipe and check_recipe_exists reuse it
+        recipe: Recipe = get_entity_loader().get(Recipe, kwargs['recipe_id'])
+        if not recipe or recipe.user_id != account_user_id:
             return make_response(jsonify(message='You can only modify your own recipe data!'), 403)
         return func(*args, **kwargs)
     return wrapper
@@ -50,7 +138,7 @@ def validate_account_recipe(func):
 
 def get_user(func):
     def wrapper(*args, **kwargs):
-        user: User = User.get_by_id(kwargs['user_id'])
+        user: User = get_entity_loader().get(User, kwargs['user_id'])
         if not user:
             return make_response(jsonify(message='No such user.'), 404)
         return func(*args, user=user, **kwargs)
@@ -59,7 +147,7 @@ def get_user(func):
 
 def check_user_exists(func):
     def wrapper(*args, **kwargs):
-        if not User.check_exist(kwargs['user_id']):
+        if not get_entity_loader().exists(User, kwargs['user_id']):
             return make_response(jsonify(message='No such user.'), 404)
         return func(*args, **kwargs)
     return wrapper
@@ -67,21 +155,31 @@ def check_user_exists(func):
 
 def get_user_follows(func):
     def wrapper(*args, **kwargs):
-        user_follows: typing.List[UserFollow] = UserFollow.get_for_user_id(kwargs['user_id'])
-        return func(*args, user_follows=user_follows, **kwargs)
+        account_user_id: int = get_jwt_identity()
+        user_follows, next_cursor = FollowListUser.get_page_for_follows(kwargs['user_id'], account_user_id, kwargs['page'])
+        # Only empty pages need to tell a missing user apart from one without follows
+        if not user_follows and not get_entity_loader().exists(User, kwargs['user_id']):
+            return make_response(jsonify(message='No such user.'), 404)
+        return func(*args, user_follows=user_follows, next_cursor=next_cursor, **kwargs)
     return wrapper
 
 
 def get_user_followers(func):
     def wrapper(*args, **kwargs):
-        user_followers: typing.List[UserFollow] = UserFollow.get_for_follow_id(kwargs['user_id'])
-        return func(*args, user_followers=user_followers, **kwargs)
+        account_user_id: int = get_jwt_identity()
+        user_followers, next_cursor = FollowListUser.get_page_for_followers(kwargs['user_id'], account_user_id, kwargs['page'])
+        if not user_followers and not get_entity_loader().exists(User, kwargs['user_id']):
+            return make_response(jsonify(message='No such user.'), 404)
+        return func(*args, user_followers=user_followers, next_cursor=next_cursor, **kwargs)
     return wrapper
 
 
 def get_user_follow(func):
     def wrapper(*args, **kwargs):
-        user_follow: UserFollow = UserFollow.get_by_id(kwargs['user_id'], kwargs['follow_id'])
+        loader = get_entity_loader()
+        user_follow: UserFollow = loader.get(UserFollow, (kwargs['user_id'], kwargs['follow_id']))
+        if user_follow:
+            loader.mark_existing(User, kwargs['user_id'])
         return func(*args, user_follow=user_follow, **kwargs)
     return wrapper
 
@@ -89,21 +187,24 @@ def get_user_follow(func):
 def get_user_recipes(func):
     def wrapper(*args, **kwargs):
         account_user_id: int = get_jwt_identity()
-        recipes: typing.List[dict] = Recipe.get_for_user_id(kwargs['user_id'], account_user_id != kwargs['user_id'])
-        return func(*args, recipes=recipes, **kwargs)
+        recipe_source = RecipeSummary if kwargs.get('view') == 'summary' else Recipe
+        recipes, next_cursor = recipe_source.get_page_for_user_id(kwargs['user_id'], account_user_id != kwargs['user_id'], kwargs['page'])
+        return func(*args, recipes=recipes, next_cursor=next_cursor, **kwargs)
     return wrapper
 
 
 def get_user_recipe_likes(func):
     def wrapper(*args, **kwargs):
-        likes: typing.List[RecipeLike] = RecipeLike.get_for_user_id(kwargs['user_id'])
-        return func(*args, likes=likes, **kwargs)
+        account_user_id: int = get_jwt_identity()
+        recipe_source = RecipeSummary if kwargs.get('view') == 'summary' else Recipe
+        recipes, next_cursor = recipe_source.get_page_liked_by(kwargs['user_id'], account_user_id, kwargs['page'])
+        return func(*args, recipes=recipes, next_cursor=next_cursor, **kwargs)
     return wrapper
 
 
 def get_recipe(func):
     def wrapper(*args, **kwargs):
-        recipe: Recipe = Recipe.get_by_id(kwargs['recipe_id'])
+        recipe: Recipe = get_entity_loader().get(Recipe, kwargs['recipe_id'])
         if not recipe:
             return make_response(jsonify(message='No such recipe found.'), 404)
         return func(*args, recipe=recipe, **kwargs)
@@ -112,7 +213,7 @@ def get_recipe(func):
 
 def check_recipe_exists(func):
     def wrapper(*args, **kwargs):
-        if not Recipe.check_exist(kwargs['recipe_id']):
+        if not get_entity_loader().exists(Recipe, kwargs['recipe_id']):
             return make_response(jsonify(message='No such recipe found.'), 404)
         return func(*args, **kwargs)
     return wrapper
@@ -127,7 +228,7 @@ def get_recipe_steps(func):
 
 def get_recipe_step(func):
     def wrapper(*args, **kwargs):
-        recipe_step: RecipeStep = RecipeStep.get_by_id(kwargs['recipe_id'], kwargs['step_num'])
+        recipe_step: RecipeStep = get_entity_loader().get(RecipeStep, (kwargs['recipe_id'], kwargs['step_num']))
         if not recipe_step:
             return make_response(jsonify(message='No such recipe step found.'), 404)
         return func(*args, recipe_step=recipe_step, **kwargs)
@@ -152,13 +253,18 @@ def get_recipe_image(func):
 
 def get_recipe_likes(func):
     def wrapper(*args, **kwargs):
-        likes: typing.List[RecipeLike] = RecipeLike.get_for_recipe_id(kwargs['recipe_id'])
-        return func(*args, likes=likes, **kwargs)
+        likes, next_cursor = RecipeLike.get_page_for_recipe_id(kwargs['recipe_id'], kwargs['page'])
+        return func(*args, likes=likes, next_cursor=next_cursor, **kwargs)
     return wrapper
 
 
 def get_recipe_like(func):
     def wrapper(*args, **kwargs):
-        like: RecipeLike = RecipeLike.get_by_id(kwargs['recipe_id'], kwargs['user_id'])
+        loader = get_entity_loader()
+        like: RecipeLike = loader.get(RecipeLike, (kwargs['recipe_id'], kwargs['user_id']))
+        # A like proves its recipe and user exist, sparing the checks decorated below
+        if like:
+            loader.mark_existing(Recipe, kwargs['recipe_id'])
+            loader.mark_existing(User, kwargs['user_id'])
         return func(*args, like=like, **kwargs)
     return wrapper
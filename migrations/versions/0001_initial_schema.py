@@ -0,0 +1,129 @@
+"""Initial schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 01:25:12.517210
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('revoked_tokens',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('jti', sa.String(length=120), nullable=False),
+    sa.Column('revoke_time', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('users',
+    sa.Column('time_created', sa.DateTime(), nullable=True),
+    sa.Column('time_modified', sa.DateTime(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=128), nullable=False),
+    sa.Column('password_hash', sa.String(length=128), nullable=False),
+    sa.Column('bio', sa.String(length=512), nullable=True),
+    sa.Column('profile_image_id', sa.String(length=256), nullable=True),
+    sa.PrimaryKeyConstraint('user_id'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('recipes',
+    sa.Column('time_created', sa.DateTime(), nullable=True),
+    sa.Column('time_modified', sa.DateTime(), nullable=True),
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=256), nullable=False),
+    sa.Column('description', sa.String(length=2048), nullable=True),
+    sa.Column('portion', sa.Integer(), nullable=True),
+    sa.Column('difficulty', sa.Integer(), nullable=True),
+    sa.Column('total_time_needed', sa.Integer(), nullable=True),
+    sa.Column('is_public', sa.Boolean(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('recipe_id')
+    )
+    op.create_table('user_follows',
+    sa.Column('time_created', sa.DateTime(), nullable=True),
+    sa.Column('time_modified', sa.DateTime(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('follow_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['follow_id'], ['users.user_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'follow_id')
+    )
+    op.create_table('recipe_images',
+    sa.Column('time_created', sa.DateTime(), nullable=True),
+    sa.Column('time_modified', sa.DateTime(), nullable=True),
+    sa.Column('file_id', sa.String(length=256), nullable=False),
+    sa.Column('recipe_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipes.recipe_id'], ),
+    sa.PrimaryKeyConstraint('file_id')
+    )
+    op.create_table('recipe_ingredients',
+    sa.Column('time_created', sa.DateTime(), nullable=True),
+    sa.Column('time_modified', sa.DateTime(), nullable=True),
+    sa.Column('ingredient_id', sa.Integer(), nullable=False),
+    sa.Column('recipe_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(length=256), nullable=False),
+    sa.Column('quantity', sa.Float(), nullable=True),
+    sa.Column('unit', sa.String(length=32), nullable=True),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipes.recipe_id'], ),
+    sa.PrimaryKeyConstraint('ingredient_id')
+    )
+    op.create_table('recipe_likes',
+    sa.Column('time_created', sa.DateTime(), nullable=True),
+    sa.Column('time_modified', sa.DateTime(), nullable=True),
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipes.recipe_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('recipe_id', 'user_id')
+    )
+    op.create_table('recipe_reviews',
+    sa.Column('time_created', sa.DateTime(), nullable=True),
+    sa.Column('time_modified', sa.DateTime(), nullable=True),
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('rating', sa.Integer(), nullable=False),
+    sa.Column('comment', sa.String(length=1024), nullable=True),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipes.recipe_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('recipe_id', 'user_id')
+    )
+    op.create_table('recipe_steps',
+    sa.Column('time_created', sa.DateTime(), nullable=True),
+    sa.Column('time_modified', sa.DateTime(), nullable=True),
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('step_number', sa.Integer(), nullable=False),
+    sa.Column('description', sa.String(length=1024), nullable=True),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipes.recipe_id'], ),
+    sa.PrimaryKeyConstraint('recipe_id', 'step_number')
+    )
+    op.create_table('recipe_tags',
+    sa.Column('time_created', sa.DateTime(), nullable=True),
+    sa.Column('time_modified', sa.DateTime(), nullable=True),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.Column('recipe_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(length=256), nullable=False),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipes.recipe_id'], ),
+    sa.PrimaryKeyConstraint('tag_id')
+    )
+
+
+def downgrade():
+    op.drop_table('recipe_tags')
+    op.drop_table('recipe_steps')
+    op.drop_table('recipe_reviews')
+    op.drop_table('recipe_likes')
+    op.drop_table('recipe_ingredients')
+    op.drop_table('recipe_images')
+    op.drop_table('user_follows')
+    op.drop_table('recipes')
+    op.drop_table('users')
+    op.drop_table('revoked_tokens')
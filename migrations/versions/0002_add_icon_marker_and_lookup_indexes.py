@@ -0,0 +1,95 @@
+"""Add icon marker and lookup indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 01:25:15.799574
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+recipe_images = sa.table('recipe_images',
+    sa.column('file_id', sa.String),
+    sa.column('recipe_id', sa.Integer),
+    sa.column('is_icon', sa.Boolean),
+    sa.column('time_created', sa.DateTime)
+)
+
+
+def upgrade():
+    with op.batch_alter_table('recipe_images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_icon', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.create_index('ix_recipe_images_recipe_id_is_icon', ['recipe_id', 'is_icon'], unique=False)
+
+    # The oldest image of every recipe used to be served as its icon
+    earlier = recipe_images.alias('earlier')
+    op.execute(
+        recipe_images.update()
+        .where(~sa.exists().where(sa.and_(
+            earlier.c.recipe_id == recipe_images.c.recipe_id,
+            sa.or_(
+                earlier.c.time_created < recipe_images.c.time_created,
+                sa.and_(earlier.c.time_created == recipe_images.c.time_created, earlier.c.file_id < recipe_images.c.file_id)
+            )
+        )))
+        .values(is_icon=sa.true())
+    )
+
+    with op.batch_alter_table('recipe_ingredients', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_recipe_ingredients_recipe_id'), ['recipe_id'], unique=False)
+
+    with op.batch_alter_table('recipe_likes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_recipe_likes_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('recipe_reviews', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_recipe_reviews_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('recipe_tags', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_recipe_tags_name'), ['name'], unique=False)
+        batch_op.create_index(batch_op.f('ix_recipe_tags_recipe_id'), ['recipe_id'], unique=False)
+
+    with op.batch_alter_table('recipes', schema=None) as batch_op:
+        batch_op.create_index('ix_recipes_user_id_is_public', ['user_id', 'is_public'], unique=False)
+
+    op.execute('DELETE FROM revoked_tokens WHERE id NOT IN (SELECT MIN(id) FROM revoked_tokens GROUP BY jti)')
+    with op.batch_alter_table('revoked_tokens', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_revoked_tokens_jti'), ['jti'], unique=True)
+
+    with op.batch_alter_table('user_follows', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_follows_follow_id'), ['follow_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_follows', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_follows_follow_id'))
+
+    with op.batch_alter_table('revoked_tokens', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_revoked_tokens_jti'))
+
+    with op.batch_alter_table('recipes', schema=None) as batch_op:
+        batch_op.drop_index('ix_recipes_user_id_is_public')
+
+    with op.batch_alter_table('recipe_tags', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_recipe_tags_recipe_id'))
+        batch_op.drop_index(batch_op.f('ix_recipe_tags_name'))
+
+    with op.batch_alter_table('recipe_reviews', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_recipe_reviews_user_id'))
+
+    with op.batch_alter_table('recipe_likes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_recipe_likes_user_id'))
+
+    with op.batch_alter_table('recipe_ingredients', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_recipe_ingredients_recipe_id'))
+
+    with op.batch_alter_table('recipe_images', schema=None) as batch_op:
+        batch_op.drop_index('ix_recipe_images_recipe_id_is_icon')
+        batch_op.drop_column('is_icon')
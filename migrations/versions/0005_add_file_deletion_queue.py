@@ -0,0 +1,36 @@
+"""Add file deletion queue
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 01:30:24.922259
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('file_deletions',
+    sa.Column('file_id', sa.String(length=256), nullable=False),
+    sa.Column('time_created', sa.DateTime(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.String(length=512), nullable=True),
+    sa.PrimaryKeyConstraint('file_id')
+    )
+    with op.batch_alter_table('file_deletions', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_file_deletions_next_attempt_at'), ['next_attempt_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('file_deletions', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_file_deletions_next_attempt_at'))
+
+    op.drop_table('file_deletions')
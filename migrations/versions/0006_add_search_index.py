@@ -0,0 +1,56 @@
+"""Add search index
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 02:10:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE TABLE search_recipes (recipe_id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)")
+        op.execute("CREATE INDEX ix_search_recipes_document ON search_recipes USING GIN (document)")
+        op.execute("CREATE TABLE search_users (user_id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)")
+        op.execute("CREATE INDEX ix_search_users_document ON search_users USING GIN (document)")
+        op.execute("""
+            INSERT INTO search_recipes (recipe_id, document)
+            SELECT recipes.recipe_id,
+                setweight(to_tsvector('simple', recipes.name), 'A') ||
+                setweight(to_tsvector('simple', coalesce((SELECT string_agg(recipe_tags.name, ' ') FROM recipe_tags WHERE recipe_tags.recipe_id = recipes.recipe_id), '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce((SELECT string_agg(recipe_ingredients.name, ' ') FROM recipe_ingredients WHERE recipe_ingredients.recipe_id = recipes.recipe_id), '')), 'C') ||
+                setweight(to_tsvector('simple', coalesce(recipes.description, '')), 'D')
+            FROM recipes""")
+        op.execute("""
+            INSERT INTO search_users (user_id, document)
+            SELECT users.user_id,
+                setweight(to_tsvector('simple', users.username), 'A') ||
+                setweight(to_tsvector('simple', coalesce(users.bio, '')), 'C')
+            FROM users""")
+    else:
+        op.execute("CREATE VIRTUAL TABLE search_recipes USING fts5(name, tags, ingredients, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')")
+        op.execute("CREATE VIRTUAL TABLE search_users USING fts5(username, bio, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')")
+        op.execute("""
+            INSERT INTO search_recipes (rowid, name, tags, ingredients, description)
+            SELECT recipes.recipe_id, recipes.name,
+                (SELECT group_concat(recipe_tags.name, ' ') FROM recipe_tags WHERE recipe_tags.recipe_id = recipes.recipe_id),
+                (SELECT group_concat(recipe_ingredients.name, ' ') FROM recipe_ingredients WHERE recipe_ingredients.recipe_id = recipes.recipe_id),
+                recipes.description
+            FROM recipes""")
+        op.execute("""
+            INSERT INTO search_users (rowid, username, bio)
+            SELECT users.user_id, users.username, users.bio FROM users""")
+
+
+def downgrade():
+    op.execute("DROP TABLE search_users")
+    op.execute("DROP TABLE search_recipes")
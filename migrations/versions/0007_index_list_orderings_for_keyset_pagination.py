@@ -0,0 +1,46 @@
+"""Index list orderings for keyset pagination
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 01:40:28.137863
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('recipe_likes', schema=None) as batch_op:
+        batch_op.drop_index('ix_recipe_likes_user_id')
+        batch_op.create_index('ix_recipe_likes_recipe_id_time_created', ['recipe_id', 'time_created', 'user_id'], unique=False)
+        batch_op.create_index('ix_recipe_likes_user_id_time_created', ['user_id', 'time_created', 'recipe_id'], unique=False)
+
+    with op.batch_alter_table('recipe_reviews', schema=None) as batch_op:
+        batch_op.create_index('ix_recipe_reviews_recipe_id_time_created', ['recipe_id', 'time_created', 'user_id'], unique=False)
+
+    with op.batch_alter_table('user_follows', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_follows_follow_id')
+        batch_op.create_index('ix_user_follows_follow_id_time_created', ['follow_id', 'time_created', 'user_id'], unique=False)
+        batch_op.create_index('ix_user_follows_user_id_time_created', ['user_id', 'time_created', 'follow_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_follows', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_follows_user_id_time_created')
+        batch_op.drop_index('ix_user_follows_follow_id_time_created')
+        batch_op.create_index('ix_user_follows_follow_id', ['follow_id'], unique=False)
+
+    with op.batch_alter_table('recipe_reviews', schema=None) as batch_op:
+        batch_op.drop_index('ix_recipe_reviews_recipe_id_time_created')
+
+    with op.batch_alter_table('recipe_likes', schema=None) as batch_op:
+        batch_op.drop_index('ix_recipe_likes_user_id_time_created')
+        batch_op.drop_index('ix_recipe_likes_recipe_id_time_created')
+        batch_op.create_index('ix_recipe_likes_user_id', ['user_id'], unique=False)
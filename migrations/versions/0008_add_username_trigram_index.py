@@ -0,0 +1,28 @@
+"""Add username trigram index
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 03:05:12.604417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite has no trigram index; usernames are matched in process there
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX search_users_username_trgm ON users USING GIN (lower(username) gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX search_users_username_trgm")
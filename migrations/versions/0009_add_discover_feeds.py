@@ -0,0 +1,30 @@
+"""Add discover feeds
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 03:41:27.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('discover_feeds',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('sections', sa.Text(), nullable=False),
+    sa.Column('is_stale', sa.Boolean(), nullable=False),
+    sa.Column('time_modified', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+def downgrade():
+    op.drop_table('discover_feeds')
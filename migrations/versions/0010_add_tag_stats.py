@@ -0,0 +1,45 @@
+"""Add tag stats
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 04:12:36.276099
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tag_stats = op.create_table('tag_stats',
+    sa.Column('name', sa.String(length=256), nullable=False),
+    sa.Column('usage_count', sa.Integer(), nullable=False),
+    sa.Column('time_last_used', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_index('ix_recipe_tags_lower_name', 'recipe_tags', [sa.text('lower(name)')], unique=False)
+
+    # Names are lowercased in Python, like the app does, since SQLite only lowercases ASCII
+    stats = {}
+    for name, time_created in op.get_bind().execute(sa.text('SELECT name, time_created FROM recipe_tags')):
+        time_created = time_created or datetime.now()
+        if isinstance(time_created, str):
+            time_created = datetime.fromisoformat(time_created)
+        usage_count, time_last_used = stats.get(name.lower(), (0, time_created))
+        stats[name.lower()] = (usage_count + 1, max(time_last_used, time_created))
+    op.bulk_insert(tag_stats, [
+        {'name': name, 'usage_count': usage_count, 'time_last_used': time_last_used}
+        for name, (usage_count, time_last_used) in stats.items()
+    ])
+
+
+def downgrade():
+    op.drop_index('ix_recipe_tags_lower_name', table_name='recipe_tags')
+    op.drop_table('tag_stats')
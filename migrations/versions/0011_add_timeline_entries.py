@@ -0,0 +1,56 @@
+"""Add timeline entries
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18 04:38:05.596252
+
+"""
+from os import environ
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+# Copies of config.TIMELINE_FANOUT_FOLLOWER_LIMIT's default and timeline.BACKFILL_SIZE
+FOLLOWER_LIMIT = 10000
+BACKFILL_SIZE = 20
+
+
+def upgrade():
+    op.create_table('timeline_entries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('time_created', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['users.user_id'], ),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipes.recipe_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'recipe_id')
+    )
+    with op.batch_alter_table('timeline_entries', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_timeline_entries_recipe_id'), ['recipe_id'], unique=False)
+
+    # Existing follows start with the newest public recipes of the followed users, as
+    # following does. Authors over the fan-out limit are merged into timelines when read
+    op.execute(sa.text("""
+        INSERT INTO timeline_entries (user_id, recipe_id, author_id, time_created)
+        SELECT user_follows.user_id, recipes.recipe_id, recipes.user_id, coalesce(recipes.time_created, CURRENT_TIMESTAMP)
+        FROM user_follows JOIN recipes ON recipes.user_id = user_follows.follow_id
+        WHERE user_follows.follow_id NOT IN (
+            SELECT follow_id FROM user_follows GROUP BY follow_id HAVING count(user_id) > :follower_limit)
+        AND recipes.recipe_id IN (
+            SELECT latest.recipe_id FROM recipes AS latest
+            WHERE latest.user_id = user_follows.follow_id AND latest.is_public
+            ORDER BY latest.recipe_id DESC LIMIT :backfill_size)""").bindparams(
+        follower_limit=int(environ.get('TIMELINE_FANOUT_FOLLOWER_LIMIT', FOLLOWER_LIMIT)), backfill_size=BACKFILL_SIZE))
+
+def downgrade():
+    with op.batch_alter_table('timeline_entries', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_timeline_entries_recipe_id'))
+
+    op.drop_table('timeline_entries')
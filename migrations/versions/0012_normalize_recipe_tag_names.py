@@ -0,0 +1,40 @@
+"""Normalize recipe tag names
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18 04:56:12.318804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('recipe_tags', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('normalized_name', sa.String(length=256), nullable=True))
+
+    # Names are lowercased in Python, like the app does, since SQLite only lowercases ASCII
+    connection = op.get_bind()
+    for tag_id, name in connection.execute(sa.text('SELECT tag_id, name FROM recipe_tags')).fetchall():
+        connection.execute(sa.text('UPDATE recipe_tags SET normalized_name = :normalized_name WHERE tag_id = :tag_id'),
+            {'normalized_name': name.lower(), 'tag_id': tag_id})
+
+    op.drop_index('ix_recipe_tags_lower_name', table_name='recipe_tags')
+    with op.batch_alter_table('recipe_tags', schema=None) as batch_op:
+        batch_op.alter_column('normalized_name', existing_type=sa.String(length=256), nullable=False)
+        batch_op.create_index('ix_recipe_tags_normalized_name_recipe_id', ['normalized_name', 'recipe_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('recipe_tags', schema=None) as batch_op:
+        batch_op.drop_index('ix_recipe_tags_normalized_name_recipe_id')
+        batch_op.drop_column('normalized_name')
+
+    op.create_index('ix_recipe_tags_lower_name', 'recipe_tags', [sa.text('lower(name)')], unique=False)
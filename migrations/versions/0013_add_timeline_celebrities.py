@@ -0,0 +1,37 @@
+"""Add timeline celebrities
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-18 05:14:27.904315
+
+"""
+from os import environ
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+# A copy of config.TIMELINE_FANOUT_FOLLOWER_LIMIT's default; 0011 left users over it out of timelines
+FOLLOWER_LIMIT = 10000
+
+
+def upgrade():
+    op.create_table('timeline_celebrities',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    op.execute(sa.text("""
+        INSERT INTO timeline_celebrities (user_id)
+        SELECT follow_id FROM user_follows GROUP BY follow_id HAVING count(user_id) > :follower_limit""").bindparams(
+        follower_limit=int(environ.get('TIMELINE_FANOUT_FOLLOWER_LIMIT', FOLLOWER_LIMIT))))
+
+
+def downgrade():
+    op.drop_table('timeline_celebrities')
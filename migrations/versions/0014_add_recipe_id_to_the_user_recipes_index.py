@@ -0,0 +1,28 @@
+"""Add recipe id to the user recipes index
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-18 05:31:52.117406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('recipes', schema=None) as batch_op:
+        batch_op.drop_index('ix_recipes_user_id_is_public')
+        batch_op.create_index('ix_recipes_user_id_is_public_recipe_id', ['user_id', 'is_public', 'recipe_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('recipes', schema=None) as batch_op:
+        batch_op.drop_index('ix_recipes_user_id_is_public_recipe_id')
+        batch_op.create_index('ix_recipes_user_id_is_public', ['user_id', 'is_public'], unique=False)
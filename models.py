@@ -1,12 +1,92 @@
-from datetime import date, datetime
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 import typing
 
+from sqlalchemy import and_, delete, func, insert, literal, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.sql.elements import Cast
 from app import db
 from passlib.hash import pbkdf2_sha256 as sha256
 from dataclasses import dataclass
-from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
-from file_manager import file_manager
+from sqlalchemy.ext.hybrid import hybrid_method
+from sqlalchemy.orm import aliased, selectinload, validates
+from search_index import search_index
+from pagination import PageRequest, paginate
+import config
+
+
+# SQLite answers a union of small LIMIT subqueries faster than ROW_NUMBER(), see
+# tests/bench_discover_tags.py; Postgres ranks with the window function
+WINDOW_FUNCTIONS = not config.SQLALCHEMY_DATABASE_URI.startswith('sqlite')
+
+
+def dialect_insert(connection, table):
+    # ON CONFLICT clauses read the same on SQLite and Postgres, but each dialect builds its own
+    if connection.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def commit_changes():
+    # Inside a unit of work everything is committed once, when it ends
+    if db.session.info.get('unit_of_work_depth'):
+        db.session.flush()
+    else:
+        db.session.commit()
+
+
+def sync_children(children: list, items: typing.List[dict], model, key: str, fields: typing.Tuple[str, ...]):
+    # Match the new items to existing rows on key, so only rows that really
+    # differ are inserted, updated or deleted
+    existing = {}
+    for child in children:
+        existing.setdefault(getattr(child, key), []).append(child)
+
+    did_change = False
+    for item in items:
+        values = {field: item.get(field) for field in fields}
+        matches = existing.get(values[key])
+        if matches:
+            did_change |= matches.pop(0).apply_changes(**values)
+        else:
+            child = model(**values)
+            child.time_created = child.time_modified = datetime.now()
+            children.append(child)
+            did_change = True
+
+    for child in [child for matches in existing.values() for child in matches]:
+        children.remove(child)
+        did_change = True
+    return did_change
+
+
+def get_versions(models, **filters) -> typing.Dict[str, tuple]:
+    # Row count and latest time_modified of each table, in one query; together they
+    # change whenever a row is added, edited or removed
+    statement = union_all(*[
+        select(literal(model.__tablename__), func.count(), func.max(model.time_modified))
+            .where(*[getattr(model, key) == value for key, value in filters.items()])
+        for model in models
+    ])
+    return {table: (count, time_modified) for table, count, time_modified in db.session.execute(statement)}
+
+
+@contextmanager
+def unit_of_work():
+    depth = db.session.info.get('unit_of_work_depth', 0)
+    db.session.info['unit_of_work_depth'] = depth + 1
+    try:
+        yield
+        if depth == 0:
+            db.session.commit()
+    except BaseException:
+        if depth == 0:
+            db.session.rollback()
+        raise
+    finally:
+        db.session.info['unit_of_work_depth'] = depth
+
 
 class EditableDb:
 
@@ -17,21 +97,25 @@ class EditableDb:
         self.time_created = datetime.now()
         self.time_modified = datetime.now()
         db.session.add(self)
-        db.session.commit()
+        commit_changes()
 
     def update(self, **kwargs):
+        if self.apply_changes(**kwargs):
+            commit_changes()
+
+    def apply_changes(self, **kwargs):
         did_change = False
         for attr, data in kwargs.items():
-            if hasattr(self, attr):
+            if hasattr(self, attr) and getattr(self, attr) != data:
                 setattr(self, attr, data)
                 did_change = True
         if did_change:
             self.time_modified = datetime.now()
-            db.session.commit()
+        return did_change
 
     def remove_from_db(self):
         db.session.delete(self)
-        db.session.commit()
+        commit_changes()
 
 
 @dataclass
@@ -55,30 +139,28 @@ class User(db.Model, EditableDb):
         return sha256.verify(password, self.password_hash)
 
     def remove_from_db(self):
-        # Remove recipe
-        for recipe in Recipe.get_for_user_id(self.user_id):
-            recipe.remove_from_db(commit=False)
-
-        # Remove follows
-        for follow in UserFollow.get_for_user_id(self.user_id):
-            db.session.delete(follow)
-
-        # Remove followers
-        for follower in UserFollow.get_for_follow_id(self.user_id):
-            db.session.delete(follower)
+        recipe_ids = db.session.query(Recipe.recipe_id).filter(Recipe.user_id == self.user_id)
+        file_ids = RecipeImage.get_file_ids_for_recipe_ids(recipe_ids)
+        if self.profile_image_id:
+            file_ids.append(self.profile_image_id)
 
-        # Remove reviews
-        for review in RecipeReview.get_for_user(self.user_id):
-            db.session.delete(review)
+        # Remove recipes, with their likes and reviews
+        Recipe.delete_for_ids(recipe_ids)
 
-        # Delete profile picture
-        if self.profile_image_id:
-            file_manager.delete(self.profile_image_id)
+        # Remove follows and followers
+        DiscoverFeed.mark_stale_for_followers_of(db.session.connection(), [self.user_id])
+        DiscoverFeed.query.filter_by(user_id=self.user_id).delete(synchronize_session=False)
+        TimelineEntry.query.filter_by(user_id=self.user_id).delete(synchronize_session=False)
+        TimelineCelebrity.query.filter_by(user_id=self.user_id).delete(synchronize_session=False)
+        UserFollow.query.filter((UserFollow.user_id == self.user_id) | (UserFollow.follow_id == self.user_id)).delete(synchronize_session=False)
 
-        db.session.commit()
+        # Remove likes and reviews on other recipes
+        RecipeLike.query.filter_by(user_id=self.user_id).delete(synchronize_session=False)
+        RecipeReview.query.filter_by(user_id=self.user_id).delete(synchronize_session=False)
 
+        FileDeletion.queue(file_ids)
         db.session.delete(self)
-        db.session.commit()
+        commit_changes()
 
     @classmethod
     def get_by_id(cls, user_id):
@@ -93,13 +175,40 @@ class User(db.Model, EditableDb):
         return cls.query.filter(cls.user_id.in_(user_ids)).all()
 
     @classmethod
-    def get_all_public(cls, name):
-        return cls.query.filter(cls.username.contains(name)).all()
+    def search(cls, search_string: str, page: PageRequest):
+        # Users are looked up as they are typed, so only the closest matches are returned
+        if not search_string.strip():
+            return cls.query.order_by(cls.user_id.desc()).limit(page.limit).all(), None
+
+        user_ids = search_index.find_usernames(search_string, page.limit)
+        if len(user_ids) < page.limit:
+            bio_user_ids, _ = search_index.search_users(search_string, PageRequest(limit=page.limit))
+            user_ids += [user_id for user_id in bio_user_ids or [] if user_id not in user_ids]
+        users = {user.user_id: user for user in cls.query.filter(cls.user_id.in_(user_ids[:page.limit])).all()}
+        return [users[user_id] for user_id in user_ids[:page.limit] if user_id in users], None
 
     @classmethod
     def check_exist(cls, user_id: int):
         return db.session.query(cls.query.filter_by(user_id=user_id).exists()).scalar()
 
+    @classmethod
+    def get_version(cls, user_id: int):
+        return db.session.query(cls.time_modified).filter_by(user_id=user_id).first()
+
+    @classmethod
+    def get_stats_counts(cls, user_id: int, public_only: bool = True):
+        # None for a missing user, otherwise every count of UserStats in one query
+        def count(model, *criteria):
+            return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+        recipe_criteria = [Recipe.user_id == user_id] + ([Recipe.is_public == True] if public_only else [])
+        return db.session.query(
+            count(UserFollow, UserFollow.user_id == user_id).label('follows'),
+            count(UserFollow, UserFollow.follow_id == user_id).label('followers'),
+            count(RecipeLike, RecipeLike.user_id == user_id).label('liked_recipes'),
+            count(Recipe, *recipe_criteria).label('recipes')
+        ).filter(cls.user_id == user_id).first()
+
     @staticmethod
     def hash_password(password):
         return sha256.hash(password)
@@ -115,6 +224,11 @@ class UserFollow(db.Model, EditableDb):
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key = True)
     follow_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key = True)
 
+    __table_args__ = (
+        db.Index('ix_user_follows_user_id_time_created', 'user_id', 'time_created', 'follow_id'),
+        db.Index('ix_user_follows_follow_id_time_created', 'follow_id', 'time_created', 'user_id'),
+    )
+
     @classmethod
     def get_for_user_id(cls, user_id: int):
         return cls.query.filter_by(user_id=user_id).all()
@@ -128,12 +242,16 @@ class UserFollow(db.Model, EditableDb):
         return cls.query.filter_by(user_id=user_id, follow_id=follow_id).first()
 
     @classmethod
-    def get_follows_count(cls, user_id: int) -> int:
-        return cls.query.filter_by(user_id=user_id).count()
+    def get_followed_usernames(cls, user_id: int):
+        return db.session.query(User.user_id, User.username) \
+            .join(cls, cls.follow_id == User.user_id) \
+            .filter(cls.user_id == user_id) \
+            .all()
 
     @classmethod
-    def get_follower_count(cls, follow_id: int) -> int:
-        return cls.query.filter_by(follow_id=follow_id).count()
+    def count_followers(cls, connection, follow_id: int) -> int:
+        # Runs inside flushes, so it takes the flushing connection
+        return connection.execute(select(func.count()).select_from(cls).where(cls.follow_id == follow_id)).scalar()
 
 
 @dataclass
@@ -168,43 +286,61 @@ class Recipe(db.Model, EditableDb):
     ingredients = db.relationship('RecipeIngredient', backref='recipe', lazy=True, cascade="save-update, merge, delete, delete-orphan")
     images = db.relationship('RecipeImage', backref='recipe', lazy=True, cascade="save-update, merge, delete, delete-orphan")
     tags = db.relationship('RecipeTag', backref='recipe', lazy=True, cascade="save-update, merge, delete, delete-orphan")
+    # Loaded with one SELECT ... IN for every recipe returned by a query
+    icon = db.relationship('RecipeImage', 
+        primaryjoin='and_(Recipe.recipe_id == RecipeImage.recipe_id, RecipeImage.is_icon == True)', 
+        uselist=False, viewonly=True, lazy='selectin')
+
+    __table_args__ = (
+        # recipe_id last, so keyset pages of a user's recipes are read in index order on Postgres too
+        db.Index('ix_recipes_user_id_is_public_recipe_id', 'user_id', 'is_public', 'recipe_id'),
+    )
+
+    def update(self, steps: list = None, ingredients: list = None, tags: list = None, **kwargs):
+        did_change = self.apply_changes(**kwargs)
+        children_changed = False
+        if steps is not None:
+            children_changed |= sync_children(self.steps, steps, RecipeStep, 'step_number', ('step_number', 'description'))
+        if ingredients is not None:
+            children_changed |= sync_children(self.ingredients, ingredients, RecipeIngredient, 'name', ('name', 'quantity', 'unit'))
+        if tags is not None:
+            children_changed |= sync_children(self.tags, tags, RecipeTag, 'name', ('name',))
+        if children_changed and not did_change:
+            self.time_modified = datetime.now()
+        if did_change or children_changed:
+            commit_changes()
 
-    @hybrid_property
-    def icon(self):
-        try:
-            return RecipeImage.get_icon(self.recipe_id)
-        except NameError:
-            # Class loading order is dumb
-            return None
-
-    def remove_from_db(self, commit=True):
-        # Remove likes
-        for like in RecipeLike.get_for_recipe_id(self.recipe_id):
-            db.session.delete(like)
-
-        # Remove reviews
-        for review in RecipeReview.get_for_recipe(self.recipe_id):
-            db.session.delete(review)
+    def remove_from_db(self):
+        FileDeletion.queue(RecipeImage.get_file_ids_for_recipe_ids([self.recipe_id]))
+        Recipe.delete_for_ids([self.recipe_id])
+        commit_changes()
 
-        # Delete images
-        for image in self.images:
-            file_manager.delete(image.file_id)
+    @staticmethod
+    def delete_for_ids(recipe_ids):
+        # recipe_ids may be a subquery over recipes, so delete the recipes last
+        search_index.remove_recipes(recipe_ids)
+        TagStat.count_usages(db.session, Counter(TagStat.normalize_name(name) for name, in db.session.query(RecipeTag.name).filter(RecipeTag.recipe_id.in_(recipe_ids))), -1)
+        for child in (RecipeLike, RecipeReview, RecipeStep, RecipeIngredient, RecipeImage, RecipeTag, TimelineEntry):
+            child.query.filter(child.recipe_id.in_(recipe_ids)).delete(synchronize_session=False)
+        Recipe.query.filter(Recipe.recipe_id.in_(recipe_ids)).delete(synchronize_session=False)
 
-        db.session.delete(self)
-        
-        if commit:
-            db.session.commit()
+    @classmethod
+    def query_for_list(cls):
+        # Lists of recipes are serialized with all their children, so load each
+        # relationship for the whole result set in one SELECT ... IN
+        return cls.query.options(
+            selectinload(cls.steps),
+            selectinload(cls.ingredients),
+            selectinload(cls.images),
+            selectinload(cls.tags)
+        )
 
     @classmethod
-    def get_for_user_id(cls, user_id: int, public_only: bool = True):
+    def get_page_for_user_id(cls, user_id: int, public_only: bool, page: PageRequest):
+        query = cls.query_for_list().filter_by(user_id=user_id)
         if public_only:
-            return cls.query.filter_by(user_id=user_id, is_public=True).all() 
-        else:
-            return cls.query.filter_by(user_id=user_id).all() 
-
-        #TODO dont load all data
-        # q = db.session.query(cls.recipe_id, cls.user_id, cls.name).filter_by(user_id=user_id)
-        # return [r._asdict() for r in q.all()]
+            query = query.filter_by(is_public=True)
+        return paginate(query, [cls.recipe_id], page)
 
     @classmethod
     def get_by_id(cls, recipe_id: int, user_id: int = None):
@@ -217,16 +353,45 @@ class Recipe(db.Model, EditableDb):
         return cls.query.filter(cls.name.startswith(name)).all()
 
     @classmethod
-    def get_all_public(cls, name, limit: int = 50):
-        return cls.query.filter(cls.name.contains(name) & cls.is_public == True).limit(limit).all()
+    def get_page_liked_by(cls, user_id: int, account_id: int, page: PageRequest):
+        query = cls.query_for_list().filter((cls.is_public == True) | (cls.user_id == account_id))
+        rows, next_cursor = RecipeLike.page_liked_by(query, user_id, page)
+        return [row.Recipe for row in rows], next_cursor
+
+    @classmethod
+    def get_for_ids(cls, recipe_ids: typing.Union[list, set], public_only: bool = False):
+        query = cls.query_for_list().filter(cls.recipe_id.in_(recipe_ids))
+        if public_only:
+            query = query.filter_by(is_public=True)
+        return query.all()
+
+    @classmethod
+    def get_public_id_page_for_user_ids(cls, user_ids: typing.List[int], page: PageRequest):
+        return paginate(db.session.query(cls.recipe_id).filter(cls.user_id.in_(user_ids), cls.is_public == True), [cls.recipe_id], page)
+
+    @classmethod
+    def get_latest_public_ids(cls, limit: int) -> typing.List[int]:
+        query = db.session.query(cls.recipe_id).filter(cls.is_public == True).order_by(cls.recipe_id.desc()).limit(limit)
+        return [recipe_id for recipe_id, in query]
+
+    @classmethod
+    def get_public_ids_for_user_ids(cls, user_ids: typing.Union[list, set]):
+        return db.session.query(cls.user_id, cls.recipe_id) \
+            .filter(cls.user_id.in_(user_ids), cls.is_public == True) \
+            .order_by(cls.recipe_id.desc()) \
+            .all()
 
-        #TODO dont load all data
-        # q = db.session.query(cls.recipe_id, cls.user_id, cls.name, cls.icon).filter(cls.name.contains(name) & cls.public == True)
-        # return [r._asdict() for r in q.all()]
+    @classmethod
+    def search(cls, search_string: str, page: PageRequest):
+        recipe_ids, next_cursor = search_index.search_recipes(search_string, page)
+        if recipe_ids is None:
+            return paginate(cls.query_for_list().filter_by(is_public=True), [cls.recipe_id], page)
+        recipes = {recipe.recipe_id: recipe for recipe in cls.get_for_ids(recipe_ids)}
+        return [recipes[recipe_id] for recipe_id in recipe_ids if recipe_id in recipes], next_cursor
 
     @classmethod
-    def get_for_ids(cls, recipe_ids: typing.Union[list, set]):
-        return cls.query.filter(cls.recipe_id.in_(recipe_ids)).all()
+    def get_public_facet_values(cls):
+        return db.session.query(cls.recipe_id, cls.difficulty, cls.total_time_needed).filter(cls.is_public == True).all()
 
     @classmethod
     def check_exist(cls, recipe_id: int, user_id: int = None):
@@ -235,10 +400,12 @@ class Recipe(db.Model, EditableDb):
         return db.session.query(cls.query.filter_by(recipe_id=recipe_id, user_id=user_id).exists()).scalar()
 
     @classmethod
-    def get_count_for_user(cls, user_id: int, public_only: bool = True) -> int:
-        if (public_only):
-            return cls.query.filter_by(user_id=user_id, is_public=True).count()
-        return cls.query.filter_by(user_id=user_id).count()
+    def get_version(cls, recipe_id: int):
+        # Children are edited and removed on their own, so each table counts
+        versions = get_versions((cls, RecipeStep, RecipeIngredient, RecipeImage, RecipeTag), recipe_id=recipe_id)
+        if not versions[cls.__tablename__][0]:
+            return None
+        return sorted(versions.items())
 
 
 @dataclass
@@ -259,6 +426,10 @@ class RecipeStep(db.Model, EditableDb):
     def get_for_recipe_id(cls, recipe_id: int):
         return cls.query.filter_by(recipe_id=recipe_id).all()
 
+    @classmethod
+    def get_version(cls, recipe_id: int):
+        return get_versions((cls,), recipe_id=recipe_id)[cls.__tablename__]
+
     @classmethod
     def get_by_id(cls, recipe_id: int, step_number: int):
         return cls.query.filter_by(recipe_id=recipe_id, step_number=step_number).first()
@@ -277,11 +448,23 @@ class RecipeIngredient(db.Model, EditableDb):
     time_modified: datetime
 
     ingredient_id = db.Column(db.Integer, primary_key = True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.recipe_id'))
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.recipe_id'), index = True)
     name = db.Column(db.String(256), nullable = False)
     quantity = db.Column(db.Float, nullable = True)
     unit = db.Column(db.String(32), nullable = True)
 
+    @classmethod
+    def get_name_counts(cls):
+        return db.session.query(cls.name, func.count(cls.ingredient_id)).group_by(cls.name).all()
+
+    @classmethod
+    def get_public_names(cls):
+        # Lowercased in Python like the facet filters, since SQLite's lower() only folds ASCII
+        rows = db.session.query(cls.recipe_id, cls.name) \
+            .join(Recipe, Recipe.recipe_id == cls.recipe_id) \
+            .filter(Recipe.is_public == True)
+        return [(recipe_id, name.lower()) for recipe_id, name in rows]
+
 
 @dataclass
 class RecipeImage(db.Model, EditableDb):
@@ -289,15 +472,29 @@ class RecipeImage(db.Model, EditableDb):
 
     file_id: str
     recipe_id: int
+    is_icon: bool
     time_created: datetime
     time_modified: datetime
 
     file_id = db.Column(db.String(256), primary_key = True)
     recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.recipe_id'))
+    is_icon = db.Column(db.Boolean, nullable = False, default = False)
+
+    __table_args__ = (
+        db.Index('ix_recipe_images_recipe_id_is_icon', 'recipe_id', 'is_icon'),
+    )
 
     @classmethod
     def get_icon(cls, recipe_id: int):
-        return cls.query.filter_by(recipe_id=recipe_id).first()
+        return cls.query.filter_by(recipe_id=recipe_id, is_icon=True).first()
+
+    @classmethod
+    def ensure_icon(cls, recipe_id: int):
+        if cls.get_icon(recipe_id):
+            return
+        first_image = cls.query.filter_by(recipe_id=recipe_id).order_by(cls.time_created, cls.file_id).first()
+        if first_image:
+            first_image.update(is_icon=True)
 
     @classmethod
     def get_for_recipe_id(cls, recipe_id: set):
@@ -307,11 +504,15 @@ class RecipeImage(db.Model, EditableDb):
     def get_for_ids(cls, file_ids: typing.Union[list, set]):
         return cls.query.filter(RecipeImage.file_id in file_ids).all()
 
+    @classmethod
+    def get_file_ids_for_recipe_ids(cls, recipe_ids) -> typing.List[str]:
+        return [file_id for file_id, in db.session.query(cls.file_id).filter(cls.recipe_id.in_(recipe_ids))]
+
     @classmethod
     def get_by_id(cls, recipe_id: int, file_id: str = None):
         if file_id:
             return cls.query.filter_by(file_id=file_id, recipe_id=recipe_id).first()
-        return cls.query.filter_by(recipe_id=recipe_id).first()
+        return cls.get_icon(recipe_id)
 
     @classmethod
     def check_exist(cls, file_id: str, recipe_id: int):
@@ -330,21 +531,33 @@ class RecipeLike(db.Model, EditableDb):
     recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.recipe_id'), primary_key = True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key = True)
 
+    __table_args__ = (
+        db.Index('ix_recipe_likes_recipe_id_time_created', 'recipe_id', 'time_created', 'user_id'),
+        db.Index('ix_recipe_likes_user_id_time_created', 'user_id', 'time_created', 'recipe_id'),
+    )
+
     @classmethod
     def get_for_recipe_id(cls, recipe_id: int):
         return cls.query.filter_by(recipe_id=recipe_id).all()
 
+    @classmethod
+    def get_page_for_recipe_id(cls, recipe_id: int, page: PageRequest):
+        return paginate(cls.query.filter_by(recipe_id=recipe_id), [cls.time_created, cls.user_id], page)
+
     @classmethod
     def get_for_user_id(cls, user_id: int):
         return cls.query.filter_by(user_id=user_id).all()
 
     @classmethod
-    def get_by_id(cls, recipe_id: int, user_id: int):
-        return cls.query.filter_by(recipe_id=recipe_id, user_id=user_id).first()
+    def page_liked_by(cls, query, user_id: int, page: PageRequest):
+        # Pages a query over recipes by when user_id liked them, newest first, in one join
+        liked_columns = [cls.time_created.label('liked_at'), cls.recipe_id.label('liked_recipe_id')]
+        query = query.join(cls, cls.recipe_id == Recipe.recipe_id).filter(cls.user_id == user_id).add_columns(*liked_columns)
+        return paginate(query, liked_columns, page)
 
     @classmethod
-    def get_count_for_user(cls, user_id: int) -> int:
-        return cls.query.filter_by(user_id=user_id).count()
+    def get_by_id(cls, recipe_id: int, user_id: int):
+        return cls.query.filter_by(recipe_id=recipe_id, user_id=user_id).first()
 
 
 @dataclass
@@ -356,17 +569,65 @@ class RecipeTag(db.Model, EditableDb):
     name: str
 
     tag_id = db.Column(db.Integer, primary_key = True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.recipe_id'))
-    name = db.Column(db.String(256), nullable = False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.recipe_id'), index = True)
+    name = db.Column(db.String(256), nullable = False, index = True)
+    # Lowercased in Python like TagStat names, since SQLite's lower() only folds ASCII
+    normalized_name = db.Column(db.String(256), nullable = False,
+        default = lambda context: TagStat.normalize_name(context.get_current_parameters()['name']))
 
-    @classmethod
-    def get_top_of(cls, limit: int = 50):
-        return cls.query.with_entities(cls.name).distinct(cls.name).limit(limit).all() 
+    __table_args__ = (
+        db.Index('ix_recipe_tags_normalized_name_recipe_id', 'normalized_name', 'recipe_id'),
+    )
+
+    @validates('name')
+    def validate_name(self, key, name):
+        self.normalized_name = TagStat.normalize_name(name) if name is not None else None
+        return name
 
     @classmethod
     def get_for_name(cls, name: str, limit: int = 10):
         return cls.query.filter_by(name=name).limit(limit).all()
 
+    @classmethod
+    def get_latest_public_ids_for_names(cls, names: typing.List[str], limit: int = 10) -> typing.Dict[str, typing.List[int]]:
+        # The newest public recipes of every tag, read in one query; names are matched normalized, like TagStat names
+        if not names:
+            return {}
+        if WINDOW_FUNCTIONS:
+            rank = func.row_number().over(partition_by=cls.normalized_name, order_by=cls.recipe_id.desc())
+            ranked = db.session.query(cls.normalized_name.label('name'), cls.recipe_id, rank.label('rank')) \
+                .join(Recipe, Recipe.recipe_id == cls.recipe_id) \
+                .filter(cls.normalized_name.in_(names), Recipe.is_public == True) \
+                .subquery()
+            query = db.session.query(ranked.c.name, ranked.c.recipe_id) \
+                .filter(ranked.c.rank <= limit) \
+                .order_by(ranked.c.name, ranked.c.recipe_id.desc())
+        else:
+            # One limited subquery per tag, each read newest first from the normalized name index
+            latest = [
+                db.session.query(cls.normalized_name.label('name'), cls.recipe_id)
+                    .join(Recipe, Recipe.recipe_id == cls.recipe_id)
+                    .filter(cls.normalized_name == name, Recipe.is_public == True)
+                    .order_by(cls.recipe_id.desc())
+                    .limit(limit)
+                    .subquery()
+                for name in names
+            ]
+            union = union_all(*(select(subquery.c.name, subquery.c.recipe_id) for subquery in latest)).subquery()
+            query = db.session.query(union.c.name, union.c.recipe_id).order_by(union.c.name, union.c.recipe_id.desc())
+
+        recipe_ids = {name: [] for name in names}
+        for name, recipe_id in query:
+            recipe_ids[name].append(recipe_id)
+        return recipe_ids
+
+    @classmethod
+    def get_public_names(cls):
+        return db.session.query(cls.recipe_id, cls.normalized_name) \
+            .join(Recipe, Recipe.recipe_id == cls.recipe_id) \
+            .filter(Recipe.is_public == True) \
+            .all()
+
 
 @dataclass
 class RecipeReview(db.Model, EditableDb):
@@ -378,14 +639,22 @@ class RecipeReview(db.Model, EditableDb):
     comment: str
 
     recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.recipe_id'), primary_key = True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key = True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key = True, index = True)
     rating = db.Column(db.Integer, nullable = False)
     comment = db.Column(db.String(1024), nullable = True)
 
+    __table_args__ = (
+        db.Index('ix_recipe_reviews_recipe_id_time_created', 'recipe_id', 'time_created', 'user_id'),
+    )
+
     @classmethod
     def get_for_recipe(cls, recipe_id: int):
         return cls.query.filter_by(recipe_id=recipe_id).all()
 
+    @classmethod
+    def get_page_for_recipe(cls, recipe_id: int, page: PageRequest):
+        return paginate(cls.query.filter_by(recipe_id=recipe_id), [cls.time_created, cls.user_id], page)
+
     @classmethod
     def get_for_user(cls, user_id: int):
         return cls.query.filter_by(user_id=user_id).all()
@@ -399,18 +668,352 @@ class RevokedToken(db.Model):
     __tablename__ = 'revoked_tokens'
 
     id = db.Column(db.Integer, primary_key = True)
-    jti = db.Column(db.String(120), nullable = False)
-    revoke_time = db.Column(db.DateTime(), nullable = False)
+    jti = db.Column(db.String(120), nullable = False, unique = True, index = True)
+    revoke_time = db.Column(db.DateTime(), nullable = False, index = True)
+    expires_at = db.Column(db.DateTime(), nullable = True, index = True)
 
     def add(self):
         self.revoke_time = datetime.now()
         db.session.add(self)
-        db.session.commit()
+        commit_changes()
     
     @classmethod
-    def is_jti_blacklisted(cls, jti):
-        query = cls.query.filter_by(jti = jti).first()
-        return bool(query)
+    def get_revoked_since(cls, since: datetime = None):
+        query = db.session.query(cls.jti, cls.revoke_time, cls.expires_at) \
+            .filter((cls.expires_at == None) | (cls.expires_at > datetime.now()))
+        if since:
+            query = query.filter(cls.revoke_time >= since)
+        return query.all()
+
+    @classmethod
+    def get_count(cls) -> int:
+        return cls.query.count()
+
+    @classmethod
+    def prune_expired(cls, max_token_age: timedelta = None) -> int:
+        now = datetime.now()
+        expired = cls.expires_at < now
+        if max_token_age:
+            # Tokens revoked before expiries were recorded
+            expired = expired | ((cls.expires_at == None) & (cls.revoke_time < now - max_token_age))
+
+        count = cls.query.filter(expired).delete(synchronize_session=False)
+        commit_changes()
+        return count
+
+
+class FileDeletion(db.Model):
+    __tablename__ = 'file_deletions'
+
+    file_id = db.Column(db.String(256), primary_key = True)
+    time_created = db.Column(db.DateTime(), nullable = False)
+    next_attempt_at = db.Column(db.DateTime(), nullable = False, index = True)
+    attempts = db.Column(db.Integer, nullable = False, default = 0)
+    last_error = db.Column(db.String(512), nullable = True)
+
+    @classmethod
+    def queue(cls, file_ids: typing.Iterable[str]):
+        # Staged in the caller's transaction, so files are only deleted once the rows referencing them are
+        file_ids = set(file_ids)
+        if not file_ids:
+            return
+
+        queued = {file_id for file_id, in db.session.query(cls.file_id).filter(cls.file_id.in_(file_ids))}
+        now = datetime.now()
+        db.session.bulk_insert_mappings(cls, [
+            {'file_id': file_id, 'time_created': now, 'next_attempt_at': now, 'attempts': 0}
+            for file_id in file_ids - queued
+        ])
+
+    @classmethod
+    def get_due(cls, limit: int):
+        return cls.query.filter(cls.next_attempt_at <= datetime.now()) \
+            .order_by(cls.next_attempt_at) \
+            .limit(limit) \
+            .with_for_update(skip_locked=True) \
+            .all()
+
+    @classmethod
+    def remove_for_ids(cls, file_ids: typing.Iterable[str]):
+        cls.query.filter(cls.file_id.in_(file_ids)).delete(synchronize_session=False)
+
+    def retry_later(self, error: str):
+        self.attempts += 1
+        self.last_error = error[:512]
+        self.next_attempt_at = datetime.now() + timedelta(seconds=min(2 ** self.attempts, 3600))
+
+
+class TagStat(db.Model):
+    # How many recipe tags use each name, kept up to date on every flush
+    __tablename__ = 'tag_stats'
+
+    name = db.Column(db.String(256), primary_key = True)
+    usage_count = db.Column(db.Integer, nullable = False)
+    time_last_used = db.Column(db.DateTime(), nullable = False)
+
+    @staticmethod
+    def normalize_name(name: str) -> str:
+        return name.lower()
+
+    @classmethod
+    def get_all(cls):
+        return db.session.query(cls.name, cls.usage_count).order_by(cls.usage_count.desc(), cls.name).all()
+
+    @classmethod
+    def count_usages(cls, session, usages: typing.Dict[str, int], sign: int = 1):
+        # Runs inside flushes, so it writes through the session's connection
+        usages = {name: count * sign for name, count in usages.items() if count}
+        if not usages:
+            return
+
+        # Added names are upserted, so transactions adding the same new name never collide
+        table = cls.__table__
+        connection = session.connection()
+        now = datetime.now()
+        added = [{'name': name, 'usage_count': count, 'time_last_used': now} for name, count in usages.items() if count > 0]
+        if added:
+            statement = dialect_insert(connection, table)
+            connection.execute(statement.on_conflict_do_update(index_elements=[table.c.name], set_={
+                'usage_count': table.c.usage_count + statement.excluded.usage_count,
+                'time_last_used': statement.excluded.time_last_used,
+            }), added)
+
+        # One statement per distinct removal, which is nearly always -1 for every name
+        changes = {}
+        for name, count in usages.items():
+            if count < 0:
+                changes.setdefault(count, []).append(name)
+        for count, names in changes.items():
+            connection.execute(update(table).where(table.c.name.in_(names)).values(usage_count=table.c.usage_count + count))
+        if changes:
+            connection.execute(delete(table).where(table.c.name.in_(list(usages)), table.c.usage_count <= 0))
+        session.info['tag_stats_changed'] = True
+
+
+class TimelineEntry(db.Model):
+    # A public recipe on the home timeline of one follower of its author, filled on write
+    __tablename__ = 'timeline_entries'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key = True)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.recipe_id'), primary_key = True, index = True)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable = False)
+    time_created = db.Column(db.DateTime(), nullable = False)
+
+    @classmethod
+    def get_page_for_user_id(cls, user_id: int, page: PageRequest):
+        return paginate(db.session.query(cls.recipe_id).filter(cls.user_id == user_id), [cls.recipe_id], page)
+
+    # The statements below run inside flushes, so they take the flushing connection
+    @classmethod
+    def fan_out(cls, connection, recipe_id: int, author_id: int):
+        followers = select(UserFollow.user_id, literal(recipe_id), literal(author_id), literal(datetime.now())) \
+            .where(UserFollow.follow_id == author_id)
+        connection.execute(insert(cls.__table__).from_select(['user_id', 'recipe_id', 'author_id', 'time_created'], followers))
+
+    @classmethod
+    def backfill(cls, connection, user_id: int, author_id: int, limit: int):
+        existing = select(cls.recipe_id).where(cls.user_id == user_id)
+        recipes = select(literal(user_id), Recipe.recipe_id, Recipe.user_id, literal(datetime.now())) \
+            .where(Recipe.user_id == author_id, Recipe.is_public == True, Recipe.recipe_id.not_in(existing)) \
+            .order_by(Recipe.recipe_id.desc()) \
+            .limit(limit)
+        connection.execute(insert(cls.__table__).from_select(['user_id', 'recipe_id', 'author_id', 'time_created'], recipes))
+
+    @classmethod
+    def backfill_followers(cls, connection, author_id: int, limit: int):
+        # The newest recipes of the author copied to all of their followers at once; entries
+        # already there are skipped, so running it again changes nothing
+        latest_ids = select(Recipe.recipe_id) \
+            .where(Recipe.user_id == author_id, Recipe.is_public == True) \
+            .order_by(Recipe.recipe_id.desc()) \
+            .limit(limit)
+        recipes = select(UserFollow.user_id, Recipe.recipe_id, Recipe.user_id, literal(datetime.now())) \
+            .join(Recipe, Recipe.user_id == UserFollow.follow_id) \
+            .where(UserFollow.follow_id == author_id, Recipe.recipe_id.in_(latest_ids))
+        statement = dialect_insert(connection, cls.__table__).from_select(['user_id', 'recipe_id', 'author_id', 'time_created'], recipes)
+        connection.execute(statement.on_conflict_do_nothing())
+
+    @classmethod
+    def remove_author(cls, connection, user_id: int, author_id: int):
+        connection.execute(delete(cls.__table__).where(cls.user_id == user_id, cls.author_id == author_id))
+
+    @classmethod
+    def remove_recipes(cls, connection, recipe_ids: typing.Iterable[int]):
+        connection.execute(delete(cls.__table__).where(cls.recipe_id.in_(list(recipe_ids))))
+
+
+class TimelineCelebrity(db.Model):
+    # A user with more than TIMELINE_FANOUT_FOLLOWER_LIMIT followers; their recipes are merged
+    # into timelines when read instead of being copied to every follower
+    __tablename__ = 'timeline_celebrities'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key = True)
+
+    @classmethod
+    def get_followed_ids(cls, user_id: int) -> typing.List[int]:
+        return [follow_id for follow_id, in db.session.query(UserFollow.follow_id)
+            .join(cls, cls.user_id == UserFollow.follow_id)
+            .filter(UserFollow.user_id == user_id)]
+
+    # The statements below run inside flushes, so they take the flushing connection
+    @classmethod
+    def get_ids_within(cls, connection, user_ids: typing.Iterable[int]) -> typing.Set[int]:
+        return {user_id for user_id, in connection.execute(select(cls.user_id).where(cls.user_id.in_(list(user_ids))))}
+
+    @classmethod
+    def add(cls, connection, user_id: int):
+        connection.execute(dialect_insert(connection, cls.__table__).values(user_id=user_id).on_conflict_do_nothing())
+
+    @classmethod
+    def remove(cls, connection, user_id: int) -> bool:
+        # Only the transaction that deleted the row sees it removed
+        return connection.execute(delete(cls.__table__).where(cls.user_id == user_id)).rowcount > 0
+
+
+class DiscoverFeed(db.Model):
+    # Discover sections of the users someone follows, rebuilt on the next read once stale
+    __tablename__ = 'discover_feeds'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key = True)
+    sections = db.Column(db.Text, nullable = False)
+    is_stale = db.Column(db.Boolean, nullable = False, default = False)
+    time_modified = db.Column(db.DateTime(), nullable = False)
+
+    @classmethod
+    def get_for_user_id(cls, user_id: int):
+        return cls.query.filter_by(user_id=user_id).first()
+
+    @classmethod
+    def save(cls, user_id: int, sections: str):
+        feed = cls.get_for_user_id(user_id) or cls(user_id=user_id)
+        feed.sections = sections
+        feed.is_stale = False
+        feed.time_modified = datetime.now()
+        db.session.add(feed)
+        commit_changes()
+
+    # Both run inside flushes, so they take the flushing connection
+    @classmethod
+    def mark_stale(cls, connection, user_ids: typing.Iterable[int]):
+        connection.execute(update(cls.__table__).where(cls.user_id.in_(list(user_ids))).values(is_stale=True))
+
+    @classmethod
+    def mark_stale_for_followers_of(cls, connection, follow_ids: typing.Iterable[int]):
+        followers = select(UserFollow.user_id).where(UserFollow.follow_id.in_(list(follow_ids)))
+        connection.execute(update(cls.__table__).where(cls.user_id.in_(followers)).values(is_stale=True))
+
+
+@dataclass
+class RecipeSummary:
+    # Card sized view of a recipe, read without loading the full Recipe rows
+    recipe_id: int
+    user_id: int
+    name: str
+    icon_id: str
+    difficulty: int
+    total_time_needed: int
+    like_count: int
+    time_created: datetime
+    time_modified: datetime
+
+    @classmethod
+    def _query(cls):
+        like_count = db.session.query(func.count(RecipeLike.user_id)) \
+            .filter(RecipeLike.recipe_id == Recipe.recipe_id) \
+            .correlate(Recipe) \
+            .scalar_subquery()
+
+        return db.session.query(
+            Recipe.recipe_id,
+            Recipe.user_id,
+            Recipe.name,
+            RecipeImage.file_id.label('icon_id'),
+            Recipe.difficulty,
+            Recipe.total_time_needed,
+            like_count.label('like_count'),
+            Recipe.time_created,
+            Recipe.time_modified
+        ).outerjoin(RecipeImage, and_(RecipeImage.recipe_id == Recipe.recipe_id, RecipeImage.is_icon == True))
+
+    @classmethod
+    def _from_rows(cls, rows) -> typing.List['RecipeSummary']:
+        return [cls(**{name: getattr(row, name) for name in cls.__dataclass_fields__}) for row in rows]
+
+    @classmethod
+    def get_page_for_user_id(cls, user_id: int, public_only: bool, page: PageRequest):
+        query = cls._query().filter(Recipe.user_id == user_id)
+        if public_only:
+            query = query.filter(Recipe.is_public == True)
+        rows, next_cursor = paginate(query, [Recipe.recipe_id], page)
+        return cls._from_rows(rows), next_cursor
+
+    @classmethod
+    def get_page_liked_by(cls, user_id: int, account_id: int, page: PageRequest):
+        query = cls._query().filter((Recipe.is_public == True) | (Recipe.user_id == account_id))
+        rows, next_cursor = RecipeLike.page_liked_by(query, user_id, page)
+        return cls._from_rows(rows), next_cursor
+
+    @classmethod
+    def get_for_ids(cls, recipe_ids: typing.Union[list, set], public_only: bool = False):
+        query = cls._query().filter(Recipe.recipe_id.in_(recipe_ids))
+        if public_only:
+            query = query.filter(Recipe.is_public == True)
+        return cls._from_rows(query.all())
+
+    @classmethod
+    def search(cls, search_string: str, page: PageRequest):
+        recipe_ids, next_cursor = search_index.search_recipes(search_string, page)
+        if recipe_ids is None:
+            rows, next_cursor = paginate(cls._query().filter(Recipe.is_public == True), [Recipe.recipe_id], page)
+            return cls._from_rows(rows), next_cursor
+        recipes = {recipe.recipe_id: recipe for recipe in cls.get_for_ids(recipe_ids)}
+        return [recipes[recipe_id] for recipe_id in recipe_ids if recipe_id in recipes], next_cursor
+
+
+@dataclass
+class FollowListUser:
+    # A user in a follows or followers list, with whether they and the viewing account follow each other
+    user_id: int
+    username: str
+    bio: str
+    profile_image_id: str
+    time_created: datetime
+    time_modified: datetime
+    is_mutual: bool
+
+    @classmethod
+    def _query(cls, account_id: int):
+        account_follows = aliased(UserFollow)
+        follows_account = aliased(UserFollow)
+        is_mutual = and_(
+            db.session.query(account_follows).filter(account_follows.user_id == account_id, account_follows.follow_id == User.user_id).exists(),
+            db.session.query(follows_account).filter(follows_account.user_id == User.user_id, follows_account.follow_id == account_id).exists()
+        )
+        return db.session.query(
+            User.user_id,
+            User.username,
+            User.bio,
+            User.profile_image_id,
+            User.time_created,
+            User.time_modified,
+            is_mutual.label('is_mutual')
+        )
+
+    @classmethod
+    def _page(cls, query, columns: list, page: PageRequest):
+        rows, next_cursor = paginate(query.add_columns(*columns), columns, page)
+        return [cls(**{name: getattr(row, name) for name in cls.__dataclass_fields__}) for row in rows], next_cursor
+
+    @classmethod
+    def get_page_for_follows(cls, user_id: int, account_id: int, page: PageRequest):
+        # Newest follow first, in one join over ix_user_follows_user_id_time_created
+        query = cls._query(account_id).join(UserFollow, UserFollow.follow_id == User.user_id).filter(UserFollow.user_id == user_id)
+        return cls._page(query, [UserFollow.time_created.label('followed_at'), UserFollow.follow_id.label('followed_user_id')], page)
+
+    @classmethod
+    def get_page_for_followers(cls, user_id: int, account_id: int, page: PageRequest):
+        query = cls._query(account_id).join(UserFollow, UserFollow.user_id == User.user_id).filter(UserFollow.follow_id == user_id)
+        return cls._page(query, [UserFollow.time_created.label('followed_at'), UserFollow.user_id.label('follower_user_id')], page)
 
 
 @dataclass
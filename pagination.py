@@ -0,0 +1,71 @@
+import base64
+import json
+import typing
+from dataclasses import dataclass
+from datetime import datetime
+from flask import jsonify, make_response
+from sqlalchemy import DateTime, tuple_
+
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 100
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class PageRequest:
+    cursor: str = None
+    limit: int = DEFAULT_LIMIT
+
+
+def encode_cursor(values) -> str:
+    data = json.dumps(values, default=lambda value: value.isoformat(), separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise InvalidCursor(cursor)
+
+
+def decode_keyset(cursor: str, columns: list) -> list:
+    values = decode_cursor(cursor)
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise InvalidCursor(cursor)
+
+    try:
+        return [
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) else column.type.python_type(value)
+            for column, value in zip(columns, values)
+        ]
+    except (TypeError, ValueError):
+        raise InvalidCursor(cursor)
+
+
+def split_page(rows: list, page: PageRequest, get_values: typing.Callable) -> typing.Tuple[list, str]:
+    # Pages are read with one extra row, which tells whether another page follows
+    if len(rows) <= page.limit:
+        return rows, None
+    rows = rows[:page.limit]
+    return rows, encode_cursor(get_values(rows[-1]))
+
+
+def paginate(query, columns: list, page: PageRequest) -> typing.Tuple[list, str]:
+    # Newest first; columns must end with a unique column and be covered by an index
+    if page.cursor:
+        query = query.filter(tuple_(*columns) < tuple(decode_keyset(page.cursor, columns)))
+    rows = query.order_by(*(column.desc() for column in columns)).limit(page.limit + 1).all()
+    return split_page(rows, page, lambda row: [getattr(row, column.key) for column in columns])
+
+
+def make_page_response(items, next_cursor: str):
+    response = make_response(jsonify(items), 200)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
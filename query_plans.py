@@ -0,0 +1,185 @@
+import re
+import typing
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.orm import Query
+from app import db
+from models import FollowListUser, Recipe, RecipeImage, RecipeIngredient, RecipeLike, RecipeReview, RecipeStep, RecipeTag, RevokedToken, TimelineCelebrity, TimelineEntry, User, UserFollow
+
+
+HOT_QUERIES: typing.Dict[str, typing.Callable[[], Query]] = {}
+
+
+def hot_query(name: str):
+    def decorator(func):
+        HOT_QUERIES[name] = func
+        return func
+    return decorator
+
+
+@hot_query('revoked tokens since')
+def revoked_tokens_since():
+    # What the revoked token cache reads on every refresh after the first
+    return db.session.query(RevokedToken.jti, RevokedToken.revoke_time, RevokedToken.expires_at) \
+        .filter((RevokedToken.expires_at == None) | (RevokedToken.expires_at > datetime(2021, 1, 1))) \
+        .filter(RevokedToken.revoke_time >= datetime(2021, 1, 1))
+
+
+@hot_query('expired revoked tokens')
+def expired_revoked_tokens():
+    return RevokedToken.query.filter(RevokedToken.expires_at < datetime(2021, 1, 1))
+
+
+@hot_query('user by username')
+def user_by_username():
+    return User.query.filter_by(username='username')
+
+
+@hot_query('user follows')
+def user_follows():
+    return FollowListUser._query(1).join(UserFollow, UserFollow.follow_id == User.user_id) \
+        .filter(UserFollow.user_id == 1) \
+        .order_by(UserFollow.time_created.desc(), UserFollow.follow_id.desc())
+
+
+@hot_query('user followers')
+def user_followers():
+    return FollowListUser._query(1).join(UserFollow, UserFollow.user_id == User.user_id) \
+        .filter(UserFollow.follow_id == 1) \
+        .order_by(UserFollow.time_created.desc(), UserFollow.user_id.desc())
+
+
+@hot_query('recipes of user')
+def recipes_of_user():
+    return Recipe.query.filter_by(user_id=1, is_public=True).order_by(Recipe.recipe_id.desc())
+
+
+@hot_query('recipe steps')
+def recipe_steps():
+    return RecipeStep.query.filter_by(recipe_id=1)
+
+
+@hot_query('recipe ingredients')
+def recipe_ingredients():
+    return RecipeIngredient.query.filter_by(recipe_id=1)
+
+
+@hot_query('recipe images')
+def recipe_images():
+    return RecipeImage.query.filter_by(recipe_id=1)
+
+
+@hot_query('recipe icon')
+def recipe_icon():
+    return RecipeImage.query.filter_by(recipe_id=1, is_icon=True)
+
+
+@hot_query('recipe tags')
+def recipe_tags():
+    return RecipeTag.query.filter_by(recipe_id=1)
+
+
+@hot_query('recipe tags by name')
+def recipe_tags_by_name():
+    return RecipeTag.query.filter_by(name='rice')
+
+
+@hot_query('recipe tags by normalized name')
+def recipe_tags_by_normalized_name():
+    return RecipeTag.query.filter(RecipeTag.normalized_name == 'rice')
+
+
+@hot_query('recipe likes')
+def recipe_likes():
+    return RecipeLike.query.filter_by(recipe_id=1).order_by(RecipeLike.time_created.desc(), RecipeLike.user_id.desc())
+
+
+@hot_query('user likes')
+def user_likes():
+    return RecipeLike.query.filter_by(user_id=1).order_by(RecipeLike.time_created.desc(), RecipeLike.recipe_id.desc())
+
+
+@hot_query('liked recipes')
+def liked_recipes():
+    liked_at, liked_recipe_id = RecipeLike.time_created.label('liked_at'), RecipeLike.recipe_id.label('liked_recipe_id')
+    return Recipe.query.join(RecipeLike, RecipeLike.recipe_id == Recipe.recipe_id) \
+        .filter(RecipeLike.user_id == 1, (Recipe.is_public == True) | (Recipe.user_id == 1)) \
+        .add_columns(liked_at, liked_recipe_id) \
+        .order_by(liked_at.desc(), liked_recipe_id.desc())
+
+
+@hot_query('recipe reviews')
+def recipe_reviews():
+    return RecipeReview.query.filter_by(recipe_id=1).order_by(RecipeReview.time_created.desc(), RecipeReview.user_id.desc())
+
+
+@hot_query('user reviews')
+def user_reviews():
+    return RecipeReview.query.filter_by(user_id=1)
+
+
+@hot_query('timeline')
+def timeline():
+    return TimelineEntry.query.filter_by(user_id=1).order_by(TimelineEntry.recipe_id.desc())
+
+
+@hot_query('timeline entries of recipe')
+def timeline_entries_of_recipe():
+    return TimelineEntry.query.filter_by(recipe_id=1)
+
+
+@hot_query('timeline entries of author')
+def timeline_entries_of_author():
+    return TimelineEntry.query.filter_by(user_id=1, author_id=2)
+
+
+@hot_query('followed celebrities')
+def followed_celebrities():
+    return db.session.query(UserFollow.follow_id).join(TimelineCelebrity, TimelineCelebrity.user_id == UserFollow.follow_id).filter(UserFollow.user_id == 1)
+
+
+@hot_query('follower count')
+def follower_count():
+    return db.session.query(func.count()).select_from(UserFollow).filter(UserFollow.follow_id == 1)
+
+
+def explain(query: Query) -> typing.List[str]:
+    dialect = db.engine.dialect
+    statement = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+    if dialect.name == 'sqlite':
+        return [row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {statement}'))]
+
+    if dialect.name == 'postgresql':
+        # Small tables are cheaper to scan, so ask whether an index could be used at all
+        db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+        try:
+            return [row[0] for row in db.session.execute(db.text(f'EXPLAIN {statement}'))]
+        finally:
+            db.session.rollback()
+
+    raise NotImplementedError(f'Query plans are not supported for {dialect.name}.')
+
+
+def find_full_scans(query: Query) -> typing.List[str]:
+    tables = set(db.metadata.tables)
+    full_scans = []
+    for line in explain(query):
+        match = re.match(r'\s*(?:->\s*)?(?:SCAN (?:TABLE )?(\w+)|Seq Scan on (\w+))', line)
+        if match and (match.group(1) or match.group(2)) in tables:
+            full_scans.append(line.strip())
+    return full_scans
+
+
+def find_sorts(query: Query) -> typing.List[str]:
+    # Paged lists must be read in index order, or every page sorts all matching rows
+    return [line.strip() for line in explain(query) if re.match(r'\s*(?:->\s*)?(?:USE TEMP B-TREE FOR ORDER BY|Sort\b)', line)]
+
+
+def check_hot_queries() -> typing.Dict[str, typing.List[str]]:
+    failures = {}
+    for name, build_query in HOT_QUERIES.items():
+        problems = find_full_scans(build_query()) + find_sorts(build_query())
+        if problems:
+            failures[name] = problems
+    return failures
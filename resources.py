@@ -1,15 +1,23 @@
 import re
 import typing
 import zipfile
-import random
 from flask import json, jsonify, make_response, send_file
 from flask.json import tag
 from flask_restful import Resource, request
 from flask_jwt_extended import jwt_required, create_access_token, create_refresh_token, get_jwt
-from models import DiscoverSection, RecipeImage, RecipeIngredient, RecipeLike, RecipeStep, RecipeTag, Stats, User, UserFollow, Recipe, RecipeReview, RevokedToken
+from models import FileDeletion, FollowListUser, RecipeImage, RecipeIngredient, RecipeLike, RecipeStep, RecipeSummary, RecipeTag, Stats, User, UserFollow, Recipe, RecipeReview
 from utils import JsonParser, obj_to_dict, sanitize_image_with_pillow, DEFAULT_TAG_NAMES
 from file_manager import file_manager
-from middleware import check_recipe_exists, check_user_exists, get_account_user, get_account_user_id, get_query_string, get_recipe, get_recipe_image, get_recipe_images, get_recipe_like, get_recipe_likes, get_recipe_step, get_recipe_steps, get_user, get_user_follow, get_user_followers, get_user_recipes, validate_account_recipe, validate_account_user, get_user_follows, get_user_recipe_likes
+from image_responses import send_image
+from token_blocklist import revoked_token_cache
+from search_index import search_index
+from facet_index import FacetFilter, facet_index, page_recipe_ids
+from discover_feed import get_discover
+from tag_stats import popular_tags
+from autocomplete import ingredient_suggestions, tag_suggestions
+from timeline import get_timeline_page
+from pagination import NEXT_CURSOR_HEADER, InvalidCursor, PageRequest, decode_cursor, encode_cursor, make_page_response
+from middleware import check_etag, check_recipe_exists, check_user_exists, get_account_user, get_account_user_id, get_query_string, get_recipe, get_recipe_image, get_recipe_images, get_recipe_like, get_recipe_likes, get_recipe_step, get_recipe_steps, get_user, get_user_follow, get_user_followers, get_user_recipes, validate_account_recipe, validate_account_user, get_user_follows, get_user_recipe_likes, single_transaction, get_page, get_facet_filter, make_etag_response
 import config
 
 
@@ -146,10 +154,8 @@ class AccountPassword(Resource):
 class AccountLogout(Resource):
     @jwt_required(refresh=True)
     def post(self):
-        jti = get_jwt()['jti']
         try:
-            revoked_token = RevokedToken(jti = jti)
-            revoked_token.add()
+            revoked_token_cache.revoke(get_jwt())
             return make_response(jsonify(message='Access token has been revoked.'), 200)
         except:
             return make_response(jsonify(message='Something went wrong.'), 500)
@@ -159,6 +165,7 @@ class AccountDelete(Resource):
     @jwt_required(refresh=True)
     @get_account_user
     @account_delete_parser.parse()
+    @single_transaction
     def delete(self, user: User, parsed_data: dict):
         if parsed_data.get('user_id') != user.user_id:
             return make_response('Invalid account user.', 400)
@@ -166,9 +173,7 @@ class AccountDelete(Resource):
         if not user.verify_password(parsed_data.get('password', '')):
             return make_response('Incorrect password.', 400)
 
-        jti = get_jwt()['jti']
-        revoked_token = RevokedToken(jti = jti)
-        revoked_token.add()
+        revoked_token_cache.revoke(get_jwt())
 
         user.remove_from_db()
         return make_response('', 204)
@@ -184,6 +189,7 @@ class Users(Resource):
 
 class UserData(Resource):
     @jwt_required()
+    @check_etag(User.get_version, 'user_id')
     @get_user
     def get(self, user_id: int, user: User):
         return make_response(jsonify(user), 200)
@@ -202,15 +208,19 @@ class UserData(Resource):
 
 class UserStats(Resource):
     @jwt_required()
-    @check_user_exists
     @get_account_user_id
     def get(self, user_id: int, account_id: int):
+        counts = User.get_stats_counts(user_id, user_id != account_id)
+        if counts is None:
+            return make_response(jsonify(message='No such user.'), 404)
+
         stats = []
-        stats.append(Stats(name="Follows", stats_type="follow", number=UserFollow.get_follows_count(user_id)))
-        stats.append(Stats(name="Follower", stats_type="follower", number=UserFollow.get_follower_count(user_id)))
-        stats.append(Stats(name="Liked recipes", stats_type="liked_recipe", number=RecipeLike.get_count_for_user(user_id)))
-        stats.append(Stats(name="Created recipes", stats_type="user_recipe", number=Recipe.get_count_for_user(user_id, user_id != account_id)))
-        return make_response(jsonify(stats), 200)
+        stats.append(Stats(name="Follows", stats_type="follow", number=counts.follows))
+        stats.append(Stats(name="Follower", stats_type="follower", number=counts.followers))
+        stats.append(Stats(name="Liked recipes", stats_type="liked_recipe", number=counts.liked_recipes))
+        stats.append(Stats(name="Created recipes", stats_type="user_recipe", number=counts.recipes))
+        # The counts are the whole body, so they are its version too
+        return make_etag_response(stats, tuple(counts))
 
 
 class UserProfileImage(Resource):
@@ -220,12 +230,12 @@ class UserProfileImage(Resource):
         if not user.profile_image_id:
             return make_response(jsonify(message='User does not have a profile picture'), 404)
 
-        output = file_manager.download(user.profile_image_id)
-        return make_response(send_file(output, as_attachment=True), 200)
+        return send_image(user.profile_image_id, immutable=False)
 
     @jwt_required()
     @validate_account_user
     @get_user
+    @single_transaction
     def put(self, user_id: int, user: User):
         uploaded_file = request.files.get("image")
         if not uploaded_file or uploaded_file.filename == '':
@@ -235,7 +245,7 @@ class UserProfileImage(Resource):
         file_id = file_manager.save(profile_image)
 
         if user.profile_image_id:
-            file_id = file_manager.delete(user.profile_image_id)
+            FileDeletion.queue([user.profile_image_id])
 
         user.update(profile_image_id=file_id)
         return make_response(jsonify(message='Profile picture uploaded.'), 200)
@@ -243,11 +253,12 @@ class UserProfileImage(Resource):
     @jwt_required()
     @validate_account_user
     @get_user
+    @single_transaction
     def delete(self, user_id: int, user: User):
         if not user.profile_image_id:
             return make_response(jsonify(message='Nothing to delete'), 304)
 
-        file_manager.delete(user.profile_image_id)
+        FileDeletion.queue([user.profile_image_id])
         user.update(profile_image_id=None)
         return make_response(jsonify(message='Profile picture deleted.'), 200)
 
@@ -264,28 +275,24 @@ class UserProfileImageId(Resource):
 
 class UserFollows(Resource):
     @jwt_required()
-    @check_user_exists
+    @get_page
     @get_user_follows
-    def get(self, user_id: int, user_follows: typing.List[UserFollow]):
-        user_ids = set(follow.follow_id for follow in user_follows)
-        users = User.get_all_of_ids(user_ids)
-        return make_response(jsonify(users), 200)
+    def get(self, user_id: int, page: PageRequest, user_follows: typing.List[FollowListUser], next_cursor: str):
+        return make_page_response(user_follows, next_cursor)
 
 
 class UserFollowers(Resource):
     @jwt_required()
-    @check_user_exists
+    @get_page
     @get_user_followers
-    def get(self, user_id: int, user_followers: typing.List[UserFollow]):
-        user_ids = set(follow.user_id for follow in user_followers)
-        users = User.get_all_of_ids(user_ids)
-        return make_response(jsonify(users), 200)
+    def get(self, user_id: int, page: PageRequest, user_followers: typing.List[FollowListUser], next_cursor: str):
+        return make_page_response(user_followers, next_cursor)
 
 
 class UserFollowUser(Resource):
     @jwt_required()
-    @check_user_exists
     @get_user_follow
+    @check_user_exists
     def get(self, user_id: int, follow_id, user_follow: UserFollow):
         state: bool = user_follow is not None
         return make_response(jsonify(state=state), 200)
@@ -314,21 +321,21 @@ class UserFollowUser(Resource):
 
 class UserRecipes(Resource):
     @jwt_required()
+    @get_query_string('view', 'full')
+    @get_page
     @get_user_recipes
-    def get(self, user_id: int, recipes: typing.List[dict]):
-        return make_response(jsonify(recipes), 200)
+    def get(self, user_id: int, view: str, page: PageRequest, recipes: typing.List[dict], next_cursor: str):
+        return make_page_response(recipes, next_cursor)
 
 
 class UserRecipeLikes(Resource):
     @jwt_required()
+    @get_query_string('view', 'full')
     @check_user_exists
+    @get_page
     @get_user_recipe_likes
-    def get(self, user_id: int, likes: typing.List[RecipeLike]):
-        recipes = []
-        for like in likes:
-            recipes.append(Recipe.get_by_id(like.recipe_id))
-
-        return make_response(jsonify(recipes), 200)
+    def get(self, user_id: int, view: str, page: PageRequest, recipes: typing.List[dict], next_cursor: str):
+        return make_page_response(recipes, next_cursor)
 
 
 class Recipes(Resource):
@@ -339,6 +346,7 @@ class Recipes(Resource):
     @jwt_required()
     @get_account_user_id
     @recipe_parser.parse()
+    @single_transaction
     def put(self, account_id: int, parsed_data: dict):
         if parsed_data.get('steps'):
             steps = []
@@ -366,16 +374,27 @@ class Recipes(Resource):
 
 class RecipeTagSuggestions(Resource):
     @jwt_required()
-    def get(self):
+    @get_query_string('prefix')
+    def get(self, prefix: str):
+        if prefix is not None:
+            return make_response(jsonify(tag_suggestions.find(prefix)), 200)
+
         tagNames = set(DEFAULT_TAG_NAMES)
-        for tag, in RecipeTag.get_top_of(100):
-            tagNames.add(tag.lower())
+        tagNames.update(popular_tags.get_top(100))
 
         return make_response(jsonify(list(tagNames)), 200)
 
 
+class RecipeIngredientSuggestions(Resource):
+    @jwt_required()
+    @get_query_string('prefix', '')
+    def get(self, prefix: str):
+        return make_response(jsonify(ingredient_suggestions.find(prefix)), 200)
+
+
 class RecipeData(Resource):
     @jwt_required()
+    @check_etag(Recipe.get_version, 'recipe_id')
     @get_recipe
     def get(self, recipe_id: int, recipe: Recipe):
         return make_response(jsonify(recipe), 200)
@@ -384,31 +403,15 @@ class RecipeData(Resource):
     @validate_account_recipe
     @get_recipe
     @recipe_parser.parse()
+    @single_transaction
     def patch(self, recipe_id: int, recipe: Recipe, parsed_data: dict):
-        if 'steps' in parsed_data:
-            steps = []
-            for step_data in parsed_data.get('steps'):
-                steps.append(RecipeStep(**step_data))
-            parsed_data['steps'] = steps
-
-        if 'ingredients' in parsed_data:
-            steps = []
-            for step_data in parsed_data.get('ingredients'):
-                steps.append(RecipeIngredient(**step_data))
-            parsed_data['ingredients'] = steps
-
-        if parsed_data.get('tags'):
-            tags = []
-            for tag_data in parsed_data.get('tags'):
-                tags.append(RecipeTag(**tag_data))
-            parsed_data['tags'] = tags
-
         recipe.update(**parsed_data)
         return make_response(jsonify(recipe), 200)
 
     @jwt_required()
     @validate_account_recipe
     @get_recipe
+    @single_transaction
     def delete(self, recipe_id: int, recipe: Recipe):
         recipe.remove_from_db()
         return make_response('', 204)
@@ -416,6 +419,7 @@ class RecipeData(Resource):
 
 class RecipeSteps(Resource):
     @jwt_required()
+    @check_etag(RecipeStep.get_version, 'recipe_id')
     @get_recipe_steps
     def get(self, recipe_id: int, recipe_steps: typing.List[RecipeStep]):
         return make_response(jsonify(recipe_steps), 200)
@@ -441,7 +445,7 @@ class RecipeStepData(Resource):
     @get_recipe_step
     @recipe_step_parser.parse()
     def patch(self, recipe_id: int, step_num: int, recipe_step: RecipeStep, parsed_data: dict):
-        recipe_step.update(parsed_data)
+        recipe_step.update(**parsed_data)
         return make_response(jsonify(recipe_step), 200)
 
     @jwt_required()
@@ -471,28 +475,34 @@ class RecipeImages(Resource):
 
     @jwt_required()
     @validate_account_recipe
+    @single_transaction
     def put(self, recipe_id: int):
         image_files = request.files.getlist("images")
         if not image_files:
             return make_response(jsonify(message='No image uploaded.'), 400)
 
-        for image_file in image_files:
-            image = sanitize_image_with_pillow(image_file)
-            file_id = file_manager.save(image)
-            recipe_image = RecipeImage(file_id=file_id, recipe_id=recipe_id)
+        # Upload everything before writing any rows, so the transaction stays short
+        file_ids = [file_manager.save(sanitize_image_with_pillow(image_file)) for image_file in image_files]
+
+        has_icon = RecipeImage.get_icon(recipe_id) is not None
+        for file_id in file_ids:
+            recipe_image = RecipeImage(file_id=file_id, recipe_id=recipe_id, is_icon=not has_icon)
             recipe_image.add_to_db()
+            has_icon = True
         
         return make_response('', 204)
 
     @jwt_required()
     @validate_account_recipe
     @recipe_image_parser.parse()
+    @single_transaction
     def delete(self, recipe_id: int, parsed_data: dict):
         for image in parsed_data['image_ids']:
             recipe_image = RecipeImage.get_by_id(recipe_id, image["file_id"])
-            file_manager.delete(recipe_image.file_id)
+            FileDeletion.queue([recipe_image.file_id])
             recipe_image.remove_from_db()
 
+        RecipeImage.ensure_icon(recipe_id)
         return make_response('', 204)
 
 
@@ -501,15 +511,17 @@ class RecipeImageData(Resource):
     @check_recipe_exists
     @get_recipe_image
     def get(self, recipe_id: int, file_id: str, recipe_image: RecipeImage):
-        output = file_manager.download(recipe_image.file_id)
-        return make_response(send_file(output, as_attachment=True), 200)
+        return send_image(recipe_image.file_id)
 
     @jwt_required()
     @validate_account_recipe
     @get_recipe_image
+    @single_transaction
     def delete(self, recipe_id: int, file_id: str, recipe_image: RecipeImage):
-        file_manager.delete(recipe_image.file_id)
+        FileDeletion.queue([recipe_image.file_id])
         recipe_image.remove_from_db()
+        if recipe_image.is_icon:
+            RecipeImage.ensure_icon(recipe_id)
         return make_response('', 204)
 
 
@@ -518,31 +530,31 @@ class RecipeIcon(Resource):
     @check_recipe_exists
     @get_recipe_image
     def get(self, recipe_id: int, recipe_image: RecipeImage):
-        output = file_manager.download(recipe_image.file_id)
-        return make_response(send_file(output, as_attachment=True), 200)
+        return send_image(recipe_image.file_id, immutable=False)
 
 
 class RecipeLikes(Resource):
     @jwt_required()
     @check_recipe_exists
+    @get_page
     @get_recipe_likes
-    def get(self, recipe_id: int, likes: typing.List[RecipeLike]):
-        return make_response(jsonify(likes), 200)
+    def get(self, recipe_id: int, page: PageRequest, likes: typing.List[RecipeLike], next_cursor: str):
+        return make_page_response(likes, next_cursor)
 
 
 class RecipeLikeUser(Resource):
     @jwt_required()
+    @get_recipe_like
     @check_recipe_exists
     @check_user_exists
-    @get_recipe_like
     def get(self, recipe_id: int, user_id: int, like: RecipeLike):
         state = like is not None
         return make_response(jsonify(state=state), 200)
 
     @jwt_required()
     @validate_account_user
-    @check_recipe_exists
     @get_recipe_like
+    @check_recipe_exists
     def post(self, recipe_id: int, user_id: int, like: RecipeLike):
         if like is not None:
             make_response(jsonify(message='Account already like that recipe.'), 400)
@@ -553,8 +565,8 @@ class RecipeLikeUser(Resource):
 
     @jwt_required()
     @validate_account_user
-    @check_recipe_exists
     @get_recipe_like
+    @check_recipe_exists
     def delete(self, recipe_id: int, user_id: int, like: RecipeLike):
         if like is None:
             make_response(jsonify(message='Account did not like that recipe.'), 400)
@@ -566,9 +578,10 @@ class RecipeLikeUser(Resource):
 class RecipeReviews(Resource):
     @jwt_required()
     @check_recipe_exists
-    def get(self, recipe_id: int):
-        reviews = RecipeReview.get_for_recipe(recipe_id)
-        return make_response(jsonify(reviews), 200)
+    @get_page
+    def get(self, recipe_id: int, page: PageRequest):
+        reviews, next_cursor = RecipeReview.get_page_for_recipe(recipe_id, page)
+        return make_page_response(reviews, next_cursor)
 
     @jwt_required()
     @get_account_user_id
@@ -587,48 +600,63 @@ class RecipeReviews(Resource):
 class Search(Resource):
     @jwt_required()
     @get_query_string('search_string', '')
-    def get(self, search_string: str):
-
-        #TODO Search by categories 
-
-        result_data = {}
-        result_data["recipes"] = Recipe.get_all_public(search_string)
-        result_data["users"] = User.get_all_public(search_string)
-        return make_response(jsonify(result_data), 200)
+    @get_query_string('view', 'full')
+    @get_query_string('facets', 'false')
+    @get_page
+    @get_facet_filter
+    def get(self, search_string: str, view: str, facets: str, page: PageRequest, facet_filter: FacetFilter):
+        recipe_source = RecipeSummary if view == 'summary' else Recipe
+
+        # Recipes and users are paged independently; the cursor carries both positions,
+        # and a position of None means that list has no more results
+        cursors = decode_cursor(page.cursor) if page.cursor else {}
+        if not isinstance(cursors, dict):
+            raise InvalidCursor(page.cursor)
+
+        # Facets narrow down the text matches, so the ranked text search is only used
+        # when no facet is selected. Loading every match is only worth it for filters
+        # or when facet counts are asked for
+        result_data = {"recipes": [], "users": []}
+        if not facet_filter.is_empty() or facets == 'true':
+            snapshot = facet_index.get()
+            result = snapshot.find(facet_filter, search_index.match_recipes(search_string))
+            result_data["facets"] = snapshot.count(result, facet_filter)
+
+        next_cursors = {"recipes": None, "users": None}
+        if cursors.get("recipes", "") is not None:
+            recipe_page = PageRequest(cursors.get("recipes"), page.limit)
+            if facet_filter.is_empty():
+                result_data["recipes"], next_cursors["recipes"] = recipe_source.search(search_string, recipe_page)
+            else:
+                recipe_ids, next_cursors["recipes"] = page_recipe_ids(result, recipe_page)
+                recipes = {recipe.recipe_id: recipe for recipe in recipe_source.get_for_ids(recipe_ids, public_only=True)}
+                result_data["recipes"] = [recipes[recipe_id] for recipe_id in recipe_ids if recipe_id in recipes]
+        if cursors.get("users", "") is not None:
+            result_data["users"], next_cursors["users"] = User.search(search_string, PageRequest(cursors.get("users"), page.limit))
+
+        response = make_response(jsonify(result_data), 200)
+        if any(next_cursors.values()):
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(next_cursors)
+        return response
+
+
+class Timeline(Resource):
+    @jwt_required()
+    @get_account_user_id
+    @get_query_string('view', 'full')
+    @get_page
+    def get(self, account_id: int, view: str, page: PageRequest):
+        recipe_source = RecipeSummary if view == 'summary' else Recipe
+        recipe_ids, next_cursor = get_timeline_page(account_id, page)
+        recipes = {recipe.recipe_id: recipe for recipe in recipe_source.get_for_ids(recipe_ids, public_only=True)} if recipe_ids else {}
+        return make_page_response([recipes[recipe_id] for recipe_id in recipe_ids if recipe_id in recipes], next_cursor)
 
 
 class Discover(Resource):
     @jwt_required()
     @get_account_user_id
-    def get(self, account_id: int):
-        discovers = []
-
-        tag_names = RecipeTag.get_top_of(20)
-        random.shuffle(tag_names)
-        if len(tag_names) > 8:
-            tag_names = tag_names[:8]
-
-        for name, in tag_names:
-            recipe_ids = [int(tag.recipe_id) for tag in RecipeTag.get_for_name(name)]
-            recipes = Recipe.get_for_ids(recipe_ids)
-            discovers.append(DiscoverSection(header=name.capitalize(), size="normal", recipes=recipes))
-
-        follows: typing.List[UserFollow] = UserFollow.get_for_user_id(account_id)
-        random.shuffle(follows)
-        if len(follows) > 8:
-            follows = follows[:8]
-
-        for follow in follows:
-            user: User = User.get_by_id(follow.follow_id)
-            recipes = Recipe.get_for_user_id(follow.follow_id)
-            if recipes:
-                discovers.append(DiscoverSection(
-                    header="Made by " + user.username, 
-                    size="normal", 
-                    recipes=recipes
-                ))
-
-        random.shuffle(discovers)
-        discovers.insert(0, DiscoverSection(header="Latest", size="large", recipes=Recipe.get_all_public('', 5)))
-
+    @get_query_string('view', 'full')
+    def get(self, account_id: int, view: str):
+        recipe_source = RecipeSummary if view == 'summary' else Recipe
+        discovers = get_discover(account_id, recipe_source)
         return make_response(jsonify(sections=discovers), 200)
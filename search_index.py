@@ -0,0 +1,275 @@
+import re
+import typing
+from itertools import chain
+from sqlalchemy import bindparam, column, delete, event, inspect, table, text
+from app import db
+from trigram_index import username_index
+from pagination import InvalidCursor, PageRequest, decode_cursor, split_page
+import config
+
+
+# Every table and index owned by the search index starts with this prefix, so
+# schema comparisons can leave them (and the FTS5 shadow tables) alone
+TABLE_PREFIX = 'search_'
+MAX_TERMS = 8
+
+# Columns that feed the index, per table: (recipe_id or user_id column, indexed columns)
+RECIPE_SOURCES = {
+    'recipes': ('recipe_id', ('name', 'description')),
+    'recipe_tags': ('recipe_id', ('recipe_id', 'name')),
+    'recipe_ingredients': ('recipe_id', ('recipe_id', 'name')),
+}
+USER_SOURCES = {
+    'users': ('user_id', ('username', 'bio')),
+}
+
+
+def is_search_table(name: str) -> bool:
+    return name.startswith(TABLE_PREFIX)
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    return not (type_ in ('table', 'index') and reflected and compare_to is None and is_search_table(name))
+
+
+def get_terms(search_string: str) -> typing.List[str]:
+    return re.findall(r'\w+', search_string.lower())[:MAX_TERMS]
+
+
+def ids_param(statement: str):
+    return text(statement).bindparams(bindparam('ids', expanding=True))
+
+
+class SqliteSearchIndex:
+    create_statements = [
+        "CREATE VIRTUAL TABLE search_recipes USING fts5(name, tags, ingredients, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+        "CREATE VIRTUAL TABLE search_users USING fts5(username, bio, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    ]
+    drop_statements = [
+        "DROP TABLE IF EXISTS search_recipes",
+        "DROP TABLE IF EXISTS search_users",
+    ]
+    recipe_key = 'rowid'
+    user_key = 'rowid'
+
+    insert_recipes = """
+        INSERT INTO search_recipes (rowid, name, tags, ingredients, description)
+        SELECT recipes.recipe_id, recipes.name,
+            (SELECT group_concat(recipe_tags.name, ' ') FROM recipe_tags WHERE recipe_tags.recipe_id = recipes.recipe_id),
+            (SELECT group_concat(recipe_ingredients.name, ' ') FROM recipe_ingredients WHERE recipe_ingredients.recipe_id = recipes.recipe_id),
+            recipes.description
+        FROM recipes"""
+    insert_users = """
+        INSERT INTO search_users (rowid, username, bio)
+        SELECT users.user_id, users.username, users.bio FROM users"""
+
+    # bm25 weights follow the column order: name, tags, ingredients, description.
+    # Lower scores rank higher, so pages continue after the (score, id) of the last match
+    search_recipes_statement = """
+        SELECT id, score FROM (
+            SELECT search_recipes.rowid AS id, bm25(search_recipes, 10.0, 5.0, 3.0, 1.0) AS score
+            FROM search_recipes JOIN recipes ON recipes.recipe_id = search_recipes.rowid
+            WHERE search_recipes MATCH :query AND recipes.is_public
+        ) AS matches
+        WHERE :score IS NULL OR score > :score OR (score = :score AND id > :id)
+        ORDER BY score, id
+        LIMIT :limit"""
+    search_users_statement = """
+        SELECT id, score FROM (
+            SELECT search_users.rowid AS id, bm25(search_users, 10.0, 1.0) AS score
+            FROM search_users
+            WHERE search_users MATCH :query
+        ) AS matches
+        WHERE :score IS NULL OR score > :score OR (score = :score AND id > :id)
+        ORDER BY score, id
+        LIMIT :limit"""
+
+    match_recipes_statement = "SELECT rowid FROM search_recipes WHERE search_recipes MATCH :query"
+
+    def to_query(self, terms: typing.List[str]) -> str:
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def refresh_recipes(self, connection, recipe_ids: typing.Iterable[int]):
+        connection.execute(ids_param(f'DELETE FROM search_recipes WHERE {self.recipe_key} IN :ids'), {'ids': list(recipe_ids)})
+        connection.execute(ids_param(self.insert_recipes + ' WHERE recipes.recipe_id IN :ids'), {'ids': list(recipe_ids)})
+
+    def refresh_users(self, connection, user_ids: typing.Iterable[int]):
+        connection.execute(ids_param(f'DELETE FROM search_users WHERE {self.user_key} IN :ids'), {'ids': list(user_ids)})
+        connection.execute(ids_param(self.insert_users + ' WHERE users.user_id IN :ids'), {'ids': list(user_ids)})
+
+    def remove_recipes(self, recipe_ids):
+        # recipe_ids may be a subquery, which plain text statements cannot take
+        recipes = table('search_recipes', column(self.recipe_key))
+        db.session.execute(delete(recipes).where(recipes.c[self.recipe_key].in_(recipe_ids)))
+
+    def create(self, connection):
+        for statement in self.create_statements:
+            connection.execute(text(statement))
+
+    def drop(self, connection):
+        for statement in self.drop_statements:
+            connection.execute(text(statement))
+
+    def rebuild(self, connection):
+        connection.execute(text('DELETE FROM search_recipes'))
+        connection.execute(text('DELETE FROM search_users'))
+        connection.execute(text(self.insert_recipes))
+        connection.execute(text(self.insert_users))
+
+    def search_recipes(self, search_string: str, page: PageRequest) -> typing.Tuple[typing.List[int], str]:
+        return self._search(self.search_recipes_statement, search_string, page)
+
+    def search_users(self, search_string: str, page: PageRequest) -> typing.Tuple[typing.List[int], str]:
+        return self._search(self.search_users_statement, search_string, page)
+
+    def find_usernames(self, query: str, limit: int) -> typing.List[int]:
+        # SQLite has no trigram index, so usernames are matched in process
+        return username_index.find(query, limit)
+
+    def match_recipes(self, search_string: str) -> typing.List[int]:
+        # Every matching recipe, unranked, for narrowing down faceted searches
+        terms = get_terms(search_string)
+        if not terms:
+            return None
+        return [row[0] for row in db.session.execute(text(self.match_recipes_statement), {'query': self.to_query(terms)})]
+
+    def _search(self, statement: str, search_string: str, page: PageRequest):
+        terms = get_terms(search_string)
+        if not terms:
+            return None, None
+
+        score, id = None, None
+        if page.cursor:
+            try:
+                score, id = decode_cursor(page.cursor)
+                score, id = float(score), int(id)
+            except (TypeError, ValueError):
+                raise InvalidCursor(page.cursor)
+
+        params = {'query': self.to_query(terms), 'score': score, 'id': id, 'limit': page.limit + 1}
+        matches, next_cursor = split_page(db.session.execute(text(statement), params).all(), page, lambda match: [match.score, match.id])
+        return [match.id for match in matches], next_cursor
+
+
+class PostgresSearchIndex(SqliteSearchIndex):
+    create_statements = [
+        "CREATE TABLE search_recipes (recipe_id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)",
+        "CREATE INDEX ix_search_recipes_document ON search_recipes USING GIN (document)",
+        "CREATE TABLE search_users (user_id INTEGER PRIMARY KEY, document TSVECTOR NOT NULL)",
+        "CREATE INDEX ix_search_users_document ON search_users USING GIN (document)",
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX search_users_username_trgm ON users USING GIN (lower(username) gin_trgm_ops)",
+    ]
+    drop_statements = [
+        "DROP INDEX IF EXISTS search_users_username_trgm",
+    ] + SqliteSearchIndex.drop_statements
+    recipe_key = 'recipe_id'
+    user_key = 'user_id'
+
+    # Weights A to D follow the same order as the bm25 weights on SQLite
+    insert_recipes = """
+        INSERT INTO search_recipes (recipe_id, document)
+        SELECT recipes.recipe_id,
+            setweight(to_tsvector('simple', recipes.name), 'A') ||
+            setweight(to_tsvector('simple', coalesce((SELECT string_agg(recipe_tags.name, ' ') FROM recipe_tags WHERE recipe_tags.recipe_id = recipes.recipe_id), '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce((SELECT string_agg(recipe_ingredients.name, ' ') FROM recipe_ingredients WHERE recipe_ingredients.recipe_id = recipes.recipe_id), '')), 'C') ||
+            setweight(to_tsvector('simple', coalesce(recipes.description, '')), 'D')
+        FROM recipes"""
+    insert_users = """
+        INSERT INTO search_users (user_id, document)
+        SELECT users.user_id,
+            setweight(to_tsvector('simple', users.username), 'A') ||
+            setweight(to_tsvector('simple', coalesce(users.bio, '')), 'C')
+        FROM users"""
+
+    search_recipes_statement = """
+        SELECT id, score FROM (
+            SELECT search_recipes.recipe_id AS id, -ts_rank(search_recipes.document, to_tsquery('simple', :query)) AS score
+            FROM search_recipes JOIN recipes ON recipes.recipe_id = search_recipes.recipe_id
+            WHERE search_recipes.document @@ to_tsquery('simple', :query) AND recipes.is_public
+        ) AS matches
+        WHERE :score IS NULL OR score > :score OR (score = :score AND id > :id)
+        ORDER BY score, id
+        LIMIT :limit"""
+    search_users_statement = """
+        SELECT id, score FROM (
+            SELECT search_users.user_id AS id, -ts_rank(search_users.document, to_tsquery('simple', :query)) AS score
+            FROM search_users
+            WHERE search_users.document @@ to_tsquery('simple', :query)
+        ) AS matches
+        WHERE :score IS NULL OR score > :score OR (score = :score AND id > :id)
+        ORDER BY score, id
+        LIMIT :limit"""
+
+    match_recipes_statement = "SELECT recipe_id FROM search_recipes WHERE document @@ to_tsquery('simple', :query)"
+    # Prefix matches first, alphabetically, then the closest names by trigram similarity
+    find_usernames_statement = """
+        SELECT user_id FROM users
+        WHERE lower(username) LIKE :prefix OR lower(username) % :query
+        ORDER BY lower(username) LIKE :prefix DESC,
+            CASE WHEN lower(username) LIKE :prefix THEN lower(username) END,
+            similarity(lower(username), :query) DESC,
+            lower(username)
+        LIMIT :limit"""
+
+    def to_query(self, terms: typing.List[str]) -> str:
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def find_usernames(self, query: str, limit: int) -> typing.List[int]:
+        query = query.strip().lower()
+        if not query:
+            return []
+        prefix = re.sub(r'([\\%_])', r'\\\1', query) + '%'
+        rows = db.session.execute(text(self.find_usernames_statement), {'query': query, 'prefix': prefix, 'limit': limit})
+        return [row[0] for row in rows]
+
+
+search_index = PostgresSearchIndex() if config.SQLALCHEMY_DATABASE_URI.startswith('postgres') else SqliteSearchIndex()
+
+
+def changed_ids(session, flush_context, sources: dict) -> typing.Set[int]:
+    ids = set()
+    for instance in chain(session.new, session.dirty, session.deleted):
+        source = sources.get(getattr(instance, '__tablename__', None))
+        if not source:
+            continue
+        id_column, indexed_columns = source
+        state = inspect(instance)
+        # Orphans removed from a collection are deleted while still listed as dirty
+        if instance in session.dirty and not flush_context.is_deleted(state):
+            if not any(state.attrs[name].history.has_changes() for name in indexed_columns):
+                continue
+        ids.add(getattr(instance, id_column))
+    return ids
+
+
+# Keep the index in the same transaction as the rows it is built from
+@event.listens_for(db.session, 'after_flush')
+def refresh_search_index(session, flush_context):
+    recipe_ids = changed_ids(session, flush_context, RECIPE_SOURCES)
+    user_ids = changed_ids(session, flush_context, USER_SOURCES)
+    if recipe_ids:
+        search_index.refresh_recipes(session.connection(), recipe_ids)
+    if user_ids:
+        search_index.refresh_users(session.connection(), user_ids)
+        session.info.setdefault('changed_user_ids', set()).update(user_ids)
+
+
+@event.listens_for(db.session, 'after_commit')
+def refresh_username_index(session):
+    username_index.mark_changed(session.info.pop('changed_user_ids', ()))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kwargs):
+    search_index.create(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_index(target, connection, **kwargs):
+    search_index.drop(connection)
@@ -0,0 +1,46 @@
+import typing
+from collections import Counter
+from itertools import chain
+from sqlalchemy import event, inspect
+from app import db
+from models import RecipeTag, TagStat
+from worker_snapshot import WorkerSnapshot
+import config
+
+
+class PopularTags(WorkerSnapshot):
+    # Every tag name with its usage count, most used first
+    def __init__(self, refresh_seconds: float) -> None:
+        super().__init__(lambda: [(name, usage_count) for name, usage_count in TagStat.get_all()], refresh_seconds, 'tag_stats_changed')
+
+    def get_top(self, limit: int) -> typing.List[str]:
+        return [name for name, _ in self.get()[:limit]]
+
+
+# Other workers pick up new counts within TAG_STATS_REFRESH_SECONDS
+popular_tags = PopularTags(config.TAG_STATS_REFRESH_SECONDS)
+
+
+def count_tag_changes(session, flush_context) -> typing.Dict[str, int]:
+    usages = Counter()
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(instance, RecipeTag):
+            continue
+        state = inspect(instance)
+        # Tags removed from a recipe are deleted as orphans, while still listed as dirty
+        if instance in session.deleted or flush_context.is_deleted(state):
+            usages[TagStat.normalize_name(instance.name)] -= 1
+        elif instance in session.new:
+            usages[TagStat.normalize_name(instance.name)] += 1
+        else:
+            history = state.attrs.name.history
+            for name in history.deleted:
+                usages[TagStat.normalize_name(name)] -= 1
+            for name in history.added:
+                usages[TagStat.normalize_name(name)] += 1
+    return usages
+
+
+@event.listens_for(db.session, 'after_flush')
+def refresh_tag_stats(session, flush_context):
+    TagStat.count_usages(session, count_tag_changes(session, flush_context))
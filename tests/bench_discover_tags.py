@@ -0,0 +1,88 @@
+import argparse
+import random
+import time
+from datetime import datetime
+from unittest import mock
+from helpers import DbTestCase
+from app import db
+from models import Recipe, RecipeTag, User
+
+
+# Run with python tests/bench_discover_tags.py; it is not collected by the test runner
+TAG_NAMES = [f'tag {number}' for number in range(50)]
+
+
+class Bench(DbTestCase):
+    def runTest(self):
+        pass
+
+
+def add_recipes(user_id: int, count: int):
+    now = datetime.now()
+    recipes = [{'user_id': user_id, 'name': f'Recipe {number}', 'is_public': number % 10 != 0, 'time_created': now, 'time_modified': now} for number in range(count)]
+    db.session.bulk_insert_mappings(Recipe, recipes)
+    recipe_ids = [recipe_id for recipe_id, in db.session.query(Recipe.recipe_id)]
+    db.session.bulk_insert_mappings(RecipeTag, [
+        {'recipe_id': recipe_id, 'name': name}
+        for recipe_id in recipe_ids
+        for name in random.sample(TAG_NAMES, 3)
+    ])
+    db.session.commit()
+
+
+def loop(names, limit):
+    # What Discover did before: two queries per tag
+    return {name: [recipe.recipe_id for recipe in Recipe.get_for_ids([tag.recipe_id for tag in RecipeTag.get_for_name(name, limit)])] for name in names}
+
+
+def single_query(names, limit):
+    recipe_ids = RecipeTag.get_latest_public_ids_for_names(names, limit)
+    recipes = {recipe.recipe_id: recipe for recipe in Recipe.get_for_ids({recipe_id for ids in recipe_ids.values() for recipe_id in ids})}
+    return {name: [recipes[recipe_id].recipe_id for recipe_id in ids] for name, ids in recipe_ids.items()}
+
+
+def window_function(names, limit):
+    with mock.patch('models.WINDOW_FUNCTIONS', True):
+        return single_query(names, limit)
+
+
+def union_of_limits(names, limit):
+    with mock.patch('models.WINDOW_FUNCTIONS', False):
+        return single_query(names, limit)
+
+
+def measure(bench: Bench, func, names, limit, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        with bench.count_queries() as statements:
+            func(names, limit)
+    return (time.perf_counter() - started) / repeat, len(statements)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipes', type=int, default=20000)
+    parser.add_argument('--tags', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    bench = Bench()
+    bench.setUp()
+    try:
+        user = User(username='bench', password_hash='hash')
+        user.add_to_db()
+        add_recipes(user.user_id, args.recipes)
+        names = TAG_NAMES[:args.tags]
+
+        print(f'{args.recipes} recipes, {args.tags} tags, {args.limit} recipes per tag')
+        for label, func in [('loop', loop), ('window function', window_function), ('union of limits', union_of_limits)]:
+            seconds, queries = measure(bench, func, names, args.limit, args.repeat)
+            print(f'{label:<20}{seconds * 1000:>10.1f} ms{queries:>6} queries')
+    finally:
+        bench.tearDown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import contextmanager
+
+
+# Never run the unit tests against the database configured in .env
+os.environ['SQLALCHEMY_DATABASE_URI'] = os.environ.get('TEST_DATABASE_URI', 'sqlite://')
+os.environ.setdefault('JWT_SECRET_KEY', 'sharecipe-unit-test-secret-key')
+os.environ['FILE_DELETION_WORKER'] = 'False'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Uploaded files are stored relative to the working directory
+os.chdir(tempfile.mkdtemp(prefix='sharecipe-tests-'))
+
+
+from sqlalchemy import event
+from flask_jwt_extended import create_access_token
+from app import app, db
+from models import Recipe, RecipeIngredient, RecipeTag, User
+from token_blocklist import revoked_token_cache
+from facet_index import facet_index
+from trigram_index import username_index
+from discover_feed import discover_index
+from tag_stats import popular_tags
+from autocomplete import ingredient_suggestions
+
+
+class DbTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.create_schema()
+        revoked_token_cache.refresh()
+        facet_index.invalidate()
+        username_index.invalidate()
+        discover_index.invalidate()
+        popular_tags.invalidate()
+        ingredient_suggestions.invalidate()
+        self.client = app.test_client()
+
+    def create_schema(self):
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.session.execute(db.text('DROP TABLE IF EXISTS alembic_version'))
+        db.session.commit()
+        self.app_context.pop()
+
+    def add_user(self, username: str) -> int:
+        user = User(username=username, password_hash='hash')
+        user.add_to_db()
+        return user.user_id
+
+    def add_recipe(self, user_id: int, name: str = 'Recipe', tags: list = (), ingredients: list = (), is_public: bool = True, **fields) -> int:
+        recipe = Recipe(user_id=user_id, name=name, is_public=is_public, **fields)
+        recipe.tags = [RecipeTag(name=tag) for tag in tags]
+        recipe.ingredients = [RecipeIngredient(name=ingredient) for ingredient in ingredients]
+        recipe.add_to_db()
+        return recipe.recipe_id
+
+    def auth_header(self, user_id: int):
+        return {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+
+    @contextmanager
+    def count_queries(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        db.session.expunge_all()
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    @contextmanager
+    def count_commits(self):
+        commits = []
+
+        def after_commit(session):
+            commits.append(session)
+
+        event.listen(db.session, 'after_commit', after_commit)
+        try:
+            yield commits
+        finally:
+            event.remove(db.session, 'after_commit', after_commit)
@@ -0,0 +1,67 @@
+import random
+import string
+import time
+import unittest
+from helpers import DbTestCase
+from autocomplete import PrefixIndex
+from models import User
+
+
+VOCABULARY_SIZE = 50000
+LOOKUP_SECONDS_BUDGET = 0.001
+
+
+class TestPrefixIndex(unittest.TestCase):
+    def test_matches_are_ranked_by_usage(self):
+        index = PrefixIndex({'pasta': 5, 'pastry': 9, 'paprika': 1, 'pepper': 7, 'rice': 3})
+        self.assertListEqual(index.find('pa'), ['pastry', 'pasta', 'paprika'])
+        self.assertListEqual(index.find('PAS'), ['pastry', 'pasta'])
+        self.assertListEqual(index.find('past', limit=1), ['pastry'])
+        self.assertListEqual(index.find('pastas'), [])
+        self.assertListEqual(index.find(' '), [])
+
+    def test_lookups_are_fast(self):
+        random.seed(0)
+        usages = {''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 12))): random.randint(1, 1000) for _ in range(VOCABULARY_SIZE)}
+        index = PrefixIndex(usages)
+        prefixes = [name[:length] for name in random.sample(list(usages), 200) for length in range(1, 5)]
+
+        start = time.perf_counter()
+        for prefix in prefixes:
+            index.find(prefix)
+        self.assertLess((time.perf_counter() - start) / len(prefixes), LOOKUP_SECONDS_BUDGET)
+
+
+class TestSuggestionEndpoints(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(username='chef', password_hash='hash')
+        user.add_to_db()
+        self.user_id = user.user_id
+        self.header = self.auth_header(self.user_id)
+        self.add_recipe(self.user_id, tags=['Pasta', 'party'], ingredients=['Parmesan', 'Pasta sheets'])
+        self.add_recipe(self.user_id, tags=['pasta'], ingredients=['parmesan', 'Paprika'])
+
+    def get_suggestions(self, url: str, prefix: str):
+        response = self.client.get(url, headers=self.header, query_string={'prefix': prefix})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_tags(self):
+        self.assertListEqual(self.get_suggestions('/recipes/tagsuggestions', 'pa'), ['pasta', 'party'])
+        self.add_recipe(self.user_id, tags=['party', 'party food'])
+        self.assertListEqual(self.get_suggestions('/recipes/tagsuggestions', 'par'), ['party', 'party food'])
+
+        # Without a prefix the whole vocabulary is still returned, for older clients
+        response = self.client.get('/recipes/tagsuggestions', headers=self.header)
+        self.assertIn('pasta', response.get_json())
+
+    def test_ingredients(self):
+        self.assertListEqual(self.get_suggestions('/recipes/ingredientsuggestions', 'pa'), ['parmesan', 'paprika', 'pasta sheets'])
+        self.add_recipe(self.user_id, ingredients=['Pasta sheets', 'pasta sheets'])
+        self.assertListEqual(self.get_suggestions('/recipes/ingredientsuggestions', 'pa'), ['pasta sheets', 'parmesan', 'paprika'])
+        self.assertListEqual(self.get_suggestions('/recipes/ingredientsuggestions', ''), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import time
+import unittest
+from helpers import DbTestCase
+from app import db
+from models import Recipe, RecipeImage, RecipeLike, RecipeReview, RecipeStep, RecipeTag, User, UserFollow
+
+
+RECIPE_COUNT = 1000
+LIKE_COUNT = 10000
+STATEMENT_BUDGET = 26
+SECONDS_BUDGET = 5
+
+
+class TestCascadeDelete(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        users = [User(username=f'user{number}', password_hash='hash') for number in range(LIKE_COUNT // RECIPE_COUNT + 1)]
+        db.session.add_all(users)
+        db.session.commit()
+        self.user_id = users[0].user_id
+        self.fan_ids = [user.user_id for user in users[1:]]
+
+        db.session.bulk_insert_mappings(Recipe, [
+            {'recipe_id': recipe_id, 'user_id': self.user_id, 'name': 'Heavy', 'is_public': True}
+            for recipe_id in range(1, RECIPE_COUNT + 1)
+        ])
+        db.session.bulk_insert_mappings(RecipeStep, [
+            {'recipe_id': recipe_id, 'step_number': 1, 'description': 'Cook.'} for recipe_id in range(1, RECIPE_COUNT + 1)
+        ])
+        db.session.bulk_insert_mappings(RecipeTag, [
+            {'recipe_id': recipe_id, 'name': 'heavy'} for recipe_id in range(1, RECIPE_COUNT + 1)
+        ])
+        db.session.bulk_insert_mappings(RecipeImage, [
+            {'file_id': f'image-{recipe_id}', 'recipe_id': recipe_id, 'is_icon': True} for recipe_id in range(1, RECIPE_COUNT + 1)
+        ])
+        db.session.bulk_insert_mappings(RecipeLike, [
+            {'recipe_id': recipe_id, 'user_id': fan_id} for recipe_id in range(1, RECIPE_COUNT + 1) for fan_id in self.fan_ids
+        ])
+        db.session.bulk_insert_mappings(RecipeReview, [
+            {'recipe_id': recipe_id, 'user_id': self.fan_ids[0], 'rating': 5} for recipe_id in range(1, RECIPE_COUNT + 1)
+        ])
+        db.session.bulk_insert_mappings(UserFollow, [
+            {'user_id': fan_id, 'follow_id': self.user_id} for fan_id in self.fan_ids
+        ])
+
+        # Data of other users that must survive
+        other_recipe = Recipe(user_id=self.fan_ids[0], name='Light', is_public=True)
+        db.session.add(other_recipe)
+        db.session.flush()
+        self.other_recipe_id = other_recipe.recipe_id
+        db.session.add(RecipeLike(recipe_id=self.other_recipe_id, user_id=self.user_id))
+        db.session.add(RecipeLike(recipe_id=self.other_recipe_id, user_id=self.fan_ids[1]))
+        db.session.add(UserFollow(user_id=self.user_id, follow_id=self.fan_ids[0]))
+        db.session.commit()
+
+    def test_delete_heavy_user_within_budget(self):
+        with self.count_queries() as statements:
+            start = time.perf_counter()
+            user = User.get_by_id(self.user_id)
+            user.remove_from_db()
+            elapsed = time.perf_counter() - start
+
+        self.assertLessEqual(len(statements), STATEMENT_BUDGET)
+        self.assertLess(elapsed, SECONDS_BUDGET)
+
+        self.assertIsNone(User.get_by_id(self.user_id))
+        self.assertEqual(Recipe.query.count(), 1)
+        self.assertEqual(RecipeStep.query.count() + RecipeTag.query.count() + RecipeImage.query.count(), 0)
+        self.assertEqual(RecipeReview.query.count(), 0)
+        self.assertEqual(UserFollow.query.count(), 0)
+        self.assertListEqual([like.user_id for like in RecipeLike.query], [self.fan_ids[1]])
+
+    def test_delete_recipe(self):
+        with self.count_queries() as statements:
+            recipe = Recipe.get_by_id(1)
+            recipe.remove_from_db()
+
+        self.assertLessEqual(len(statements), 17)
+        self.assertFalse(Recipe.check_exist(1))
+        self.assertEqual(RecipeLike.query.filter_by(recipe_id=1).count(), 0)
+        self.assertEqual(RecipeLike.query.filter_by(recipe_id=2).count(), len(self.fan_ids))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from helpers import DbTestCase
+from models import Recipe, RecipeImage, RecipeReview, RecipeStep, User, UserFollow
+
+
+class TestConditionalGet(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user_id = self.add_user('chef')
+        self.viewer_id = self.add_user('viewer')
+        self.header = self.auth_header(self.viewer_id)
+        recipe = Recipe(user_id=self.user_id, name='Fried rice', is_public=True, steps=[RecipeStep(step_number=1, description='Fry.')])
+        recipe.add_to_db()
+        self.recipe_id = recipe.recipe_id
+
+    def get(self, url: str, etag: str = None, header: dict = None):
+        headers = dict(header or self.header)
+        if etag:
+            headers['If-None-Match'] = etag
+        with self.count_queries() as statements:
+            response = self.client.get(url, headers=headers)
+        return response, statements
+
+    def assertRevalidates(self, url: str, change, header: dict = None) -> str:
+        response, _ = self.get(url, header=header)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        response, statements = self.get(url, etag, header)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(len(statements), 1)
+
+        change()
+        response, _ = self.get(url, etag, header)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_recipe(self):
+        url = f'/recipes/{self.recipe_id}'
+        self.assertRevalidates(url, lambda: Recipe.get_by_id(self.recipe_id).update(name='Egg fried rice'))
+        self.assertRevalidates(url, lambda: RecipeStep.get_by_id(self.recipe_id, 1).update(description='Stir fry.'))
+        self.assertRevalidates(url, lambda: RecipeImage(file_id='image', recipe_id=self.recipe_id, is_icon=True).add_to_db())
+        self.assertRevalidates(url, lambda: RecipeImage.get_by_id(self.recipe_id, 'image').remove_from_db())
+        self.assertEqual(self.get('/recipes/0', 'W/"anything"')[0].status_code, 404)
+
+    def test_recipe_steps(self):
+        url = f'/recipes/{self.recipe_id}/steps'
+        self.assertRevalidates(url, lambda: RecipeStep(recipe_id=self.recipe_id, step_number=2, description='Serve.').add_to_db())
+        self.assertRevalidates(url, lambda: RecipeStep.get_by_id(self.recipe_id, 2).remove_from_db())
+
+    def test_pages_have_no_etag(self):
+        # A 304 could not carry the next cursor, so clients caching by ETag would lose their place
+        RecipeReview(recipe_id=self.recipe_id, user_id=self.viewer_id, rating=4).add_to_db()
+        response, _ = self.get(f'/recipes/{self.recipe_id}/reviews')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response.headers)
+        self.assertEqual(self.get('/recipes/0/reviews')[0].status_code, 404)
+
+    def test_user(self):
+        self.assertRevalidates(f'/users/{self.user_id}', lambda: User.get_by_id(self.user_id).update(bio='Cooks rice.'))
+
+    def test_user_stats(self):
+        url = f'/users/{self.user_id}/stats'
+        self.assertRevalidates(url, lambda: UserFollow(user_id=self.viewer_id, follow_id=self.user_id).add_to_db())
+        self.assertRevalidates(url, lambda: Recipe(user_id=self.user_id, name='Congee', is_public=True).add_to_db())
+
+        # Private recipes only count for their owner
+        private_recipe = Recipe(user_id=self.user_id, name='Secret rice', is_public=False)
+        private_recipe.add_to_db()
+        etag = self.get(url)[0].headers['ETag']
+        self.assertEqual(self.get(url, etag)[0].status_code, 304)
+        self.assertEqual(self.get(url, etag, self.auth_header(self.user_id))[0].status_code, 200)
+        self.assertEqual(self.get('/users/0/stats')[0].status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
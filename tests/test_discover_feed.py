@@ -0,0 +1,93 @@
+import unittest
+from unittest import mock
+from helpers import DbTestCase
+from app import db
+from discover_feed import discover_index
+from models import DiscoverFeed, Recipe, RecipeTag, User, UserFollow
+
+
+class TestDiscoverFeed(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.viewer_id = self.add_user('viewer')
+        self.chef_id = self.add_user('chef')
+        self.baker_id = self.add_user('baker')
+        UserFollow(user_id=self.viewer_id, follow_id=self.chef_id).add_to_db()
+        self.curry_id = self.add_recipe(self.chef_id, 'Curry', ['spicy'])
+        self.bread_id = self.add_recipe(self.baker_id, 'Bread', ['baking'])
+
+    def get_sections(self) -> dict:
+        response = self.client.get('/discover', headers=self.auth_header(self.viewer_id), query_string={'view': 'summary'})
+        self.assertEqual(response.status_code, 200)
+        return {section['header']: [recipe['recipe_id'] for recipe in section['recipes']] for section in response.get_json()['sections']}
+
+    def test_sections(self):
+        sections = self.get_sections()
+        self.assertListEqual(sections['Latest'], [self.bread_id, self.curry_id])
+        self.assertListEqual(sections['Made by chef'], [self.curry_id])
+        self.assertListEqual(sections['Spicy'], [self.curry_id])
+        self.assertListEqual(sections['Baking'], [self.bread_id])
+        self.assertNotIn('Made by baker', sections)
+
+    def test_feed_is_stored_and_reused(self):
+        self.get_sections()
+        feed = DiscoverFeed.get_for_user_id(self.viewer_id)
+        self.assertFalse(feed.is_stale)
+        time_modified = feed.time_modified
+
+        self.get_sections()
+        db.session.expire_all()
+        self.assertEqual(DiscoverFeed.get_for_user_id(self.viewer_id).time_modified, time_modified)
+
+    def test_follows_mark_the_feed_stale(self):
+        self.get_sections()
+        UserFollow(user_id=self.viewer_id, follow_id=self.baker_id).add_to_db()
+        self.assertTrue(DiscoverFeed.get_for_user_id(self.viewer_id).is_stale)
+        self.assertListEqual(self.get_sections()['Made by baker'], [self.bread_id])
+
+        UserFollow.get_by_id(self.viewer_id, self.baker_id).remove_from_db()
+        self.assertNotIn('Made by baker', self.get_sections())
+
+    def test_recipes_mark_followers_stale(self):
+        self.get_sections()
+        pie_id = self.add_recipe(self.chef_id, 'Pie', [])
+        self.assertTrue(DiscoverFeed.get_for_user_id(self.viewer_id).is_stale)
+        self.assertListEqual(self.get_sections()['Made by chef'], [pie_id, self.curry_id])
+
+        self.add_recipe(self.baker_id, 'Cake', [])
+        self.assertFalse(DiscoverFeed.get_for_user_id(self.viewer_id).is_stale)
+
+    def test_private_recipes_are_left_out(self):
+        self.get_sections()
+        Recipe.get_by_id(self.curry_id).update(is_public=False)
+        discover_index.invalidate()
+        sections = self.get_sections()
+        self.assertNotIn('Made by chef', sections)
+        self.assertNotIn('Spicy', sections)
+        self.assertListEqual(sections['Latest'], [self.bread_id])
+
+    def test_renames_mark_followers_stale(self):
+        self.get_sections()
+        User.get_by_id(self.chef_id).update(username='cook')
+        self.assertIn('Made by cook', self.get_sections())
+
+    def test_latest_recipes_per_tag(self):
+        pasta_ids = [self.add_recipe(self.chef_id, f'Pasta {number}', ['pasta', 'spicy']) for number in range(4)]
+        self.add_recipe(self.chef_id, 'Secret pasta', ['pasta'], is_public=False)
+        expected = {'pasta': pasta_ids[:-4:-1], 'spicy': [pasta_ids[-1], pasta_ids[-2], pasta_ids[-3]], 'french': []}
+
+        for window_functions in (True, False):
+            with mock.patch('models.WINDOW_FUNCTIONS', window_functions):
+                with self.count_queries() as statements:
+                    recipe_ids = RecipeTag.get_latest_public_ids_for_names(['pasta', 'spicy', 'french'], 3)
+                self.assertDictEqual(recipe_ids, expected)
+                self.assertEqual(len(statements), 1)
+
+    def test_deleting_a_user_removes_the_feed(self):
+        self.get_sections()
+        User.get_by_id(self.viewer_id).remove_from_db()
+        self.assertIsNone(DiscoverFeed.get_for_user_id(self.viewer_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
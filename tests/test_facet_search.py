@@ -0,0 +1,143 @@
+import time
+import unittest
+from unittest import mock
+from helpers import DbTestCase
+from app import db
+from facet_index import FacetFilter, count_bits, facet_index, page_recipe_ids
+from models import Recipe, RecipeIngredient, RecipeTag, User
+from pagination import NEXT_CURSOR_HEADER, PageRequest
+
+
+POPULAR_RECIPE_COUNT = 30000
+SECONDS_BUDGET = 0.5
+
+
+class TestFacetSearch(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(username='chef', password_hash='hash')
+        user.add_to_db()
+        self.user_id = user.user_id
+
+        self.carbonara_id = self.add_recipe(self.user_id, 'Carbonara', ['Italian', 'pasta'], ['Spaghetti', 'Egg', 'Pancetta'], difficulty=2, total_time_needed=1800)
+        self.pesto_id = self.add_recipe(self.user_id, 'Pesto Pasta', ['italian', 'pasta', 'vegetarian'], ['Spaghetti', 'Basil'], difficulty=1, total_time_needed=900)
+        self.lasagne_id = self.add_recipe(self.user_id, 'Lasagne', ['italian'], ['Pasta sheets', 'Tomato'], difficulty=4, total_time_needed=7200)
+        self.curry_id = self.add_recipe(self.user_id, 'Green Curry', ['thai'], ['Basil', 'Coconut milk'], difficulty=3, total_time_needed=2700)
+        self.private_id = self.add_recipe(self.user_id, 'Secret Pasta', ['italian', 'pasta'], ['Spaghetti'], difficulty=1, total_time_needed=600, is_public=False)
+
+    def find(self, **kwargs):
+        recipe_ids, _ = page_recipe_ids(facet_index.get().find(FacetFilter(**kwargs)), PageRequest())
+        return recipe_ids
+
+    def test_facets_are_intersected(self):
+        self.assertListEqual(self.find(tags=['italian']), [self.lasagne_id, self.pesto_id, self.carbonara_id])
+        self.assertListEqual(self.find(tags=['italian', 'pasta']), [self.pesto_id, self.carbonara_id])
+        self.assertListEqual(self.find(ingredients=['spaghetti'], exclude_ingredients=['basil']), [self.carbonara_id])
+        self.assertListEqual(self.find(min_difficulty=2, max_difficulty=3), [self.curry_id, self.carbonara_id])
+        self.assertListEqual(self.find(tags=['italian'], max_total_time_needed=1800), [self.pesto_id, self.carbonara_id])
+        self.assertListEqual(self.find(tags=['french']), [])
+
+    def test_counts_describe_the_result(self):
+        snapshot = facet_index.get()
+        facet_filter = FacetFilter(tags=['italian'])
+        counts = snapshot.count(snapshot.find(facet_filter), facet_filter)
+        self.assertDictEqual(counts['tags'], {'italian': 3, 'pasta': 2, 'vegetarian': 1})
+        self.assertEqual(counts['ingredients']['spaghetti'], 2)
+        self.assertDictEqual(counts['difficulty'], {1: 1, 2: 1, 3: 0, 4: 1})
+        self.assertEqual(counts['total_time_needed'][1800], 2)
+        self.assertEqual(counts['total_time_needed'][7200], 3)
+        # Posting lists are turned into bitmaps once per snapshot
+        with mock.patch('facet_index.to_bitmap') as to_bitmap:
+            self.assertDictEqual(snapshot.count(snapshot.find(facet_filter), facet_filter), counts)
+        to_bitmap.assert_not_called()
+
+    def test_search_endpoint_combines_text_and_facets(self):
+        header = self.auth_header(self.user_id)
+        response = self.client.get('/search', headers=header, query_string={'search_string': 'pasta', 'tags': 'Italian', 'max_difficulty': 1})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertListEqual([recipe['recipe_id'] for recipe in data['recipes']], [self.pesto_id])
+        self.assertEqual(data['facets']['tags']['italian'], 1)
+
+        response = self.client.get('/search', headers=header, query_string={'max_total_time_needed': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_plain_search_skips_facets(self):
+        header = self.auth_header(self.user_id)
+        with mock.patch('resources.search_index.match_recipes') as match_recipes:
+            response = self.client.get('/search', headers=header, query_string={'search_string': 'pasta'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('facets', response.get_json())
+        match_recipes.assert_not_called()
+
+        response = self.client.get('/search', headers=header, query_string={'search_string': 'pasta', 'facets': 'true'})
+        self.assertEqual(response.get_json()['facets']['tags']['pasta'], 2)
+
+    def test_search_endpoint_pages_facet_results(self):
+        header = self.auth_header(self.user_id)
+        query = {'tags': 'italian', 'limit': 2, 'view': 'summary'}
+        response = self.client.get('/search', headers=header, query_string=query)
+        self.assertListEqual([recipe['recipe_id'] for recipe in response.get_json()['recipes']], [self.lasagne_id, self.pesto_id])
+
+        query['cursor'] = response.headers[NEXT_CURSOR_HEADER]
+        response = self.client.get('/search', headers=header, query_string=query)
+        self.assertListEqual([recipe['recipe_id'] for recipe in response.get_json()['recipes']], [self.carbonara_id])
+        self.assertNotIn(NEXT_CURSOR_HEADER, response.headers)
+
+    def test_non_ascii_ingredients_match(self):
+        # SQLite's lower() leaves non-ASCII letters alone, while the filters are lowercased in Python
+        brulee_id = self.add_recipe(self.user_id, 'Brulee', ['french'], ['CRÈME', 'Sugar'], difficulty=3, total_time_needed=3600)
+        response = self.client.get('/search', headers=self.auth_header(self.user_id), query_string={'ingredients': 'CRÈME'})
+        data = response.get_json()
+        self.assertListEqual([recipe['recipe_id'] for recipe in data['recipes']], [brulee_id])
+        self.assertEqual(data['facets']['ingredients']['crème'], 1)
+
+    def test_stale_snapshots_leave_out_private_recipes(self):
+        # Another worker's write does not reach this worker's snapshot until it is refreshed
+        header = self.auth_header(self.user_id)
+        facet_index.get()
+        db.session.execute(db.text('UPDATE recipes SET is_public = 0 WHERE recipe_id = :recipe_id'), {'recipe_id': self.pesto_id})
+        db.session.commit()
+        self.assertListEqual(self.find(tags=['pasta']), [self.pesto_id, self.carbonara_id])
+
+        for view in ('full', 'summary'):
+            response = self.client.get('/search', headers=header, query_string={'tags': 'pasta', 'view': view})
+            self.assertListEqual([recipe['recipe_id'] for recipe in response.get_json()['recipes']], [self.carbonara_id])
+
+    def test_writes_refresh_the_index(self):
+        self.assertListEqual(self.find(tags=['thai']), [self.curry_id])
+        Recipe.get_by_id(self.curry_id).update(tags=[{'name': 'spicy'}])
+        self.assertListEqual(self.find(tags=['thai']), [])
+
+        Recipe.get_by_id(self.lasagne_id).remove_from_db()
+        self.assertListEqual(self.find(tags=['italian']), [self.pesto_id, self.carbonara_id])
+
+    def test_popular_tags_stay_fast(self):
+        first_id = self.private_id + 1
+        recipe_ids = range(first_id, first_id + POPULAR_RECIPE_COUNT)
+        db.session.bulk_insert_mappings(Recipe, [
+            {'recipe_id': recipe_id, 'user_id': self.user_id, 'name': 'Bulk', 'is_public': True, 'difficulty': recipe_id % 5, 'total_time_needed': recipe_id % 7200}
+            for recipe_id in recipe_ids
+        ])
+        db.session.bulk_insert_mappings(RecipeTag, [{'recipe_id': recipe_id, 'name': 'italian'} for recipe_id in recipe_ids])
+        db.session.bulk_insert_mappings(RecipeTag, [{'recipe_id': recipe_id, 'name': 'easy'} for recipe_id in recipe_ids if recipe_id % 2])
+        db.session.bulk_insert_mappings(RecipeIngredient, [{'recipe_id': recipe_id, 'name': 'Salt'} for recipe_id in recipe_ids if recipe_id % 3])
+        db.session.commit()
+        snapshot = facet_index.get()
+
+        start = time.perf_counter()
+        facet_filter = FacetFilter(tags=['italian', 'easy'], exclude_ingredients=['salt'], max_difficulty=3, max_total_time_needed=3600)
+        result = snapshot.find(facet_filter)
+        recipe_ids, next_cursor = page_recipe_ids(result, PageRequest())
+        counts = snapshot.count(result, facet_filter)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(recipe_ids), 50)
+        self.assertIsNotNone(next_cursor)
+        self.assertEqual(counts['tags']['easy'], count_bits(result))
+        self.assertTrue(all(recipe_id % 2 and not recipe_id % 3 and recipe_id % 5 <= 3 for recipe_id in recipe_ids))
+        self.assertLess(elapsed, SECONDS_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import unittest
+from datetime import datetime
+from unittest import mock
+from helpers import DbTestCase
+from app import db
+from models import FileDeletion, Recipe, RecipeImage, User
+import file_cleanup
+import file_manager as file_manager_module
+from moto import mock_aws
+
+
+class RecordingFileManager:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.batches = []
+
+    def delete_many(self, file_ids):
+        self.batches.append(list(file_ids))
+        return {file_id: 'AccessDenied' for file_id in file_ids if file_id in self.failing}
+
+
+class TestFileDeletionQueue(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(username='chef', password_hash='hash')
+        user.add_to_db()
+        recipe = Recipe(user_id=user.user_id, name='Pizza', is_public=True)
+        recipe.add_to_db()
+        self.user_id = user.user_id
+        self.recipe_id = recipe.recipe_id
+        for number in range(3):
+            RecipeImage(file_id=f'image-{number}', recipe_id=self.recipe_id, is_icon=number == 0).add_to_db()
+
+    def test_recipe_delete_queues_images(self):
+        manager = RecordingFileManager()
+        with mock.patch.object(file_cleanup, 'file_manager', manager):
+            response = self.client.delete(f'/recipes/{self.recipe_id}', headers=self.auth_header(self.user_id))
+            self.assertEqual(response.status_code, 204)
+            self.assertListEqual(manager.batches, [])
+            self.assertEqual(FileDeletion.query.count(), 3)
+
+            self.assertTupleEqual(file_cleanup.drain_file_deletions(), (3, 0))
+
+        self.assertListEqual(sorted(manager.batches[0]), ['image-0', 'image-1', 'image-2'])
+        self.assertEqual(FileDeletion.query.count(), 0)
+
+    def test_failed_deletes_are_retried_later(self):
+        FileDeletion.queue(['image-0', 'image-1'])
+        db.session.commit()
+
+        manager = RecordingFileManager(failing=['image-1'])
+        with mock.patch.object(file_cleanup, 'file_manager', manager):
+            self.assertTupleEqual(file_cleanup.drain_file_deletions(), (1, 1))
+            # Not due again until the backoff has passed
+            self.assertTupleEqual(file_cleanup.drain_file_deletions(), (0, 0))
+
+        file_deletion = FileDeletion.query.one()
+        self.assertEqual(file_deletion.file_id, 'image-1')
+        self.assertEqual(file_deletion.attempts, 1)
+        self.assertEqual(file_deletion.last_error, 'AccessDenied')
+        self.assertGreater(file_deletion.next_attempt_at, datetime.now())
+
+    def test_deletes_are_batched(self):
+        FileDeletion.queue([f'file-{number}' for number in range(2500)])
+        db.session.commit()
+
+        manager = RecordingFileManager()
+        with mock.patch.object(file_cleanup, 'file_manager', manager):
+            self.assertTupleEqual(file_cleanup.drain_file_deletions(), (2500, 0))
+        self.assertListEqual([len(batch) for batch in manager.batches], [1000, 1000, 500])
+
+
+class TestS3FileManager(unittest.TestCase):
+    def setUp(self):
+        self.env = mock.patch.dict(os.environ, {'AWS_DEFAULT_REGION': 'us-east-1'})
+        self.env.start()
+        self.s3 = mock_aws()
+        self.s3.start()
+        self.config = mock.patch.multiple(file_manager_module.config, AWS_BUCKET_NAME='sharecipe-test', AWS_ENDPOINT_URL=None)
+        self.config.start()
+
+        self.manager = file_manager_module.S3FileManager()
+        self.bucket = self.manager.s3_resource.create_bucket(Bucket='sharecipe-test')
+        for number in range(3):
+            self.bucket.put_object(Key=f'image-{number}', Body=b'jpeg')
+
+    def tearDown(self):
+        self.config.stop()
+        self.s3.stop()
+        self.env.stop()
+
+    def test_delete_many(self):
+        errors = self.manager.delete_many(['image-0', 'image-2'])
+        self.assertDictEqual(errors, {})
+        self.assertListEqual([s3_object.key for s3_object in self.bucket.objects.all()], ['image-1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
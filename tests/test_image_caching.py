@@ -0,0 +1,157 @@
+import os
+import unittest
+import uuid
+from unittest import mock
+from helpers import DbTestCase
+from file_manager import file_manager, get_time_created
+from models import Recipe, RecipeImage, User
+import file_manager as file_manager_module
+import image_responses
+import requests
+from moto import mock_aws
+
+
+IMAGE_BYTES = b'not really a jpeg, but bytes all the same'
+
+
+class TestImageCaching(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.file_id = str(uuid.uuid1())
+        with open(file_manager.get_local_path(self.file_id), 'wb') as file:
+            file.write(IMAGE_BYTES)
+
+        user = User(username='chef', password_hash='hash', profile_image_id=self.file_id)
+        user.add_to_db()
+        recipe = Recipe(user_id=user.user_id, name='Pizza', is_public=True)
+        recipe.add_to_db()
+        RecipeImage(file_id=self.file_id, recipe_id=recipe.recipe_id, is_icon=True).add_to_db()
+        self.user_id = user.user_id
+        self.recipe_id = recipe.recipe_id
+        self.header = self.auth_header(self.user_id)
+
+    def get(self, url: str, **headers):
+        return self.client.get(url, headers={**self.header, **headers})
+
+    def test_images_are_immutable(self):
+        url = f'/recipes/{self.recipe_id}/images/{self.file_id}'
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, IMAGE_BYTES)
+        self.assertEqual(response.headers['ETag'], f'"{self.file_id}"')
+        self.assertTrue(response.cache_control.immutable)
+        self.assertTrue(response.cache_control.public)
+        self.assertGreater(response.cache_control.max_age, 0)
+        self.assertEqual(response.last_modified, get_time_created(self.file_id).replace(microsecond=0))
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        last_modified = response.headers['Last-Modified']
+
+        # Revalidations never fetch the file
+        with mock.patch.object(image_responses.file_manager, 'download') as download:
+            response = self.get(url, **{'If-None-Match': f'"{self.file_id}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertTrue(response.cache_control.immutable)
+        download.assert_not_called()
+
+        response = self.get(url, **{'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+    def test_ranges(self):
+        url = f'/recipes/{self.recipe_id}/images/{self.file_id}'
+        response = self.get(url, Range='bytes=4-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, IMAGE_BYTES[4:10])
+        self.assertEqual(response.headers['Content-Range'], f'bytes 4-9/{len(IMAGE_BYTES)}')
+
+        response = self.get(url, Range=f'bytes={len(IMAGE_BYTES)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_replaceable_images_are_revalidated(self):
+        for url in (f'/recipes/{self.recipe_id}/icon', f'/users/{self.user_id}/profileimage'):
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, IMAGE_BYTES)
+            self.assertTrue(response.cache_control.no_cache)
+            self.assertFalse(response.cache_control.immutable)
+
+            response = self.get(url, **{'If-None-Match': response.headers['ETag']})
+            self.assertEqual(response.status_code, 304)
+
+
+
+class TestPresignedImageUrls(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.env = mock.patch.dict(os.environ, {'AWS_DEFAULT_REGION': 'us-east-1'})
+        self.env.start()
+        self.s3 = mock_aws()
+        self.s3.start()
+        self.config = mock.patch.multiple(file_manager_module.config, AWS_BUCKET_NAME='sharecipe-test', AWS_ENDPOINT_URL=None, IMAGE_URL_MODE='redirect')
+        self.config.start()
+
+        self.manager = file_manager_module.S3FileManager()
+        self.manager.s3_resource.create_bucket(Bucket='sharecipe-test')
+        self.file_id = str(uuid.uuid1())
+        self.manager.s3_resource.Bucket('sharecipe-test').put_object(Key=self.file_id, Body=IMAGE_BYTES)
+        self.file_manager = mock.patch.object(image_responses, 'file_manager', self.manager)
+        self.file_manager.start()
+
+        user = User(username='chef', password_hash='hash')
+        user.add_to_db()
+        recipe = Recipe(user_id=user.user_id, name='Pizza', is_public=True)
+        recipe.add_to_db()
+        RecipeImage(file_id=self.file_id, recipe_id=recipe.recipe_id, is_icon=True).add_to_db()
+        self.url = f'/recipes/{recipe.recipe_id}/images/{self.file_id}'
+        self.icon_url = f'/recipes/{recipe.recipe_id}/icon'
+        self.header = self.auth_header(user.user_id)
+
+    def tearDown(self):
+        self.file_manager.stop()
+        self.config.stop()
+        self.s3.stop()
+        self.env.stop()
+        super().tearDown()
+
+    def test_redirect(self):
+        response = self.client.get(self.url, headers=self.header)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.cache_control.private)
+        location = response.headers['Location']
+        self.assertEqual(requests.get(location).content, IMAGE_BYTES)
+        # The app never pulled the bytes itself
+        self.assertFalse(os.path.isfile(self.manager.get_local_path(self.file_id)))
+
+        self.assertEqual(self.client.get(self.url, headers=self.header).headers['Location'], location)
+        self.assertGreater(response.cache_control.max_age, 0)
+
+        # The icon can be replaced, so its redirect must not be reused
+        response = self.client.get(self.icon_url, headers=self.header)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.cache_control.no_cache)
+        self.assertIsNone(response.cache_control.max_age)
+
+    def test_json(self):
+        with mock.patch.object(file_manager_module.config, 'IMAGE_URL_MODE', 'json'):
+            response = self.client.get(self.url, headers=self.header)
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertGreater(body['expires_in'], 0)
+        self.assertEqual(requests.get(body['url']).content, IMAGE_BYTES)
+
+    def test_urls_are_signed_again_near_expiry(self):
+        url, expires_in = self.manager.get_download_url(self.file_id)
+        self.assertEqual(self.manager.get_download_url(self.file_id)[0], url)
+
+        now = file_manager_module.time.time()
+        with mock.patch.object(file_manager_module.time, 'time', return_value=now + expires_in - file_manager_module.PRESIGNED_URL_MIN_REMAINING_SECONDS):
+            new_url, new_expires_in = self.manager.get_download_url(self.file_id)
+        self.assertNotEqual(new_url, url)
+        self.assertEqual(new_expires_in, expires_in)
+
+        self.manager.delete(self.file_id)
+        self.assertNotIn(self.file_id, self.manager.download_urls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import os
+import unittest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import upgrade
+from helpers import DbTestCase
+from app import db
+import query_plans
+import search_index
+
+
+MIGRATIONS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+class TestMigrations(DbTestCase):
+    def create_schema(self):
+        upgrade(directory=MIGRATIONS_DIRECTORY)
+
+    def test_migrations_match_models(self):
+        context = MigrationContext.configure(db.session.connection(), opts={'include_object': search_index.include_object})
+        self.assertListEqual(compare_metadata(context, db.metadata), [])
+
+    def test_hot_queries_use_indexes(self):
+        self.assertDictEqual(query_plans.check_hot_queries(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+from datetime import datetime, timedelta
+from helpers import DbTestCase
+from app import db
+from models import Recipe, RecipeLike, RecipeReview, User, UserFollow
+from pagination import NEXT_CURSOR_HEADER
+
+
+FAN_COUNT = 7
+
+
+class TestPagination(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        star = User(username='star', password_hash='hash')
+        star.add_to_db()
+        self.star_id = star.user_id
+
+        recipe = Recipe(user_id=self.star_id, name='Famous Pie', is_public=True)
+        recipe.add_to_db()
+        self.recipe_id = recipe.recipe_id
+
+        # Half of the fans share a timestamp, so the tiebreaker has to keep pages apart
+        start = datetime(2021, 1, 1)
+        self.fan_ids = []
+        for number in range(FAN_COUNT):
+            fan = User(username=f'pie fan {number}', password_hash='hash')
+            db.session.add(fan)
+            db.session.flush()
+            created = start + timedelta(minutes=number // 2)
+            db.session.add(UserFollow(user_id=fan.user_id, follow_id=self.star_id, time_created=created))
+            db.session.add(RecipeLike(recipe_id=self.recipe_id, user_id=fan.user_id, time_created=created))
+            db.session.add(RecipeReview(recipe_id=self.recipe_id, user_id=fan.user_id, rating=5, time_created=created))
+            self.fan_ids.append(fan.user_id)
+        db.session.commit()
+
+    def get_all_pages(self, url: str, limit: int, key=lambda item: item['user_id']):
+        header = self.auth_header(self.star_id)
+        items, pages = [], 0
+        cursor = None
+        while True:
+            query = {'limit': limit}
+            if cursor:
+                query['cursor'] = cursor
+            response = self.client.get(url, headers=header, query_string=query)
+            self.assertEqual(response.status_code, 200)
+            data = response.get_json()
+            self.assertLessEqual(len(data), limit)
+            items.extend(key(item) for item in data)
+            pages += 1
+            cursor = response.headers.get(NEXT_CURSOR_HEADER)
+            if not cursor:
+                return items, pages
+
+    def test_followers_are_paged_newest_first(self):
+        user_ids, pages = self.get_all_pages(f'/users/{self.star_id}/followers', 3)
+        self.assertEqual(pages, 3)
+        self.assertListEqual(user_ids, list(reversed(self.fan_ids)))
+
+    def test_follow_lists_flag_mutual_follows(self):
+        UserFollow(user_id=self.star_id, follow_id=self.fan_ids[0]).add_to_db()
+        header = self.auth_header(self.star_id)
+        with self.count_queries() as statements:
+            response = self.client.get(f'/users/{self.star_id}/followers', headers=header)
+        self.assertEqual(len(statements), 1)
+        mutual = {user['user_id']: user['is_mutual'] for user in response.get_json()}
+        self.assertDictEqual(mutual, {fan_id: fan_id == self.fan_ids[0] for fan_id in self.fan_ids})
+
+        response = self.client.get(f'/users/{self.fan_ids[0]}/follows', headers=self.auth_header(self.fan_ids[0]))
+        self.assertListEqual([(user['user_id'], user['is_mutual']) for user in response.get_json()], [(self.star_id, True)])
+        response = self.client.get(f'/users/{self.fan_ids[1]}/followers', headers=header)
+        self.assertListEqual(response.get_json(), [])
+        response = self.client.get('/users/999/followers', headers=header)
+        self.assertEqual(response.status_code, 404)
+
+    def test_likes_and_reviews_are_paged(self):
+        user_ids, _ = self.get_all_pages(f'/recipes/{self.recipe_id}/likes', 2)
+        self.assertListEqual(user_ids, list(reversed(self.fan_ids)))
+        user_ids, _ = self.get_all_pages(f'/recipes/{self.recipe_id}/reviews', 4)
+        self.assertListEqual(user_ids, list(reversed(self.fan_ids)))
+
+    def test_user_recipes_are_paged(self):
+        for number in range(4):
+            Recipe(user_id=self.star_id, name=f'Pie {number}', is_public=True).add_to_db()
+        recipe_ids, pages = self.get_all_pages(f'/users/{self.star_id}/recipes', 2, key=lambda item: item['recipe_id'])
+        self.assertEqual(pages, 3)
+        self.assertListEqual(recipe_ids, sorted(recipe_ids, reverse=True))
+        self.assertEqual(len(set(recipe_ids)), 5)
+
+    def test_liked_recipes_are_paged_by_like_time(self):
+        fan_id = self.fan_ids[0]
+        liked = datetime(2021, 2, 1)
+        first = Recipe(user_id=self.star_id, name='Tart', is_public=True)
+        second = Recipe(user_id=self.star_id, name='Crumble', is_public=True)
+        own_private = Recipe(user_id=self.star_id, name='Draft pie', is_public=False)
+        other_private = Recipe(user_id=self.fan_ids[1], name='Secret pie', is_public=False)
+        for recipe in (first, second, own_private, other_private):
+            recipe.add_to_db()
+        db.session.add(RecipeLike(recipe_id=first.recipe_id, user_id=fan_id, time_created=liked))
+        db.session.add(RecipeLike(recipe_id=second.recipe_id, user_id=fan_id, time_created=liked))
+        db.session.add(RecipeLike(recipe_id=own_private.recipe_id, user_id=fan_id, time_created=liked - timedelta(days=1)))
+        db.session.add(RecipeLike(recipe_id=other_private.recipe_id, user_id=fan_id, time_created=liked + timedelta(days=1)))
+        db.session.commit()
+
+        # Private recipes are only listed for their owner
+        recipe_ids, pages = self.get_all_pages(f'/users/{fan_id}/recipes/likes', 2, key=lambda item: item['recipe_id'])
+        self.assertEqual(pages, 2)
+        self.assertListEqual(recipe_ids, [second.recipe_id, first.recipe_id, own_private.recipe_id, self.recipe_id])
+
+        response = self.client.get(f'/users/{fan_id}/recipes/likes', headers=self.auth_header(fan_id), query_string={'view': 'summary', 'limit': 2})
+        self.assertListEqual([recipe['recipe_id'] for recipe in response.get_json()], [second.recipe_id, first.recipe_id])
+        self.assertNotIn('steps', response.get_json()[0])
+
+    def test_search_pages_recipes_and_returns_closest_users_once(self):
+        header = self.auth_header(self.star_id)
+        for number in range(4):
+            Recipe(user_id=self.star_id, name=f'Apple pie {number}', is_public=True).add_to_db()
+
+        users, recipes = [], []
+        query = {'search_string': 'pie', 'limit': 3}
+        while True:
+            response = self.client.get('/search', headers=header, query_string=query)
+            self.assertEqual(response.status_code, 200)
+            users.append([user['user_id'] for user in response.get_json()['users']])
+            recipes.extend(recipe['recipe_id'] for recipe in response.get_json()['recipes'])
+            if NEXT_CURSOR_HEADER not in response.headers:
+                break
+            query['cursor'] = response.headers[NEXT_CURSOR_HEADER]
+        self.assertEqual(len(users), 2)
+        self.assertEqual(len(users[0]), 3)
+        self.assertTrue(set(users[0]) <= set(self.fan_ids))
+        self.assertListEqual(users[1], [])
+        self.assertEqual(len(set(recipes)), 5)
+
+    def test_invalid_arguments_are_rejected(self):
+        header = self.auth_header(self.star_id)
+        for query in ({'cursor': 'not-a-cursor'}, {'cursor': 'WzEsMl0'}, {'limit': 0}, {'limit': 'ten'}):
+            response = self.client.get(f'/users/{self.star_id}/followers', headers=header, query_string=query)
+            self.assertEqual(response.status_code, 400, query)
+        response = self.client.get('/search', headers=header, query_string={'search_string': 'pie', 'cursor': 'WzEsMl0'})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from helpers import DbTestCase
+from facet_index import facet_index
+from trigram_index import username_index
+from discover_feed import discover_index
+from app import db
+from models import Recipe, RecipeImage, RecipeLike, RecipeStep, User, UserFollow
+
+
+class TestRecipeListQueryCount(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(username='chef', password_hash='hash')
+        user.add_to_db()
+        viewer = User(username='viewer', password_hash='hash')
+        viewer.add_to_db()
+        self.user_id = user.user_id
+        self.viewer_id = viewer.user_id
+        UserFollow(user_id=self.viewer_id, follow_id=self.user_id).add_to_db()
+
+    def add_recipes(self, count: int):
+        for _ in range(count):
+            recipe_id = self.add_recipe(self.user_id, 'Fried rice', ['rice', 'chinese'], ['Rice'],
+                steps=[RecipeStep(step_number=1, description='Fry.'), RecipeStep(step_number=2, description='Serve.')])
+            RecipeImage(file_id=f'image-{recipe_id}', recipe_id=recipe_id, is_icon=True).add_to_db()
+
+    def query_count_for(self, url: str, user_id: int):
+        header = self.auth_header(user_id)
+        # Per-worker indexes are rebuilt on their own schedule, not for every request
+        facet_index.get()
+        username_index.refresh()
+        discover_index.get()
+        with self.count_queries() as statements:
+            response = self.client.get(url, headers=header)
+        self.assertEqual(response.status_code, 200)
+        return len(statements)
+
+    def assertConstantQueries(self, url: str, user_id: int):
+        self.add_recipes(2)
+        small = self.query_count_for(url, user_id)
+        self.add_recipes(20)
+        large = self.query_count_for(url, user_id)
+        self.assertEqual(small, large)
+
+    def test_user_recipes(self):
+        self.assertConstantQueries(f'/users/{self.user_id}/recipes', self.user_id)
+
+    def test_search(self):
+        self.assertConstantQueries('/search?search_string=rice', self.viewer_id)
+
+    def test_discover(self):
+        self.assertConstantQueries('/discover?view=summary', self.viewer_id)
+
+    def test_user_recipe_likes(self):
+        counts = []
+        for count in (2, 20):
+            self.add_recipes(count)
+            liked = db.session.query(RecipeLike.recipe_id)
+            for recipe_id, in db.session.query(Recipe.recipe_id).filter(Recipe.recipe_id.not_in(liked)).all():
+                RecipeLike(recipe_id=recipe_id, user_id=self.viewer_id).add_to_db()
+            counts.append(self.query_count_for(f'/users/{self.viewer_id}/recipes/likes', self.user_id))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_get_for_ids(self):
+        self.add_recipes(10)
+        recipe_ids = [recipe_id for recipe_id, in db.session.query(Recipe.recipe_id)]
+        with self.count_queries() as statements:
+            recipes = Recipe.get_for_ids(recipe_ids)
+            for recipe in recipes:
+                recipe.steps, recipe.ingredients, recipe.images, recipe.tags, recipe.icon
+        # Recipes, then one SELECT ... IN for each relationship
+        self.assertEqual(len(statements), 6)
+
+
+class TestEntityLoader(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(username='chef', password_hash='hash')
+        user.add_to_db()
+        self.user_id = user.user_id
+        recipe = Recipe(user_id=self.user_id, name='Fried rice', is_public=True)
+        recipe.add_to_db()
+        self.recipe_id = recipe.recipe_id
+
+    def request(self, method: str, url: str, user_id: int, expected_status: int, **kwargs):
+        header = self.auth_header(user_id)
+        with self.count_queries() as statements:
+            response = self.client.open(url, method=method, headers=header, **kwargs)
+        self.assertEqual(response.status_code, expected_status)
+        return [statement for statement in statements if statement.startswith('SELECT')]
+
+    def test_recipe_is_loaded_once(self):
+        selects = self.request('PATCH', f'/recipes/{self.recipe_id}', self.user_id, 200, json={'name': 'Egg fried rice'})
+        self.assertEqual(len([select for select in selects if select.startswith('SELECT recipes.')]), 1)
+        self.assertFalse([select for select in selects if 'EXISTS' in select])
+        self.assertEqual(Recipe.get_by_id(self.recipe_id).name, 'Egg fried rice')
+
+        other = User(username='other', password_hash='hash')
+        other.add_to_db()
+        self.request('PATCH', f'/recipes/{self.recipe_id}', other.user_id, 403, json={'name': 'Stolen rice'})
+        self.request('DELETE', f'/recipes/{self.recipe_id + 1}', self.user_id, 403)
+
+    def test_like_proves_recipe_and_user_exist(self):
+        url = f'/recipes/{self.recipe_id}/likes/{self.user_id}'
+        self.assertEqual(len(self.request('GET', url, self.user_id, 200)), 3)
+        RecipeLike(recipe_id=self.recipe_id, user_id=self.user_id).add_to_db()
+        self.assertEqual(len(self.request('GET', url, self.user_id, 200)), 1)
+        self.request('GET', f'/recipes/{self.recipe_id}/likes/{self.user_id + 1}', self.user_id, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from datetime import datetime
+from helpers import DbTestCase
+from app import db
+from models import Recipe, RecipeIngredient, RecipeStep, RecipeTag, User
+
+
+STEP_COUNT = 200
+STATEMENT_BUDGET = 10
+
+
+class TestRecipePatch(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(username='chef', password_hash='hash')
+        user.add_to_db()
+        self.user_id = user.user_id
+
+        self.old_time = datetime(2020, 1, 1)
+        recipe = Recipe(user_id=self.user_id, name='Lasagne', is_public=True, time_created=self.old_time, time_modified=self.old_time)
+        recipe.steps = [
+            RecipeStep(step_number=number, description=f'Step {number}.', time_created=self.old_time, time_modified=self.old_time)
+            for number in range(1, STEP_COUNT + 1)
+        ]
+        recipe.ingredients = [
+            RecipeIngredient(name='Pasta', quantity=500, unit='g', time_created=self.old_time, time_modified=self.old_time),
+            RecipeIngredient(name='Tomato', quantity=4, time_created=self.old_time, time_modified=self.old_time),
+        ]
+        recipe.tags = [RecipeTag(name='italian'), RecipeTag(name='pasta')]
+        db.session.add(recipe)
+        db.session.commit()
+        self.recipe_id = recipe.recipe_id
+
+    def patch(self, data: dict):
+        return self.client.patch(f'/recipes/{self.recipe_id}', headers=self.auth_header(self.user_id), json=data)
+
+    def recipe_data(self):
+        return {
+            'name': 'Lasagne',
+            'steps': [{'step_number': number, 'description': f'Step {number}.'} for number in range(1, STEP_COUNT + 1)],
+            'ingredients': [{'name': 'Pasta', 'quantity': 500.0, 'unit': 'g'}, {'name': 'Tomato', 'quantity': 4.0}],
+            'tags': [{'name': 'italian'}, {'name': 'pasta'}],
+        }
+
+    def write_statements(self, statements):
+        return [statement for statement in statements if statement.split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+
+    def test_single_step_edit_writes_only_that_step(self):
+        data = self.recipe_data()
+        data['steps'][41]['description'] = 'Stir well.'
+        with self.count_queries() as statements:
+            response = self.patch(data)
+        self.assertEqual(response.status_code, 200)
+
+        writes = self.write_statements(statements)
+        self.assertEqual(len(writes), 2, writes)
+        self.assertTrue(any(write.startswith('UPDATE recipe_steps') for write in writes))
+        self.assertTrue(any(write.startswith('UPDATE recipes') for write in writes))
+        self.assertLessEqual(len(statements), STATEMENT_BUDGET)
+
+        steps = {step.step_number: step for step in RecipeStep.get_for_recipe_id(self.recipe_id)}
+        self.assertEqual(steps[42].description, 'Stir well.')
+        self.assertGreater(steps[42].time_modified, self.old_time)
+        self.assertEqual(steps[41].time_modified, self.old_time)
+        self.assertGreater(Recipe.get_by_id(self.recipe_id).time_modified, self.old_time)
+
+    def test_unchanged_patch_writes_nothing(self):
+        with self.count_queries() as statements:
+            response = self.patch(self.recipe_data())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.write_statements(statements), [])
+        self.assertEqual(Recipe.get_by_id(self.recipe_id).time_modified, self.old_time)
+
+    def test_children_are_inserted_updated_and_deleted(self):
+        data = self.recipe_data()
+        data['steps'] = data['steps'][:-1]
+        data['ingredients'] = [{'name': 'Pasta', 'quantity': 400.0, 'unit': 'g'}, {'name': 'Basil', 'quantity': 1.0}]
+        data['tags'] = [{'name': 'italian'}, {'name': 'baked'}]
+        response = self.patch(data)
+        self.assertEqual(response.status_code, 200)
+
+        db.session.expunge_all()
+        recipe = Recipe.get_by_id(self.recipe_id)
+        self.assertEqual(len(recipe.steps), STEP_COUNT - 1)
+        ingredients = {ingredient.name: ingredient for ingredient in recipe.ingredients}
+        self.assertEqual(set(ingredients), {'Pasta', 'Basil'})
+        self.assertEqual(ingredients['Pasta'].quantity, 400)
+        self.assertEqual(sorted(tag.name for tag in recipe.tags), ['baked', 'italian'])
+        self.assertEqual(RecipeIngredient.query.filter_by(name='Tomato').count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from helpers import DbTestCase
+from models import Recipe, RecipeImage, RecipeLike, RecipeStep, User
+
+
+class TestRecipeSummary(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(username='chef', password_hash='hash')
+        user.add_to_db()
+        fan = User(username='fan', password_hash='hash')
+        fan.add_to_db()
+        self.user_id = user.user_id
+        self.fan_id = fan.user_id
+
+        recipe = Recipe(user_id=self.user_id, name='Nasi Lemak', description='x' * 2000, difficulty=3,
+            total_time_needed=1800, is_public=True, steps=[RecipeStep(step_number=1, description='Cook rice.')])
+        recipe.add_to_db()
+        self.recipe_id = recipe.recipe_id
+        RecipeImage(file_id='icon', recipe_id=self.recipe_id, is_icon=True).add_to_db()
+        RecipeImage(file_id='other', recipe_id=self.recipe_id).add_to_db()
+        RecipeLike(recipe_id=self.recipe_id, user_id=self.fan_id).add_to_db()
+        Recipe(user_id=self.user_id, name='Secret Nasi Lemak', is_public=False).add_to_db()
+
+    def test_summary_view(self):
+        header = self.auth_header(self.fan_id)
+        with self.count_queries() as statements:
+            response = self.client.get(f'/users/{self.user_id}/recipes?view=summary', headers=header)
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([summary['recipe_id'] for summary in response.json], [self.recipe_id])
+
+        summary = response.json[0]
+        self.assertEqual(summary['icon_id'], 'icon')
+        self.assertEqual(summary['like_count'], 1)
+        self.assertEqual(summary['difficulty'], 3)
+        self.assertNotIn('description', summary)
+        self.assertNotIn('steps', summary)
+        self.assertEqual(len(statements), 1)
+
+    def test_search_summary_view(self):
+        header = self.auth_header(self.user_id)
+        response = self.client.get('/search?search_string=Nasi&view=summary', headers=header)
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([summary['name'] for summary in response.json['recipes']], ['Nasi Lemak'])
+
+    def test_full_view_is_default(self):
+        header = self.auth_header(self.user_id)
+        response = self.client.get(f'/users/{self.user_id}/recipes', headers=header)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 2)
+        self.assertIn('steps', response.json[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from helpers import DbTestCase
+from app import db
+from models import Recipe, RecipeSummary, User
+from pagination import PageRequest
+from search_index import search_index
+
+
+class TestSearchIndex(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(username='mario_rossi', password_hash='hash', bio='Baking bread in Napoli')
+        user.add_to_db()
+        self.user_id = user.user_id
+
+        self.pizza_id = self.add_recipe(self.user_id, 'Margherita Pizza', description='Classic pie.', tags=['italian'], ingredients=['Mozzarella', 'Basil'])
+        self.bread_id = self.add_recipe(self.user_id, 'Focaccia', description='Flat bread, tastes like pizza dough.', tags=['bread'], ingredients=['Flour'])
+        self.private_id = self.add_recipe(self.user_id, 'Secret Pizza', description='Nobody may see this.', is_public=False)
+
+    def search_ids(self, search_string: str):
+        recipes, _ = Recipe.search(search_string, PageRequest())
+        return [recipe.recipe_id for recipe in recipes]
+
+    def test_results_are_ranked_and_public_only(self):
+        self.assertListEqual(self.search_ids('pizza'), [self.pizza_id, self.bread_id])
+        self.assertListEqual([recipe.recipe_id for recipe in RecipeSummary.search('pizza', PageRequest())[0]], [self.pizza_id, self.bread_id])
+
+    def test_tags_ingredients_and_prefixes_match(self):
+        self.assertListEqual(self.search_ids('ital'), [self.pizza_id])
+        self.assertListEqual(self.search_ids('mozzarella basil'), [self.pizza_id])
+        self.assertListEqual(self.search_ids('flour'), [self.bread_id])
+        self.assertListEqual(self.search_ids('"flour*" ('), [self.bread_id])
+
+    def test_index_follows_writes(self):
+        recipe = Recipe.get_by_id(self.bread_id)
+        recipe.update(name='Ciabatta', tags=[{'name': 'rustic'}])
+        self.assertListEqual(self.search_ids('focaccia'), [])
+        self.assertListEqual(self.search_ids('rustic ciabatta'), [self.bread_id])
+
+        Recipe.get_by_id(self.private_id).update(is_public=True)
+        self.assertIn(self.private_id, self.search_ids('secret'))
+
+        Recipe.get_by_id(self.pizza_id).remove_from_db()
+        self.assertListEqual(self.search_ids('margherita'), [])
+        self.assertEqual(db.session.execute(db.text('SELECT count(*) FROM search_recipes')).scalar(), 2)
+
+    def test_users_are_searched_by_username_and_bio(self):
+        self.assertListEqual([user.user_id for user in User.search('rossi', PageRequest())[0]], [self.user_id])
+        self.assertListEqual([user.user_id for user in User.search('napoli', PageRequest())[0]], [self.user_id])
+
+        User.get_by_id(self.user_id).remove_from_db()
+        self.assertListEqual(User.search('rossi', PageRequest())[0], [])
+        self.assertEqual(db.session.execute(db.text('SELECT count(*) FROM search_recipes')).scalar(), 0)
+        self.assertEqual(db.session.execute(db.text('SELECT count(*) FROM search_users')).scalar(), 0)
+
+    def test_empty_search_lists_public_recipes(self):
+        self.assertCountEqual(self.search_ids(''), [self.pizza_id, self.bread_id])
+
+    def test_search_endpoint(self):
+        response = self.client.get('/search?search_string=pizza', headers=self.auth_header(self.user_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual([recipe['recipe_id'] for recipe in response.get_json()['recipes']], [self.pizza_id, self.bread_id])
+
+    @unittest.skipUnless(db.engine.dialect.name == 'sqlite', 'SQLite query plan')
+    def test_search_uses_full_text_index(self):
+        query = search_index.to_query(['pizza'])
+        plan = db.session.execute(db.text('EXPLAIN QUERY PLAN ' + search_index.search_recipes_statement), {'query': query, 'score': None, 'id': None, 'limit': 50}).all()
+        details = ' '.join(row[-1] for row in plan)
+        self.assertIn('VIRTUAL TABLE INDEX', details)
+        self.assertNotIn('SCAN recipes', details)
+
+
+if __name__ == '__main__':
+    unittest.main()
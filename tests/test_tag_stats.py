@@ -0,0 +1,79 @@
+import unittest
+from helpers import DbTestCase
+from models import Recipe, RecipeTag, TagStat, User
+from pagination import PageRequest
+from search_index import search_index
+from tag_stats import popular_tags
+
+
+class TestTagStats(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(username='chef', password_hash='hash')
+        user.add_to_db()
+        self.user_id = user.user_id
+        self.carbonara_id = self.add_recipe(self.user_id, 'Carbonara', ['Italian', 'pasta'])
+        self.pesto_id = self.add_recipe(self.user_id, 'Pesto', ['italian', 'pasta', 'vegetarian'])
+        self.curry_id = self.add_recipe(self.user_id, 'Curry', ['thai', 'Italian'])
+
+    def get_counts(self) -> dict:
+        return {name: usage_count for name, usage_count in TagStat.get_all()}
+
+    def test_usages_are_counted(self):
+        self.assertDictEqual(self.get_counts(), {'italian': 3, 'pasta': 2, 'vegetarian': 1, 'thai': 1})
+        self.assertListEqual(popular_tags.get_top(2), ['italian', 'pasta'])
+
+    def test_patches_update_counts(self):
+        Recipe.get_by_id(self.curry_id).update(tags=[{'name': 'thai'}, {'name': 'spicy'}])
+        self.assertDictEqual(self.get_counts(), {'italian': 2, 'pasta': 2, 'vegetarian': 1, 'thai': 1, 'spicy': 1})
+        self.assertListEqual(popular_tags.get_top(5), ['italian', 'pasta', 'spicy', 'thai', 'vegetarian'])
+
+        # Tags removed on their own are deleted as orphans, and must leave the search index too
+        recipe_ids, _ = search_index.search_recipes('spicy', PageRequest())
+        self.assertListEqual(recipe_ids, [self.curry_id])
+        Recipe.get_by_id(self.curry_id).update(tags=[{'name': 'thai'}])
+        self.assertNotIn('spicy', self.get_counts())
+        recipe_ids, _ = search_index.search_recipes('spicy', PageRequest())
+        self.assertListEqual(recipe_ids, [])
+
+    def test_deletes_update_counts(self):
+        Recipe.get_by_id(self.pesto_id).remove_from_db()
+        self.assertDictEqual(self.get_counts(), {'italian': 2, 'pasta': 1, 'thai': 1})
+
+        User.get_by_id(self.user_id).remove_from_db()
+        self.assertDictEqual(self.get_counts(), {})
+
+    def test_new_names_are_upserted(self):
+        # Names are never read before they are counted, so a transaction adding the same
+        # new name at the same time cannot make this insert fail
+        with self.count_queries() as statements:
+            self.add_recipe(self.user_id, 'Pad thai', ['thai', 'noodles'])
+        tag_stat_statements = [statement for statement in statements if 'tag_stats' in statement]
+        self.assertEqual(len(tag_stat_statements), 1)
+        self.assertIn('ON CONFLICT', tag_stat_statements[0])
+        self.assertEqual(self.get_counts()['thai'], 2)
+        self.assertEqual(self.get_counts()['noodles'], 1)
+
+    def test_non_ascii_names_match_their_stats(self):
+        # SQLite's lower() leaves non-ASCII letters alone, so names are matched normalized in Python
+        creme_id = self.add_recipe(self.user_id, 'Brulee', ['CRÈME'])
+        self.assertEqual(self.get_counts()['crème'], 1)
+        self.assertDictEqual(RecipeTag.get_latest_public_ids_for_names(['crème']), {'crème': [creme_id]})
+
+        tag = Recipe.get_by_id(creme_id).tags[0]
+        tag.update(name='Crêpe')
+        self.assertEqual(tag.normalized_name, 'crêpe')
+        self.assertDictEqual(RecipeTag.get_latest_public_ids_for_names(['crème', 'crêpe']), {'crème': [], 'crêpe': [creme_id]})
+
+    def test_suggestions_do_not_read_tags(self):
+        header = self.auth_header(self.user_id)
+        popular_tags.get()
+        with self.count_queries() as statements:
+            response = self.client.get('/recipes/tagsuggestions', headers=header)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue({'italian', 'pasta', 'vegetarian', 'thai'} <= set(response.get_json()))
+        self.assertFalse([statement for statement in statements if 'recipe_tags' in statement or 'tag_stats' in statement])
+
+
+if __name__ == '__main__':
+    unittest.main()
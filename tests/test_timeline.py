@@ -0,0 +1,95 @@
+import unittest
+from unittest import mock
+from helpers import DbTestCase
+from app import db
+from models import Recipe, TimelineCelebrity, TimelineEntry, UserFollow
+from pagination import NEXT_CURSOR_HEADER
+from timeline import BACKFILL_SIZE
+import config
+
+
+class TestTimeline(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader_id = self.add_user('reader')
+        self.chef_id = self.add_user('chef')
+        self.star_id = self.add_user('star')
+        self.old_recipe_id = self.add_recipe(self.chef_id, 'Old soup')
+        UserFollow(user_id=self.reader_id, follow_id=self.chef_id).add_to_db()
+
+    def get_timeline(self, **query):
+        response = self.client.get('/timeline', headers=self.auth_header(self.reader_id), query_string={'view': 'summary', **query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['recipe_id'] for recipe in response.get_json()], response.headers.get(NEXT_CURSOR_HEADER)
+
+    def test_follows_backfill_and_recipes_fan_out(self):
+        self.assertListEqual(self.get_timeline()[0], [self.old_recipe_id])
+
+        new_recipe_id = self.add_recipe(self.chef_id, 'New soup')
+        private_recipe_id = self.add_recipe(self.chef_id, 'Secret soup', is_public=False)
+        self.add_recipe(self.star_id, 'Unfollowed soup')
+        self.assertListEqual(self.get_timeline()[0], [new_recipe_id, self.old_recipe_id])
+
+        Recipe.get_by_id(private_recipe_id).update(is_public=True)
+        Recipe.get_by_id(new_recipe_id).update(is_public=False)
+        self.assertListEqual(self.get_timeline()[0], [private_recipe_id, self.old_recipe_id])
+
+        Recipe.get_by_id(self.old_recipe_id).remove_from_db()
+        self.assertListEqual(self.get_timeline()[0], [private_recipe_id])
+
+        UserFollow.get_by_id(self.reader_id, self.chef_id).remove_from_db()
+        self.assertListEqual(self.get_timeline()[0], [])
+        self.assertEqual(TimelineEntry.query.count(), 0)
+
+    def test_pages(self):
+        recipe_ids = [self.add_recipe(self.chef_id, f'Soup {number}') for number in range(4)][::-1] + [self.old_recipe_id]
+        page, cursor = self.get_timeline(limit=3)
+        self.assertListEqual(page, recipe_ids[:3])
+        page, cursor = self.get_timeline(limit=3, cursor=cursor)
+        self.assertListEqual(page, recipe_ids[3:])
+        self.assertIsNone(cursor)
+
+    def get_celebrity_ids(self):
+        return {celebrity.user_id for celebrity in TimelineCelebrity.query.all()}
+
+    def test_celebrities_are_merged_when_read(self):
+        with mock.patch.object(config, 'TIMELINE_FANOUT_FOLLOWER_LIMIT', 1):
+            UserFollow(user_id=self.chef_id, follow_id=self.star_id).add_to_db()
+            self.assertSetEqual(self.get_celebrity_ids(), set())
+            UserFollow(user_id=self.reader_id, follow_id=self.star_id).add_to_db()
+            self.assertSetEqual(self.get_celebrity_ids(), {self.star_id})
+
+            # Known to every worker from the first write, without a timeline read
+            star_ids = [self.add_recipe(self.star_id, f'Star soup {number}') for number in range(3)]
+            chef_id = self.add_recipe(self.chef_id, 'Chef soup')
+            self.assertEqual(TimelineEntry.query.filter_by(author_id=self.star_id).count(), 0)
+
+            expected = [chef_id, star_ids[2], star_ids[1], star_ids[0], self.old_recipe_id]
+            page, cursor = self.get_timeline(limit=2)
+            self.assertListEqual(page, expected[:2])
+            page, cursor = self.get_timeline(limit=2, cursor=cursor)
+            self.assertListEqual(page, expected[2:4])
+            page, cursor = self.get_timeline(limit=2, cursor=cursor)
+            self.assertListEqual(page, expected[4:])
+            self.assertIsNone(cursor)
+
+    def test_former_celebrities_are_backfilled(self):
+        with mock.patch.object(config, 'TIMELINE_FANOUT_FOLLOWER_LIMIT', 1):
+            UserFollow(user_id=self.chef_id, follow_id=self.star_id).add_to_db()
+            UserFollow(user_id=self.reader_id, follow_id=self.star_id).add_to_db()
+            star_ids = [self.add_recipe(self.star_id, f'Star soup {number}') for number in range(3)]
+
+            UserFollow.get_by_id(self.chef_id, self.star_id).remove_from_db()
+            self.assertSetEqual(self.get_celebrity_ids(), set())
+            self.assertListEqual(self.get_timeline()[0], star_ids[::-1] + [self.old_recipe_id])
+            self.assertEqual(TimelineEntry.query.filter_by(user_id=self.reader_id, author_id=self.star_id).count(), 3)
+            self.assertEqual(TimelineEntry.query.filter_by(user_id=self.chef_id).count(), 0)
+
+            # Backfills skip the entries already there, so a repeated one does not fail
+            TimelineEntry.backfill_followers(db.session.connection(), self.star_id, BACKFILL_SIZE)
+            db.session.commit()
+            self.assertEqual(TimelineEntry.query.filter_by(user_id=self.reader_id, author_id=self.star_id).count(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
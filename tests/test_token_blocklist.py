@@ -0,0 +1,108 @@
+import unittest
+from datetime import datetime, timedelta
+from helpers import DbTestCase
+from app import db
+from flask_jwt_extended import create_refresh_token
+from models import RevokedToken, User, unit_of_work
+from token_blocklist import RevokedTokenCache
+
+
+class TestRevokedTokenCache(DbTestCase):
+    def is_stored(self, jti: str) -> bool:
+        return RevokedToken.query.filter_by(jti=jti).count() > 0
+
+    def test_local_revoke_is_immediate(self):
+        cache = RevokedTokenCache(refresh_seconds=60)
+        self.assertFalse(cache.is_revoked('first'))
+        cache.revoke({'jti': 'first'})
+        self.assertTrue(cache.is_revoked('first'))
+        self.assertTrue(self.is_stored('first'))
+
+    def test_rolled_back_revoke_is_forgotten(self):
+        cache = RevokedTokenCache(refresh_seconds=60)
+        cache.refresh()
+        with self.assertRaises(ValueError):
+            with unit_of_work():
+                cache.revoke({'jti': 'rolled back'})
+                raise ValueError()
+        self.assertFalse(cache.is_revoked('rolled back'))
+        self.assertFalse(self.is_stored('rolled back'))
+
+    def test_not_revoked_answered_from_memory(self):
+        cache = RevokedTokenCache(refresh_seconds=60)
+        cache.refresh()
+        with self.count_queries() as statements:
+            self.assertFalse(cache.is_revoked('unknown'))
+        self.assertEqual(len(statements), 0)
+
+    def test_revocations_from_other_workers_seen_after_refresh(self):
+        cache = RevokedTokenCache(refresh_seconds=60)
+        cache.refresh()
+
+        other_worker = RevokedTokenCache(refresh_seconds=60)
+        other_worker.revoke({'jti': 'elsewhere'})
+        self.assertFalse(cache.is_revoked('elsewhere'))
+
+        cache.next_refresh = 0
+        self.assertTrue(cache.is_revoked('elsewhere'))
+
+    def test_refresh_rereads_overlap_window(self):
+        cache = RevokedTokenCache(refresh_seconds=0)
+        cache.revoke({'jti': 'newest'})
+        cache.refresh()
+
+        # Committed late by a slow worker, with an older revoke time
+        db.session.add(RevokedToken(jti='late', revoke_time=datetime.now().replace(microsecond=0)))
+        db.session.commit()
+        self.assertTrue(cache.is_revoked('late'))
+
+    def test_expired_tokens_are_dropped(self):
+        cache = RevokedTokenCache(refresh_seconds=60)
+        expired = datetime.now() - timedelta(minutes=1)
+        cache.revoke({'jti': 'expired', 'exp': expired.timestamp()})
+        cache.revoke({'jti': 'active', 'exp': (datetime.now() + timedelta(days=1)).timestamp()})
+
+        cache.refresh()
+        self.assertNotIn('expired', cache.revoked_jtis)
+        self.assertIn('active', cache.revoked_jtis)
+
+        fresh_cache = RevokedTokenCache(refresh_seconds=60)
+        fresh_cache.refresh()
+        self.assertListEqual(list(fresh_cache.revoked_jtis), ['active'])
+
+    def test_prune_expired(self):
+        now = datetime.now()
+        db.session.add_all([
+            RevokedToken(jti='expired', revoke_time=now, expires_at=now - timedelta(seconds=1)),
+            RevokedToken(jti='active', revoke_time=now, expires_at=now + timedelta(days=1)),
+            RevokedToken(jti='legacy old', revoke_time=now - timedelta(days=31)),
+            RevokedToken(jti='legacy recent', revoke_time=now - timedelta(days=1))
+        ])
+        db.session.commit()
+
+        self.assertEqual(RevokedToken.prune_expired(timedelta(days=30)), 2)
+        self.assertSetEqual({token.jti for token in RevokedToken.query}, {'active', 'legacy recent'})
+
+    def test_prune_expired_joins_unit_of_work(self):
+        now = datetime.now()
+        db.session.add(RevokedToken(jti='expired', revoke_time=now, expires_at=now - timedelta(seconds=1)))
+        db.session.commit()
+
+        with self.assertRaises(ValueError):
+            with unit_of_work():
+                self.assertEqual(RevokedToken.prune_expired(), 1)
+                raise ValueError()
+        self.assertTrue(self.is_stored('expired'))
+
+    def test_logout_revokes_token(self):
+        user = User(username='chef', password_hash='hash')
+        user.add_to_db()
+        header = {'Authorization': f'Bearer {create_refresh_token(identity=user.user_id)}'}
+        response = self.client.post('/account/logout', headers=header)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/account/logout', headers=header)
+        self.assertIn('revoked', response.json['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import io
+import unittest
+from PIL import Image
+from helpers import DbTestCase
+from app import db
+from models import Recipe, RecipeImage, RecipeLike, User, unit_of_work
+
+
+def make_image():
+    data = io.BytesIO()
+    Image.new('RGB', (8, 8), (200, 100, 50)).save(data, format='PNG')
+    data.seek(0)
+    return data
+
+
+class TestUnitOfWork(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        user = User(username='chef', password_hash='hash')
+        user.add_to_db()
+        recipe = Recipe(user_id=user.user_id, name='Pizza', is_public=True)
+        recipe.add_to_db()
+        self.user_id = user.user_id
+        self.recipe_id = recipe.recipe_id
+
+    def test_commits_once(self):
+        with self.count_commits() as commits:
+            with unit_of_work():
+                RecipeLike(recipe_id=self.recipe_id, user_id=self.user_id).add_to_db()
+                recipe = Recipe.get_by_id(self.recipe_id)
+                recipe.update(name='Round Pizza')
+                with unit_of_work():
+                    User(username='fan', password_hash='hash').add_to_db()
+                self.assertEqual(len(commits), 0)
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(Recipe.get_by_id(self.recipe_id).name, 'Round Pizza')
+
+    def test_rolls_back_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with unit_of_work():
+                User(username='fan', password_hash='hash').add_to_db()
+                raise RuntimeError()
+        self.assertIsNone(User.get_by_username('fan'))
+
+    def test_single_object_calls_still_commit(self):
+        with self.count_commits() as commits:
+            RecipeLike(recipe_id=self.recipe_id, user_id=self.user_id).add_to_db()
+        self.assertEqual(len(commits), 1)
+
+    def test_multi_image_upload_is_one_transaction(self):
+        header = self.auth_header(self.user_id)
+        images = [(make_image(), f'image{number}.png') for number in range(4)]
+        with self.count_commits() as commits:
+            response = self.client.put(f'/recipes/{self.recipe_id}/images', headers=header, data={'images': images})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(len(commits), 1)
+
+        recipe_images = RecipeImage.get_for_recipe_id(self.recipe_id)
+        self.assertEqual(len(recipe_images), 4)
+        self.assertEqual(sum(recipe_image.is_icon for recipe_image in recipe_images), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
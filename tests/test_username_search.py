@@ -0,0 +1,73 @@
+import time
+import unittest
+from helpers import DbTestCase
+from app import db
+from models import User
+from pagination import PageRequest
+from search_index import search_index
+from trigram_index import get_trigrams, username_index
+
+
+USER_COUNT = 50000
+SECONDS_BUDGET = 0.1
+
+
+class TestUsernameSearch(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user_ids = {}
+        for username in ('mario', 'marco_polo', 'Maria', 'luigi', 'princess_peach', 'bowser'):
+            user = User(username=username, password_hash='hash', bio='Plumbing since 1985' if username == 'luigi' else None)
+            user.add_to_db()
+            self.user_ids[username] = user.user_id
+
+    def names(self, user_ids):
+        users = {user.user_id: user.username for user in User.get_all_of_ids(user_ids)}
+        return [users[user_id] for user_id in user_ids]
+
+    def test_trigrams_are_padded_per_word(self):
+        self.assertSetEqual(get_trigrams('Ab_c'), {'  a', ' ab', 'ab ', '  c', ' c '})
+
+    def test_prefixes_come_first_alphabetically(self):
+        self.assertListEqual(self.names(search_index.find_usernames('Mar', 10)), ['marco_polo', 'Maria', 'mario'])
+        self.assertListEqual(self.names(search_index.find_usernames('mar', 2)), ['marco_polo', 'Maria'])
+
+    def test_typos_are_tolerated_and_ranked(self):
+        self.assertListEqual(self.names(search_index.find_usernames('marrio', 10))[:1], ['mario'])
+        self.assertIn('princess_peach', self.names(search_index.find_usernames('peach', 10)))
+        self.assertListEqual(search_index.find_usernames('xyz', 10), [])
+
+    def test_index_follows_writes(self):
+        User.get_by_id(self.user_ids['bowser']).update(username='koopa_king')
+        self.assertListEqual(self.names(search_index.find_usernames('koopa', 10)), ['koopa_king'])
+        self.assertListEqual(search_index.find_usernames('bowser', 10), [])
+
+        User.get_by_id(self.user_ids['luigi']).remove_from_db()
+        self.assertListEqual(search_index.find_usernames('luigi', 10), [])
+
+    def test_user_search_has_a_hard_limit_and_falls_back_to_bios(self):
+        users, next_cursor = User.search('ma', PageRequest(limit=2))
+        self.assertEqual(len(users), 2)
+        self.assertIsNone(next_cursor)
+        users, _ = User.search('plumbing', PageRequest(limit=5))
+        self.assertListEqual([user.username for user in users], ['luigi'])
+
+    def test_lookup_is_fast_enough_to_search_as_you_type(self):
+        db.session.bulk_insert_mappings(User, [
+            {'username': f'cook{number:05d}_{"abcdefghij"[number % 10]}', 'password_hash': 'hash'} for number in range(USER_COUNT)
+        ])
+        db.session.commit()
+        username_index.invalidate()
+        username_index.refresh()
+
+        start = time.perf_counter()
+        for query in ('c', 'co', 'coo', 'cook1', 'cook12', 'cook123', 'cok1234'):
+            found = search_index.find_usernames(query, 20)
+        elapsed = (time.perf_counter() - start) / 7
+
+        self.assertEqual(len(found), 20)
+        self.assertLess(elapsed, SECONDS_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
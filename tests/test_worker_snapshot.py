@@ -0,0 +1,44 @@
+import unittest
+from unittest import mock
+from sqlalchemy import event
+from helpers import DbTestCase
+from app import db
+from worker_snapshot import WorkerSnapshot
+
+
+class TestWorkerSnapshot(DbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.load = mock.Mock(side_effect=lambda: self.load.call_count)
+        self.snapshot = WorkerSnapshot(self.load, 3600, 'test_changed')
+
+    def tearDown(self):
+        event.remove(db.session, 'after_commit', self.snapshot.invalidate_if_changed)
+        event.remove(db.session, 'after_rollback', self.snapshot.forget_changes)
+        super().tearDown()
+
+    def test_value_is_reused_until_refreshed(self):
+        self.assertEqual(self.snapshot.get(), 1)
+        self.assertEqual(self.snapshot.get(), 1)
+        self.snapshot.invalidate()
+        self.assertEqual(self.snapshot.get(), 2)
+
+    def test_commits_with_the_flag_invalidate(self):
+        self.snapshot.get()
+        db.session.commit()
+        self.assertEqual(self.snapshot.get(), 1)
+
+        db.session.info['test_changed'] = True
+        db.session.commit()
+        self.assertEqual(self.snapshot.get(), 2)
+
+        # Flags are set by flushes, so there is always a transaction to roll back
+        db.session.execute(db.text('SELECT 1'))
+        db.session.info['test_changed'] = True
+        db.session.rollback()
+        db.session.commit()
+        self.assertEqual(self.snapshot.get(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
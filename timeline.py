@@ -0,0 +1,81 @@
+import typing
+from sqlalchemy import event, inspect
+from app import db
+from models import Recipe, TimelineCelebrity, TimelineEntry, UserFollow
+from pagination import PageRequest, encode_cursor
+import config
+
+
+# Recipes of a newly followed user copied to the follower's timeline
+BACKFILL_SIZE = 20
+
+
+def get_timeline_page(user_id: int, page: PageRequest) -> typing.Tuple[typing.List[int], str]:
+    # Newest recipe first; both sources are paged on recipe_id, so they share the cursor
+    rows, next_cursor = TimelineEntry.get_page_for_user_id(user_id, page)
+    recipe_ids = [row.recipe_id for row in rows]
+
+    followed_celebrities = TimelineCelebrity.get_followed_ids(user_id)
+    if not followed_celebrities:
+        return recipe_ids, next_cursor
+
+    rows, celebrity_cursor = Recipe.get_public_id_page_for_user_ids(followed_celebrities, page)
+    merged = sorted(set(recipe_ids).union(row.recipe_id for row in rows), reverse=True)
+    if len(merged) > page.limit or next_cursor or celebrity_cursor:
+        merged = merged[:page.limit]
+        return merged, encode_cursor(merged[-1:])
+    return merged, None
+
+
+def update_celebrities(connection, follows, unfollows) -> typing.Set[int]:
+    # Users cross TIMELINE_FANOUT_FOLLOWER_LIMIT in the transaction of the follow that
+    # moved them across, so the stored set never depends on a worker's memory. Only users
+    # who can cross it are counted
+    follow_ids = {instance.follow_id for instance in follows + unfollows}
+    celebrity_ids = TimelineCelebrity.get_ids_within(connection, follow_ids) if follow_ids else set()
+    for follow_id in {instance.follow_id for instance in follows} - celebrity_ids:
+        if UserFollow.count_followers(connection, follow_id) > config.TIMELINE_FANOUT_FOLLOWER_LIMIT:
+            TimelineCelebrity.add(connection, follow_id)
+            celebrity_ids.add(follow_id)
+    for follow_id in {instance.follow_id for instance in unfollows} & celebrity_ids:
+        if UserFollow.count_followers(connection, follow_id) <= config.TIMELINE_FANOUT_FOLLOWER_LIMIT:
+            # Their recipes are no longer merged when read, so followers get the newest
+            # ones, as if they had just followed them
+            celebrity_ids.discard(follow_id)
+            if TimelineCelebrity.remove(connection, follow_id):
+                TimelineEntry.backfill_followers(connection, follow_id, BACKFILL_SIZE)
+    return celebrity_ids
+
+
+# Fan out in the same transaction as the writes, so timelines never miss a recipe
+@event.listens_for(db.session, 'after_flush')
+def fan_out_recipes(session, flush_context):
+    connection = session.connection()
+    follows = [instance for instance in session.new if isinstance(instance, UserFollow)]
+    unfollows = [instance for instance in session.deleted if isinstance(instance, UserFollow)]
+    published = [instance for instance in session.new if isinstance(instance, Recipe) and instance.is_public]
+    removed_recipe_ids = []
+    for instance in session.dirty:
+        if isinstance(instance, Recipe) and inspect(instance).attrs.is_public.history.has_changes():
+            if instance.is_public:
+                published.append(instance)
+            else:
+                removed_recipe_ids.append(instance.recipe_id)
+
+    # Read on the flushing connection, so every worker agrees on who is not fanned out to
+    celebrity_ids = update_celebrities(connection, follows, unfollows)
+    author_ids = {instance.user_id for instance in published} - celebrity_ids
+    if author_ids:
+        celebrity_ids |= TimelineCelebrity.get_ids_within(connection, author_ids)
+
+    for instance in published:
+        if instance.user_id not in celebrity_ids:
+            TimelineEntry.fan_out(connection, instance.recipe_id, instance.user_id)
+    for instance in follows:
+        if instance.follow_id not in celebrity_ids:
+            TimelineEntry.backfill(connection, instance.user_id, instance.follow_id, BACKFILL_SIZE)
+    for instance in unfollows:
+        TimelineEntry.remove_author(connection, instance.user_id, instance.follow_id)
+
+    if removed_recipe_ids:
+        TimelineEntry.remove_recipes(connection, removed_recipe_ids)
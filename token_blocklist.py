@@ -0,0 +1,73 @@
+import threading
+import time
+import typing
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import db
+from models import RevokedToken
+import config
+
+
+# Revocations committed by other workers may carry a slightly older revoke_time
+# than the newest one already loaded, so every refresh re-reads this window
+REFRESH_OVERLAP = timedelta(minutes=2)
+
+
+class RevokedTokenCache:
+    def __init__(self, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        # jti -> expiry, so tokens that can no longer validate are dropped
+        self.revoked_jtis: typing.Dict[str, datetime] = {}
+        self.loaded_until: datetime = None
+        self.next_refresh = 0.0
+        self.lock = threading.Lock()
+
+    def is_revoked(self, jti: str) -> bool:
+        if time.monotonic() >= self.next_refresh:
+            self.refresh()
+        return jti in self.revoked_jtis
+
+    def revoke(self, jwt_data: dict):
+        jti = jwt_data['jti']
+        expires_at = datetime.fromtimestamp(jwt_data['exp']) if 'exp' in jwt_data else None
+        # Only known to this worker once the row is committed, so a rolled back
+        # revocation doesn't leave the token blocked here alone
+        db.session.info.setdefault('revoked_jtis', []).append((self, jti, expires_at))
+        revoked_token = RevokedToken(jti=jti, expires_at=expires_at)
+        revoked_token.add()
+
+    def refresh(self):
+        if not self.lock.acquire(blocking=False):
+            # Another thread is already refreshing, answer from what is loaded
+            return
+
+        try:
+            since = self.loaded_until - REFRESH_OVERLAP if self.loaded_until else None
+            for jti, revoke_time, expires_at in RevokedToken.get_revoked_since(since):
+                self.revoked_jtis[jti] = expires_at
+                if not self.loaded_until or revoke_time > self.loaded_until:
+                    self.loaded_until = revoke_time
+            self._drop_expired()
+            self.next_refresh = time.monotonic() + self.refresh_seconds
+        finally:
+            self.lock.release()
+
+    def _drop_expired(self):
+        now = datetime.now()
+        expired = [jti for jti, expires_at in self.revoked_jtis.items() if expires_at and expires_at < now]
+        for jti in expired:
+            del self.revoked_jtis[jti]
+
+
+revoked_token_cache = RevokedTokenCache(config.REVOKED_TOKEN_REFRESH_SECONDS)
+
+
+@event.listens_for(db.session, 'after_commit')
+def apply_revocations(session):
+    for cache, jti, expires_at in session.info.pop('revoked_jtis', []):
+        cache.revoked_jtis[jti] = expires_at
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_revocations(session):
+    session.info.pop('revoked_jtis', None)
@@ -0,0 +1,120 @@
+import re
+import threading
+import time
+import typing
+from bisect import bisect_left, insort
+from collections import Counter
+from sqlalchemy import bindparam, text
+from app import db
+import config
+
+
+# Same defaults as pg_trgm, so both databases return similar matches
+SIMILARITY_THRESHOLD = 0.3
+
+
+def get_trigrams(value: str) -> typing.Set[str]:
+    # Every word is padded like pg_trgm does, so word starts weigh more than word ends
+    trigrams = set()
+    for word in re.findall(r'[^\W_]+', value.lower()):
+        padded = f'  {word} '
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+class TrigramIndex:
+    def __init__(self, refresh_seconds: float) -> None:
+        self.refresh_seconds = refresh_seconds
+        self.names: typing.Dict[int, str] = {}
+        self.sorted_names: typing.List[typing.Tuple[str, int]] = []
+        self.postings: typing.Dict[str, typing.Set[int]] = {}
+        self.trigram_counts: typing.Dict[int, int] = {}
+        self.changed_ids: typing.Set[int] = set()
+        self.next_refresh = 0.0
+        self.lock = threading.Lock()
+
+    def find(self, query: str, limit: int) -> typing.List[int]:
+        query = query.strip().lower()
+        if not query:
+            return []
+        self.refresh()
+
+        # Names starting with the query come first, in alphabetical order
+        found = []
+        index = bisect_left(self.sorted_names, (query, -1))
+        while index < len(self.sorted_names) and len(found) < limit and self.sorted_names[index][0].startswith(query):
+            found.append(self.sorted_names[index][1])
+            index += 1
+
+        query_trigrams = get_trigrams(query)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self.postings.get(trigram, ()))
+
+        similar = []
+        for id, count in shared.items():
+            trigram_count, name = self.trigram_counts.get(id), self.names.get(id)
+            if trigram_count is None or name is None:
+                continue
+            similarity = count / (len(query_trigrams) + trigram_count - count)
+            if similarity >= SIMILARITY_THRESHOLD:
+                similar.append((-similarity, name, id))
+
+        prefixed = set(found)
+        found.extend(id for _, _, id in sorted(similar) if id not in prefixed)
+        return found[:limit]
+
+    def refresh(self):
+        if time.monotonic() < self.next_refresh and not self.changed_ids:
+            return
+        with self.lock:
+            if time.monotonic() >= self.next_refresh:
+                self.changed_ids.clear()
+                self._rebuild(db.session.execute(text('SELECT user_id, username FROM users')).all())
+                self.next_refresh = time.monotonic() + self.refresh_seconds
+            elif self.changed_ids:
+                changed_ids, self.changed_ids = self.changed_ids, set()
+                statement = text('SELECT user_id, username FROM users WHERE user_id IN :ids').bindparams(bindparam('ids', expanding=True))
+                rows = db.session.execute(statement, {'ids': list(changed_ids)}).all()
+                for id in changed_ids:
+                    self._remove(id)
+                for id, username in rows:
+                    self._add(id, username)
+
+    def mark_changed(self, ids: typing.Iterable[int]):
+        self.changed_ids.update(ids)
+
+    def invalidate(self):
+        self.next_refresh = 0.0
+
+    def _rebuild(self, rows):
+        # Built aside and swapped in, so concurrent lookups never see a half built index
+        names, postings, trigram_counts = {}, {}, {}
+        for id, username in rows:
+            trigrams = get_trigrams(username)
+            names[id] = username.lower()
+            trigram_counts[id] = len(trigrams)
+            for trigram in trigrams:
+                postings.setdefault(trigram, set()).add(id)
+        sorted_names = sorted((name, id) for id, name in names.items())
+        self.names, self.postings, self.trigram_counts, self.sorted_names = names, postings, trigram_counts, sorted_names
+
+    def _add(self, id: int, username: str):
+        trigrams = get_trigrams(username)
+        self.names[id] = username.lower()
+        self.trigram_counts[id] = len(trigrams)
+        for trigram in trigrams:
+            self.postings.setdefault(trigram, set()).add(id)
+        insort(self.sorted_names, (username.lower(), id))
+
+    def _remove(self, id: int):
+        name = self.names.pop(id, None)
+        if name is None:
+            return
+        self.trigram_counts.pop(id)
+        for trigram in get_trigrams(name):
+            self.postings[trigram].discard(id)
+        self.sorted_names.remove((name, id))
+
+
+username_index = TrigramIndex(config.USERNAME_INDEX_REFRESH_SECONDS)
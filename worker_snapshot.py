@@ -0,0 +1,48 @@
+import threading
+import time
+import typing
+from sqlalchemy import event
+from app import db
+
+
+class WorkerSnapshot:
+    # A value loaded from the database and shared by the requests of one worker. It is
+    # reloaded every refresh_seconds, and after this worker commits a transaction that
+    # set session.info[changed_flag]
+    def __init__(self, load: typing.Callable[[], typing.Any], refresh_seconds: float, changed_flag: str) -> None:
+        self.load = load
+        self.refresh_seconds = refresh_seconds
+        self.changed_flag = changed_flag
+        self.value = None
+        self.next_refresh = 0.0
+        self.lock = threading.Lock()
+        event.listen(db.session, 'after_commit', self.invalidate_if_changed)
+        event.listen(db.session, 'after_rollback', self.forget_changes)
+
+    def get(self):
+        if self.value is None or time.monotonic() >= self.next_refresh:
+            self.refresh()
+        return self.value
+
+    def refresh(self):
+        # Only the first value is waited for, later refreshes answer from the old one
+        if not self.lock.acquire(blocking=self.value is None):
+            return
+
+        try:
+            if self.value is not None and time.monotonic() < self.next_refresh:
+                return
+            self.value = self.load()
+            self.next_refresh = time.monotonic() + self.refresh_seconds
+        finally:
+            self.lock.release()
+
+    def invalidate(self):
+        self.next_refresh = 0.0
+
+    def invalidate_if_changed(self, session):
+        if session.info.pop(self.changed_flag, False):
+            self.invalidate()
+
+    def forget_changes(self, session):
+        session.info.pop(self.changed_flag, None)